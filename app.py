@@ -1,42 +1,88 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, Response
-from models import db, TeamMember, OneOnOne, Opportunity, OpportunityUpdate, SupportCase, SupportCaseComment, FollowUp, Note, SkillRating
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, Response, jsonify, abort, stream_with_context
+from models import (db, TeamMember, OneOnOne, Opportunity, OpportunityUpdate, OpportunityProduct, SupportCase,
+                    SupportCaseComment, FollowUp, Note, SkillRating, ImportJob, ReportDefinition, ReportJob, REGIONS,
+                    OPPORTUNITY_STAGES, CASE_STATUSES, PRIORITIES, FOLLOWUP_STATUSES, MOODS, SKILLS, PROFICIENCY_LEVELS,
+                    PRODUCTS, MEMBER_CATEGORIES, POV_STATUSES, REPORT_PERIODS)
+from kpis import get_dashboard_snapshot, invalidate_dashboard
+from pagination import SortOption, paginate
+from importer import OPPORTUNITY_IMPORT_COLUMNS, CSV_IMPORTS, import_opportunities_csv, import_records_csv
+from search import note_search, highlight_snippet
+from skills import (AT_LEAST, parse_skill_filters, get_skill_matrix, bump_skill_matrix_version,
+                    apply_skill_changes, apply_skill_ratings)
+from tags import tag_counts, tagged_note_ids
+from profiles import load_member_profile, meeting_page
+from report_data import REPORT_SECTIONS, SECTION_LABELS, selected_ids, load_report_data, load_definition_data
+from migrations import run_migrations
+from querystats import init_query_stats
+from metrics import MeteredQueuePool, init_metrics, render_metrics
+from jobs import JOB_FINAL_STATUSES, submit_import, prune_import_jobs, job_status, error_file_path
+from report_jobs import (ReportQueueFull, submit_report, expire_report_jobs, report_key, report_job_status,
+                         report_path)
 from datetime import datetime, date
+from functools import partial
 from dateutil.parser import parse as parse_date
 import os
 import csv
 import io
+import logging
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'se-team-manager-secret-key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///se_team.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///se_team.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Strict N+1 mode: flag any SELECT repeated more than this many times in one request (0 disables)
+app.config['SQL_REPEAT_LIMIT'] = int(os.environ.get('SQL_REPEAT_LIMIT', 0))
+app.config['SQL_REPEAT_ACTION'] = os.environ.get('SQL_REPEAT_ACTION', 'warn')
+# Time checkouts for the pool wait histogram on /metrics
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': MeteredQueuePool}
+# PDF reports render in this many worker processes, with at most REPORT_QUEUE_LIMIT jobs waiting
+app.config['REPORT_WORKERS'] = int(os.environ.get('REPORT_WORKERS', min(os.cpu_count() or 1, 4)))
+app.config['REPORT_QUEUE_LIMIT'] = int(os.environ.get('REPORT_QUEUE_LIMIT', 20))
 
 db.init_app(app)
-
-REGIONS = ['East', 'Central', 'West', 'Global']
-OPPORTUNITY_STAGES = ['1', '2', '3', '4', '5', '6']
-CASE_STATUSES = ['Open', 'In Progress', 'Pending', 'Resolved', 'Closed']
-PRIORITIES = ['High', 'Medium', 'Low']
-FOLLOWUP_STATUSES = ['Pending', 'In Progress', 'Completed', 'Deferred']
-MOODS = ['Excellent', 'Good', 'Neutral', 'Concerned', 'Needs Attention']
-SKILLS = ['Password Safe', 'EPM Win-Mac', 'EPM-L', 'Remote Support', 'PRA', 'AD Bridge', 'Insights', 'Entitle']
-PROFICIENCY_LEVELS = ["Haven't Started", 'Training', 'Demo Ready', 'POV Ready', 'Expert']
-PRODUCTS = ['EPM', 'EPM-L', 'PWS', 'RS', 'PRA', 'ADB', 'Insights', 'Entitle']
-MEMBER_CATEGORIES = ['Solution Engineers', 'SE Leaders', 'Sales Leaders', 'Sales Reps']
-PRODUCT_ALIASES = {
-    'ppm': 'PWS',
-    'password safe': 'PWS',
-    'workforce passwords': 'PWS',
-    'password safe with pra': 'PWS,PRA',
-    'isi': 'Insights',
-    'identity security insights': 'Insights',
-    'upem': 'EPM-L',
-    'pm for ul servers': 'EPM-L',
-    'pm desktops': 'EPM',
-    'pm for win servers': 'EPM',
-    'remote support': 'RS',
+init_query_stats(app)
+init_metrics(app)
+
+
+def priority_order(column):
+    """Sort expression that ranks priorities High, Medium, Low."""
+    return db.case({p: i for i, p in enumerate(PRIORITIES)}, value=column, else_=len(PRIORITIES))
+
+
+# Server-side sort columns for the paginated list pages
+OPPORTUNITY_SORTS = {
+    'updated': SortOption(Opportunity.updated_at, 'desc'),
+    'name': SortOption(db.func.lower(Opportunity.name)),
+    'account': SortOption(db.func.lower(Opportunity.account)),
+    'stage': SortOption(Opportunity.stage),
+    'confidence': SortOption(db.func.coalesce(Opportunity.confidence, 0), 'desc'),
+    'value': SortOption(db.func.coalesce(Opportunity.value, 0), 'desc'),
+    'close_date': SortOption(db.func.coalesce(Opportunity.close_date, date.max)),
+    # A correlated lookup rather than a join, which would clash with the joinedload of team_member
+    'primary_se': SortOption(db.select(db.func.lower(TeamMember.name))
+                             .where(TeamMember.id == Opportunity.team_member_id).scalar_subquery()),
+    'sales_rep': SortOption(db.func.lower(db.func.coalesce(Opportunity.sales_rep, ''))),
+    'products': SortOption(db.func.coalesce(Opportunity.products, '')),
+    'pov_status': SortOption(db.func.coalesce(Opportunity.pov_status, 'None')),
+}
+CASE_SORTS = {
+    'created': SortOption(SupportCase.created_at, 'desc'),
+    'title': SortOption(db.func.lower(SupportCase.title)),
+    'customer': SortOption(db.func.lower(db.func.coalesce(SupportCase.customer, ''))),
+    'status': SortOption(SupportCase.status),
+    'priority': SortOption(priority_order(SupportCase.priority)),
+    'resolved': SortOption(db.func.coalesce(SupportCase.resolved_at, datetime.min), 'desc'),
 }
-POV_STATUSES = ['None', 'Active', 'Completed', 'Tech Win']
+FOLLOWUP_SORTS = {
+    'due_date': SortOption(FollowUp.due_date),
+    'title': SortOption(db.func.lower(FollowUp.title)),
+    'status': SortOption(FollowUp.status),
+    'priority': SortOption(priority_order(FollowUp.priority)),
+    'created': SortOption(FollowUp.created_at, 'desc'),
+}
+
+
+app.add_template_filter(highlight_snippet)
 
 
 @app.context_processor
@@ -44,6 +90,7 @@ def inject_globals():
     return {
         'regions': REGIONS,
         'opportunity_stages': OPPORTUNITY_STAGES,
+        'report_periods': REPORT_PERIODS,
         'case_statuses': CASE_STATUSES,
         'priorities': PRIORITIES,
         'followup_statuses': FOLLOWUP_STATUSES,
@@ -53,35 +100,30 @@ def inject_globals():
         'products_list': PRODUCTS,
         'pov_statuses': POV_STATUSES,
         'member_categories': MEMBER_CATEGORIES,
+        'csv_imports': CSV_IMPORTS,
     }
 
 
+# Monitoring
+@app.route('/metrics')
+def metrics():
+    return render_metrics()
+
+
 # Dashboard
 @app.route('/')
 def dashboard():
-    team_count = TeamMember.query.count()
-    live_povs = Opportunity.query.filter(Opportunity.pov_status == 'Active').count()
-    open_opps = Opportunity.query.filter(Opportunity.stage != '6').count()
-    open_cases = SupportCase.query.filter(~SupportCase.status.in_(['Resolved', 'Closed'])).count()
-    pending_followups = FollowUp.query.filter(FollowUp.status.in_(['Pending', 'In Progress'])).count()
-    overdue_followups = FollowUp.query.filter(
-        FollowUp.status.in_(['Pending', 'In Progress']),
-        FollowUp.due_date < date.today()
-    ).all()
-    recent_one_on_ones = OneOnOne.query.order_by(OneOnOne.date.desc()).limit(5).all()
-    upcoming_followups = FollowUp.query.filter(
-        FollowUp.status.in_(['Pending', 'In Progress'])
-    ).order_by(FollowUp.due_date).limit(5).all()
-
+    snapshot = get_dashboard_snapshot()
     return render_template('dashboard.html',
-                           team_count=team_count,
-                           live_povs=live_povs,
-                           open_opps=open_opps,
-                           open_cases=open_cases,
-                           pending_followups=pending_followups,
-                           overdue_followups=overdue_followups,
-                           recent_one_on_ones=recent_one_on_ones,
-                           upcoming_followups=upcoming_followups,
+                           team_count=snapshot['team_count'],
+                           live_povs=snapshot['live_povs'],
+                           open_opps=snapshot['open_opps'],
+                           open_cases=snapshot['open_cases'],
+                           pending_followups=snapshot['pending_followups'],
+                           overdue_followups=snapshot['overdue_followups'],
+                           recent_one_on_ones=snapshot['recent_one_on_ones'],
+                           upcoming_followups=snapshot['upcoming_followups'],
+                           product_pipeline=snapshot['product_pipeline'],
                            today=date.today())
 
 
@@ -112,7 +154,9 @@ def add_team_member():
         show_in_one_on_ones='Y' if request.form.get('show_in_one_on_ones') else 'N'
     )
     db.session.add(member)
+    bump_skill_matrix_version()
     db.session.commit()
+    invalidate_dashboard()
     flash('Team member added successfully', 'success')
     return redirect(url_for('team_members'))
 
@@ -135,7 +179,9 @@ def edit_team_member(id):
     member.role = request.form.get('role', 'Senior Solutions Engineer')
     member.category = request.form.get('category', 'Solution Engineers')
     member.show_in_one_on_ones = 'Y' if request.form.get('show_in_one_on_ones') else 'N'
+    bump_skill_matrix_version()
     db.session.commit()
+    invalidate_dashboard()
     flash('Team member updated successfully', 'success')
     return redirect(url_for('team_members'))
 
@@ -144,7 +190,9 @@ def edit_team_member(id):
 def delete_team_member(id):
     member = TeamMember.query.get_or_404(id)
     db.session.delete(member)
+    bump_skill_matrix_version()
     db.session.commit()
+    invalidate_dashboard()
     flash('Team member deleted successfully', 'success')
     return redirect(url_for('team_members'))
 
@@ -157,57 +205,49 @@ def one_on_ones():
         db.or_(TeamMember.show_in_one_on_ones == 'Y', TeamMember.show_in_one_on_ones.is_(None))
     ).order_by(TeamMember.name).all()
 
-    selected_member = None
-    meetings = []
-    active_opps = []
-    open_cases = []
-    live_povs = []
-    skill_ratings = {}
-    open_followups = []
-    member_notes = []
-
-    if member_id:
-        selected_member = TeamMember.query.get(member_id)
-        if selected_member:
-            meetings = (OneOnOne.query
-                        .filter(OneOnOne.team_member_id == member_id)
-                        .order_by(OneOnOne.date.desc()).all())
-            active_opps = (Opportunity.query
-                           .filter(Opportunity.team_member_id == member_id,
-                                   Opportunity.stage != '6')
-                           .order_by(Opportunity.updated_at.desc()).all())
-            open_cases = (SupportCase.query
-                          .filter(SupportCase.team_member_id == member_id,
-                                  ~SupportCase.status.in_(['Resolved', 'Closed']))
-                          .order_by(SupportCase.created_at.desc()).all())
-            live_povs = (Opportunity.query
-                         .filter(Opportunity.team_member_id == member_id,
-                                 Opportunity.pov_status == 'Active')
-                         .order_by(Opportunity.updated_at.desc()).all())
-            ratings = SkillRating.query.filter_by(team_member_id=member_id).all()
-            skill_ratings = {r.skill: r.proficiency for r in ratings}
-            open_followups = (FollowUp.query
-                              .filter(FollowUp.team_member_id == member_id,
-                                      ~FollowUp.status.in_(['Completed']))
-                              .order_by(FollowUp.due_date).all())
-            member_notes = (Note.query
-                            .filter(Note.team_member_id == member_id)
-                            .order_by(Note.created_at.desc()).all())
+    profile = load_member_profile(member_id) if member_id else None
+    skill_ratings = get_skill_matrix().ratings_for(member_id) if profile else {}
 
     return render_template('one_on_ones.html',
                            team_members=team_members_list,
-                           selected_member=selected_member,
+                           selected_member=profile.member if profile else None,
                            member_id=member_id,
-                           meetings=meetings,
-                           active_opps=active_opps,
-                           open_cases=open_cases,
-                           live_povs=live_povs,
+                           meetings=profile.meetings if profile else [],
+                           meetings_next=profile.meetings_next if profile else None,
+                           meeting_count=profile.meeting_count if profile else 0,
+                           active_opps=profile.active_opps if profile else [],
+                           open_cases=profile.open_cases if profile else [],
+                           live_povs=profile.live_povs if profile else [],
                            skill_ratings=skill_ratings,
-                           open_followups=open_followups,
-                           member_notes=member_notes,
+                           open_followups=profile.open_followups if profile else [],
+                           member_notes=profile.notes if profile else [],
                            today=date.today())
 
 
+@app.route('/one-on-ones/<int:member_id>/meetings')
+def one_on_one_meetings(member_id):
+    """Fragment with the next page of a member's meeting history."""
+    try:
+        meetings, next_cursor = meeting_page(member_id, request.args.get('after'))
+    except ValueError:
+        abort(400)
+    return render_template('one_on_one_meetings.html', meetings=meetings, meetings_next=next_cursor,
+                           member_id=member_id)
+
+
+@app.route('/one-on-ones/meeting/<int:id>')
+def one_on_one_detail(id):
+    """A meeting's notes and action items, loaded when it is expanded or edited."""
+    meeting = OneOnOne.query.get_or_404(id)
+    return jsonify({
+        'id': meeting.id,
+        'date': meeting.date.isoformat(),
+        'mood': meeting.mood or '',
+        'notes': meeting.notes or '',
+        'action_items': meeting.action_items or '',
+    })
+
+
 @app.route('/one-on-ones/add', methods=['POST'])
 def add_one_on_one():
     member_id = request.form['team_member_id']
@@ -220,6 +260,7 @@ def add_one_on_one():
     )
     db.session.add(meeting)
     db.session.commit()
+    invalidate_dashboard()
     flash('1-1 meeting logged successfully', 'success')
     return redirect(url_for('one_on_ones', member_id=member_id))
 
@@ -233,6 +274,7 @@ def edit_one_on_one(id):
     meeting.action_items = request.form.get('action_items', '')
     meeting.mood = request.form.get('mood', '')
     db.session.commit()
+    invalidate_dashboard()
     flash('1-1 meeting updated successfully', 'success')
     return redirect(url_for('one_on_ones', member_id=meeting.team_member_id))
 
@@ -243,6 +285,7 @@ def delete_one_on_one(id):
     member_id = meeting.team_member_id
     db.session.delete(meeting)
     db.session.commit()
+    invalidate_dashboard()
     flash('1-1 meeting deleted successfully', 'success')
     return redirect(url_for('one_on_ones', member_id=member_id))
 
@@ -255,25 +298,47 @@ def opportunities():
     product = request.args.get('product')
     pov_status = request.args.get('pov_status')
 
-    query = Opportunity.query
+    # Correlated so only the rows on the page are counted, via the opportunity_id index
+    update_count = (db.select(db.func.count(OpportunityUpdate.id))
+                    .where(OpportunityUpdate.opportunity_id == Opportunity.id)
+                    .scalar_subquery())
+    query = (Opportunity.query
+             .options(db.joinedload(Opportunity.team_member),
+                      db.with_expression(Opportunity.update_count, update_count)))
     if stage:
         query = query.filter(Opportunity.stage == stage)
     if member_id:
         query = query.filter(Opportunity.team_member_id == member_id)
     if product:
-        query = query.filter(Opportunity.products.contains(product))
+        query = query.filter(Opportunity.id.in_(
+            db.select(OpportunityProduct.opportunity_id).where(OpportunityProduct.product == product)
+        ))
     if pov_status:
         query = query.filter(Opportunity.pov_status == pov_status)
 
-    opps = query.order_by(Opportunity.updated_at.desc()).all()
+    page = paginate(query, Opportunity.id, OPPORTUNITY_SORTS, 'updated', request.args)
     team_members = TeamMember.query.filter(
         db.or_(TeamMember.category == 'Solution Engineers', TeamMember.category.is_(None))
     ).order_by(TeamMember.name).all()
-    return render_template('opportunities.html', opportunities=opps, team_members=team_members,
+    active_imports = (ImportJob.query
+                      .filter(ImportJob.kind == 'opportunities', ~ImportJob.status.in_(JOB_FINAL_STATUSES))
+                      .order_by(ImportJob.created_at).all())
+    return render_template('opportunities.html', opportunities=page.items, page=page, team_members=team_members,
+                           active_imports=active_imports,
                            selected_stage=stage, selected_member=member_id, selected_product=product,
                            selected_pov_status=pov_status)
 
 
+@app.route('/opportunities/<int:id>/history')
+def opportunity_history(id):
+    opp = Opportunity.query.get_or_404(id)
+    updates = (OpportunityUpdate.query
+               .filter(OpportunityUpdate.opportunity_id == opp.id)
+               .order_by(OpportunityUpdate.created_at.desc())
+               .all())
+    return render_template('opportunity_history.html', updates=updates)
+
+
 @app.route('/opportunities/add', methods=['POST'])
 def add_opportunity():
     opp = Opportunity(
@@ -286,7 +351,6 @@ def add_opportunity():
         salesforce_link=request.form.get('salesforce_link', ''),
         confidence=int(request.form['confidence']) if request.form.get('confidence') else None,
         sales_rep=request.form.get('sales_rep', ''),
-        products=','.join(request.form.getlist('products')),
         rfp=request.form.get('rfp', 'N'),
         demo=request.form.get('demo', 'N'),
         pov_status=request.form.get('pov_status', 'None'),
@@ -295,6 +359,7 @@ def add_opportunity():
         latest_update_date=parse_date(request.form['latest_update_date']).date() if request.form.get('latest_update_date') else None,
         latest_update_notes=request.form.get('latest_update_notes', ''),
     )
+    opp.set_products(request.form.getlist('products'))
     db.session.add(opp)
     db.session.commit()
 
@@ -305,6 +370,7 @@ def add_opportunity():
     )
     db.session.add(update)
     db.session.commit()
+    invalidate_dashboard()
 
     flash('Opportunity added successfully', 'success')
     next_url = request.form.get('next')
@@ -328,7 +394,7 @@ def edit_opportunity(id):
     opp.salesforce_link = request.form.get('salesforce_link', '')
     opp.confidence = int(request.form['confidence']) if request.form.get('confidence') else None
     opp.sales_rep = request.form.get('sales_rep', '')
-    opp.products = ','.join(request.form.getlist('products'))
+    opp.set_products(request.form.getlist('products'))
     opp.rfp = request.form.get('rfp', 'N')
     opp.demo = request.form.get('demo', 'N')
     opp.pov_status = request.form.get('pov_status', 'None')
@@ -347,6 +413,7 @@ def edit_opportunity(id):
         db.session.add(update)
 
     db.session.commit()
+    invalidate_dashboard()
     flash('Opportunity updated successfully', 'success')
     next_url = request.form.get('next')
     if next_url:
@@ -372,18 +439,16 @@ def delete_opportunity(id):
     opp = Opportunity.query.get_or_404(id)
     db.session.delete(opp)
     db.session.commit()
+    invalidate_dashboard()
     flash('Opportunity deleted successfully', 'success')
     return redirect(url_for('opportunities'))
 
 
 @app.route('/opportunities/import-template')
 def import_template():
-    headers = ['name', 'account', 'se_name', 'stage', 'value', 'close_date',
-               'salesforce_link', 'confidence', 'sales_rep', 'products',
-               'rfp', 'demo', 'pov_status']
     output = io.StringIO()
     writer = csv.writer(output)
-    writer.writerow(headers)
+    writer.writerow(OPPORTUNITY_IMPORT_COLUMNS)
     csv_content = output.getvalue()
     return Response(
         csv_content,
@@ -399,124 +464,64 @@ def import_opportunities():
         flash('Please upload a valid CSV file.', 'danger')
         return redirect(url_for('opportunities'))
 
-    # Build case-insensitive name lookup for team members
-    members = TeamMember.query.all()
-    member_lookup = {m.name.strip().lower(): m.id for m in members}
+    import_func = import_opportunities_csv
+    if request.form.get('upsert'):
+        import_func = partial(import_opportunities_csv, upsert=True)
+    job = submit_import(app, 'opportunities', file, import_func)
+    return redirect(url_for('import_job', job_id=job.id))
 
-    try:
-        stream = io.StringIO(file.stream.read().decode('utf-8-sig'))
-        reader = csv.DictReader(stream)
-    except Exception as e:
-        flash(f'Error reading CSV file: {e}', 'danger')
-        return redirect(url_for('opportunities'))
 
-    success_count = 0
-    errors = []
+@app.route('/import/<kind>/template')
+def import_records_template(kind):
+    spec = CSV_IMPORTS.get(kind)
+    if not spec:
+        abort(404)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(spec.column_names)
+    return Response(
+        output.getvalue(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={kind}_template.csv'}
+    )
 
-    for i, row in enumerate(reader, start=2):  # row 2 = first data row after header
-        name = (row.get('name') or '').strip()
-        account = (row.get('account') or '').strip()
-        se_name = (row.get('se_name') or '').strip()
-
-        # Validate required fields
-        missing = []
-        if not name:
-            missing.append('name')
-        if not account:
-            missing.append('account')
-        if not se_name:
-            missing.append('se_name')
-        if missing:
-            errors.append(f"Row {i}: missing required field(s): {', '.join(missing)}")
-            continue
 
-        # Resolve SE name
-        team_member_id = member_lookup.get(se_name.lower())
-        if not team_member_id:
-            errors.append(f"Row {i}: SE name '{se_name}' not found")
-            continue
+@app.route('/import/<kind>', methods=['POST'])
+def import_records(kind):
+    if kind not in CSV_IMPORTS:
+        abort(404)
+    file = request.files.get('csv_file')
+    if not file or not file.filename.endswith('.csv'):
+        flash('Please upload a valid CSV file.', 'danger')
+        return redirect(url_for(kind))
 
-        # Parse optional fields with defaults
-        stage = (row.get('stage') or '1').strip()
-        if stage not in OPPORTUNITY_STAGES:
-            stage = '1'
+    # Historical backfills are all-or-nothing, so run the whole file in one transaction
+    job = submit_import(app, kind, file, partial(import_records_csv, kind), atomic=True)
+    return redirect(url_for('import_job', job_id=job.id))
 
-        try:
-            raw_value = (row.get('value') or '0').strip()
-            raw_value = raw_value.replace('$', '').replace(',', '')
-            value = float(raw_value or 0)
-        except ValueError:
-            value = 0
-
-        close_date = None
-        if row.get('close_date', '').strip():
-            try:
-                close_date = parse_date(row['close_date'].strip()).date()
-            except (ValueError, TypeError):
-                errors.append(f"Row {i}: invalid close_date '{row['close_date']}'")
-                continue
-
-        confidence = None
-        if row.get('confidence', '').strip():
-            try:
-                confidence = int(row['confidence'].strip())
-                if confidence < 1 or confidence > 10:
-                    confidence = None
-            except ValueError:
-                pass
-
-        rfp = (row.get('rfp') or 'N').strip().upper()
-        if rfp not in ('Y', 'N'):
-            rfp = 'N'
-
-        demo = (row.get('demo') or 'N').strip().upper()
-        if demo not in ('Y', 'N'):
-            demo = 'N'
-
-        pov_status = (row.get('pov_status') or 'None').strip()
-        if pov_status not in POV_STATUSES:
-            pov_status = 'None'
-
-        opp = Opportunity(
-            name=name,
-            account=account,
-            team_member_id=team_member_id,
-            stage=stage,
-            value=value,
-            close_date=close_date,
-            salesforce_link=(row.get('salesforce_link') or '').strip(),
-            confidence=confidence,
-            sales_rep=(row.get('sales_rep') or '').strip(),
-            products=','.join(dict.fromkeys(
-                prod
-                for p in (row.get('products') or '').split(',') if p.strip()
-                for prod in PRODUCT_ALIASES.get(p.strip().lower(), p.strip()).split(',')
-            )),
-            rfp=rfp,
-            demo=demo,
-            pov_status=pov_status,
-        )
-        db.session.add(opp)
-        db.session.flush()  # get opp.id
 
-        update = OpportunityUpdate(
-            opportunity_id=opp.id,
-            stage_to=opp.stage,
-            comment='Imported from CSV'
-        )
-        db.session.add(update)
-        success_count += 1
+# Import Jobs
+@app.route('/imports/<job_id>')
+def import_job(job_id):
+    prune_import_jobs(app)
+    job = ImportJob.query.get_or_404(job_id)
+    return render_template('import_job.html', job=job, status=job_status(job))
 
-    db.session.commit()
 
-    if success_count:
-        flash(f'Successfully imported {success_count} opportunity(ies).', 'success')
-    if errors:
-        flash(f'Import errors ({len(errors)}): ' + '; '.join(errors[:10]), 'danger')
-    if not success_count and not errors:
-        flash('CSV file was empty or had no data rows.', 'warning')
+@app.route('/imports/<job_id>/status')
+def import_job_status(job_id):
+    prune_import_jobs(app)
+    job = ImportJob.query.get_or_404(job_id)
+    return jsonify(job_status(job))
 
-    return redirect(url_for('opportunities'))
+
+@app.route('/imports/<job_id>/errors')
+def import_job_errors(job_id):
+    job = ImportJob.query.get_or_404(job_id)
+    path = error_file_path(app, job.id)
+    if not os.path.exists(path):
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=f'{job.kind}_import_errors.csv')
 
 
 # Support Cases
@@ -526,7 +531,8 @@ def support_cases():
     priority = request.args.get('priority')
     member_id = request.args.get('member_id', type=int)
 
-    query = SupportCase.query
+    # Comments are shown for every case on the page, so load them in one query
+    query = SupportCase.query.options(db.selectinload(SupportCase.comments))
     if status:
         query = query.filter(SupportCase.status == status)
     if priority:
@@ -534,9 +540,9 @@ def support_cases():
     if member_id:
         query = query.filter(SupportCase.team_member_id == member_id)
 
-    cases = query.order_by(SupportCase.created_at.desc()).all()
+    page = paginate(query, SupportCase.id, CASE_SORTS, 'created', request.args)
     team_members = TeamMember.query.order_by(TeamMember.name).all()
-    return render_template('support_cases.html', cases=cases, team_members=team_members,
+    return render_template('support_cases.html', cases=page.items, page=page, team_members=team_members,
                            selected_status=status, selected_priority=priority, selected_member=member_id)
 
 
@@ -557,6 +563,7 @@ def add_support_case():
     )
     db.session.add(case)
     db.session.commit()
+    invalidate_dashboard()
     flash('Support case created successfully', 'success')
     next_url = request.form.get('next')
     if next_url:
@@ -587,6 +594,7 @@ def edit_support_case(id):
         case.resolved_at = None
 
     db.session.commit()
+    invalidate_dashboard()
     flash('Support case updated successfully', 'success')
     next_url = request.form.get('next')
     if next_url:
@@ -612,6 +620,7 @@ def delete_support_case(id):
     case = SupportCase.query.get_or_404(id)
     db.session.delete(case)
     db.session.commit()
+    invalidate_dashboard()
     flash('Support case deleted successfully', 'success')
     return redirect(url_for('support_cases'))
 
@@ -631,9 +640,9 @@ def follow_ups():
     if member_id:
         query = query.filter(FollowUp.team_member_id == member_id)
 
-    items = query.order_by(FollowUp.due_date).all()
+    page = paginate(query, FollowUp.id, FOLLOWUP_SORTS, 'due_date', request.args)
     team_members = TeamMember.query.order_by(TeamMember.name).all()
-    return render_template('follow_ups.html', follow_ups=items, team_members=team_members,
+    return render_template('follow_ups.html', follow_ups=page.items, page=page, team_members=team_members,
                            selected_status=status, selected_priority=priority, selected_member=member_id,
                            today=date.today())
 
@@ -652,6 +661,7 @@ def add_follow_up():
     )
     db.session.add(follow_up)
     db.session.commit()
+    invalidate_dashboard()
     flash('Follow-up created successfully', 'success')
     next_url = request.form.get('next')
     if next_url:
@@ -671,6 +681,7 @@ def edit_follow_up(id):
     follow_up.related_id = int(request.form['related_id']) if request.form.get('related_id') else None
     follow_up.team_member_id = int(request.form['team_member_id']) if request.form.get('team_member_id') else None
     db.session.commit()
+    invalidate_dashboard()
     flash('Follow-up updated successfully', 'success')
     next_url = request.form.get('next')
     if next_url:
@@ -683,6 +694,7 @@ def complete_follow_up(id):
     follow_up = FollowUp.query.get_or_404(id)
     follow_up.status = 'Completed'
     db.session.commit()
+    invalidate_dashboard()
     flash('Follow-up marked as completed', 'success')
     next_url = request.form.get('next')
     if next_url:
@@ -695,6 +707,7 @@ def delete_follow_up(id):
     follow_up = FollowUp.query.get_or_404(id)
     db.session.delete(follow_up)
     db.session.commit()
+    invalidate_dashboard()
     flash('Follow-up deleted successfully', 'success')
     next_url = request.form.get('next')
     if next_url:
@@ -709,29 +722,29 @@ def notes():
     member_id = request.args.get('member_id', type=int)
     tag = request.args.get('tag', '')
 
-    query = Note.query
-    if search:
-        query = query.filter(
-            db.or_(
-                Note.title.ilike(f'%{search}%'),
-                Note.content.ilike(f'%{search}%')
-            )
-        )
+    criteria = []
     if member_id:
-        query = query.filter(Note.team_member_id == member_id)
+        criteria.append(Note.team_member_id == member_id)
     if tag:
-        query = query.filter(Note.tags.ilike(f'%{tag}%'))
+        criteria.append(Note.id.in_(tagged_note_ids(tag)))
+
+    query = Note.query
+    matches = note_search(search, *criteria) if search else None
+    if matches is not None:
+        query = (query.join(matches, matches.c.note_id == Note.id)
+                 .options(db.with_expression(Note.search_snippet, matches.c.snippet))
+                 .order_by(matches.c.score))
+    elif search:
+        # Nothing searchable in the input (e.g. only punctuation)
+        query = query.filter(db.false())
+    else:
+        query = query.filter(*criteria)
 
     all_notes = query.order_by(Note.created_at.desc()).all()
     team_members = TeamMember.query.order_by(TeamMember.name).all()
 
-    all_tags = set()
-    for note in Note.query.all():
-        if note.tags:
-            all_tags.update([t.strip() for t in note.tags.split(',') if t.strip()])
-
     return render_template('notes.html', notes=all_notes, team_members=team_members,
-                           search=search, selected_member=member_id, selected_tag=tag, all_tags=sorted(all_tags))
+                           search=search, selected_member=member_id, selected_tag=tag, all_tags=tag_counts())
 
 
 @app.route('/notes/add', methods=['POST'])
@@ -774,54 +787,37 @@ def delete_note(id):
 def skill_matrix():
     region = request.args.get('region')
 
-    # Per-skill proficiency filters
-    skill_filters = {}
-    for s in SKILLS:
-        val = request.args.get('skill_' + s)
-        if val:
-            skill_filters[s] = val
+    # Raw filter values are echoed back into the form and update redirects
+    skill_filters = {s: request.args['skill_' + s] for s in SKILLS if request.args.get('skill_' + s)}
 
-    query = TeamMember.query.filter(
-        db.or_(TeamMember.category == 'Solution Engineers', TeamMember.category.is_(None))
-    )
-    if region:
-        query = query.filter(TeamMember.region == region)
-
-    if skill_filters:
-        all_ratings = SkillRating.query.all()
-        ratings_map = {}
-        for r in all_ratings:
-            ratings_map.setdefault(r.team_member_id, {})[r.skill] = r.proficiency
-
-        matching_ids = set()
-        all_member_ids = {m.id for m in TeamMember.query.all()}
-        for mid in all_member_ids:
-            member_ratings = ratings_map.get(mid, {})
-            match = True
-            for s, level in skill_filters.items():
-                if member_ratings.get(s, "Haven't Started") != level:
-                    match = False
-                    break
-            if match:
-                matching_ids.add(mid)
-
-        if matching_ids:
-            query = query.filter(TeamMember.id.in_(matching_ids))
-        else:
-            query = query.filter(db.false())
+    matrix = get_skill_matrix()
+    members = matrix.filter(parse_skill_filters(request.args), region=region)
+    ratings = {(member.id, skill): matrix.level(member.id, skill) for member in members for skill in SKILLS}
 
-    members = query.order_by(TeamMember.name).all()
-    all_ratings = SkillRating.query.all()
-    ratings = {(r.team_member_id, r.skill): r.proficiency for r in all_ratings}
+    coverage_level = request.args.get('coverage_level')
+    if coverage_level not in PROFICIENCY_LEVELS[1:]:
+        coverage_level = 'POV Ready'
+    coverage = matrix.coverage(coverage_level, REGIONS)
     return render_template('skill_matrix.html', members=members, ratings=ratings,
-                           selected_region=region, skill_filters=skill_filters)
+                           selected_region=region, skill_filters=skill_filters, at_least=AT_LEAST,
+                           coverage=coverage, coverage_level=coverage_level)
 
 
 @app.route('/skill-matrix/update', methods=['POST'])
 def update_skill_rating():
-    team_member_id = int(request.form['team_member_id'])
-    skill = request.form['skill']
-    proficiency = request.form['proficiency']
+    team_member_id = request.form.get('team_member_id', type=int)
+    skill = request.form.get('skill')
+    proficiency = request.form.get('proficiency')
+    # Validate before writing; SkillMatrix.patch can't place an unknown skill or level
+    if team_member_id is None or db.session.get(TeamMember, team_member_id) is None:
+        flash('Unknown team member.', 'danger')
+        return redirect(url_for('skill_matrix'))
+    if skill not in SKILLS:
+        flash(f"Unknown skill '{skill}'.", 'danger')
+        return redirect(url_for('skill_matrix'))
+    if proficiency not in PROFICIENCY_LEVELS:
+        flash(f"Unknown proficiency '{proficiency}'.", 'danger')
+        return redirect(url_for('skill_matrix'))
 
     rating = SkillRating.query.filter_by(team_member_id=team_member_id, skill=skill).first()
     if rating:
@@ -829,7 +825,9 @@ def update_skill_rating():
     else:
         rating = SkillRating(team_member_id=team_member_id, skill=skill, proficiency=proficiency)
         db.session.add(rating)
+    bump_skill_matrix_version()
     db.session.commit()
+    apply_skill_changes([(team_member_id, skill, proficiency)])
 
     next_url = request.form.get('next')
     if next_url:
@@ -844,6 +842,51 @@ def update_skill_rating():
     return redirect(url_for('skill_matrix', **redirect_args))
 
 
+@app.route('/skill-matrix/batch-update', methods=['POST'])
+def batch_update_skill_ratings():
+    """Apply many cell changes as one transaction and return the cells that changed.
+
+    Expects JSON ``{"changes": [{"team_member_id", "skill", "proficiency"}, ...]}``.
+    The whole batch is rejected if any entry is invalid.
+    """
+    payload = request.get_json(silent=True) or {}
+    entries = payload.get('changes')
+    if not isinstance(entries, list):
+        return jsonify({'errors': ['Expected a JSON object with a "changes" list.']}), 400
+
+    changes = []
+    errors = []
+    for i, entry in enumerate(entries):
+        try:
+            member_id = int(entry['team_member_id'])
+            skill = entry['skill']
+            proficiency = entry['proficiency']
+        except (KeyError, TypeError, ValueError):
+            errors.append(f'Change {i}: team_member_id, skill and proficiency are required.')
+            continue
+        if skill not in SKILLS:
+            errors.append(f"Change {i}: unknown skill '{skill}'.")
+        elif proficiency not in PROFICIENCY_LEVELS:
+            errors.append(f"Change {i}: unknown proficiency '{proficiency}'.")
+        else:
+            changes.append((member_id, skill, proficiency))
+    member_ids = {member_id for member_id, _, _ in changes}
+    known_ids = {row[0] for row in db.session.query(TeamMember.id).filter(TeamMember.id.in_(member_ids))}
+    errors.extend(f'Unknown team member {member_id}.' for member_id in sorted(member_ids - known_ids))
+    if errors:
+        return jsonify({'errors': errors}), 400
+
+    changed = apply_skill_ratings(changes)
+    db.session.commit()
+    if changed:
+        apply_skill_changes(changed)
+    return jsonify({
+        'changed': [{'team_member_id': member_id, 'skill': skill, 'proficiency': proficiency}
+                    for member_id, skill, proficiency in changed],
+        'unchanged': len(entries) - len(changed),
+    })
+
+
 # Reports
 @app.route('/reports')
 def reports():
@@ -858,8 +901,11 @@ def reports():
     live_povs = Opportunity.query.filter(Opportunity.pov_status == 'Active').order_by(Opportunity.updated_at.desc()).all()
 
     selected_member_id = request.args.get('member_id', type=int)
+    definitions = ReportDefinition.query.order_by(ReportDefinition.name).all()
 
     return render_template('reports.html',
+                           definitions=definitions,
+                           report_sections=SECTION_LABELS,
                            team_members=team_members,
                            one_on_ones=one_on_ones,
                            opportunities=opps,
@@ -873,40 +919,14 @@ def reports():
 
 @app.route('/reports/preview', methods=['POST'])
 def preview_report():
-    start_date = request.form.get('start_date')
-    end_date = request.form.get('end_date')
-
-    selected = {
-        'team_members': request.form.getlist('team_members'),
-        'one_on_ones': request.form.getlist('one_on_ones'),
-        'opportunities': request.form.getlist('opportunities'),
-        'support_cases': request.form.getlist('support_cases'),
-        'follow_ups': request.form.getlist('follow_ups'),
-        'notes': request.form.getlist('notes'),
-        'skill_matrix': request.form.getlist('skill_matrix'),
-        'live_povs': request.form.getlist('live_povs')
-    }
-
-    data = {
-        'team_members': TeamMember.query.filter(TeamMember.id.in_(selected['team_members'])).all() if selected['team_members'] else [],
-        'one_on_ones': OneOnOne.query.filter(OneOnOne.id.in_(selected['one_on_ones'])).all() if selected['one_on_ones'] else [],
-        'opportunities': Opportunity.query.filter(Opportunity.id.in_(selected['opportunities'])).all() if selected['opportunities'] else [],
-        'support_cases': SupportCase.query.filter(SupportCase.id.in_(selected['support_cases'])).all() if selected['support_cases'] else [],
-        'follow_ups': FollowUp.query.filter(FollowUp.id.in_(selected['follow_ups'])).all() if selected['follow_ups'] else [],
-        'notes': Note.query.filter(Note.id.in_(selected['notes'])).all() if selected['notes'] else [],
-        'live_povs': Opportunity.query.filter(Opportunity.id.in_(selected['live_povs']), Opportunity.pov_status == 'Active').all() if selected['live_povs'] else [],
-        'skill_matrix': []
-    }
-
-    if selected['skill_matrix']:
-        sm_members = TeamMember.query.filter(TeamMember.id.in_(selected['skill_matrix'])).all()
-        for member in sm_members:
-            ratings = {r.skill: r.proficiency for r in SkillRating.query.filter_by(team_member_id=member.id).all()}
-            data['skill_matrix'].append({'member': member, 'ratings': ratings})
-
-    has_data = any([data['team_members'], data['one_on_ones'], data['opportunities'],
-                    data['support_cases'], data['follow_ups'], data['notes'],
-                    data['live_povs'], data['skill_matrix']])
+    try:
+        start_date, end_date = report_dates(request.form)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('reports'))
+    selected = selected_ids(request.form)
+    data = load_report_data(selected, start_date, end_date)
+    has_data = any(data.values())
 
     return render_template('report_preview.html', data=data, selected=selected,
                            start_date=start_date, end_date=end_date, has_data=has_data,
@@ -915,124 +935,145 @@ def preview_report():
 
 @app.route('/reports/generate', methods=['POST'])
 def generate_report():
-    from reports import generate_pdf_report, generate_csv_report
-
-    report_format = request.form.get('format', 'pdf')
-    start_date = request.form.get('start_date')
-    end_date = request.form.get('end_date')
-
-    selected = {
-        'team_members': request.form.getlist('team_members'),
-        'one_on_ones': request.form.getlist('one_on_ones'),
-        'opportunities': request.form.getlist('opportunities'),
-        'support_cases': request.form.getlist('support_cases'),
-        'follow_ups': request.form.getlist('follow_ups'),
-        'notes': request.form.getlist('notes'),
-        'skill_matrix': request.form.getlist('skill_matrix'),
-        'live_povs': request.form.getlist('live_povs')
-    }
+    try:
+        start_date, end_date = report_dates(request.form)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('reports'))
+    selected = selected_ids(request.form)
+    key = ('selection', {section: sorted(ids) for section, ids in selected.items()})
+    return report_response(partial(load_report_data, selected, start_date, end_date),
+                           request.form.get('format', 'pdf'), start_date, end_date, key)
+
+
+def report_dates(form):
+    """The (start, end) dates a report form asks for; either may be None.
+
+    Raises ValueError with a message for the user if a date can't be read.
+    """
+    dates = []
+    for field, label in (('start_date', 'start'), ('end_date', 'end')):
+        value = form.get(field)
+        try:
+            dates.append(parse_date(value).date() if value else None)
+        except (ValueError, OverflowError):
+            raise ValueError(f"'{value}' is not a valid {label} date.") from None
+    return tuple(dates)
 
-    data = {
-        'team_members': TeamMember.query.filter(TeamMember.id.in_(selected['team_members'])).all() if selected['team_members'] else [],
-        'one_on_ones': OneOnOne.query.filter(OneOnOne.id.in_(selected['one_on_ones'])).all() if selected['one_on_ones'] else [],
-        'opportunities': Opportunity.query.filter(Opportunity.id.in_(selected['opportunities'])).all() if selected['opportunities'] else [],
-        'support_cases': SupportCase.query.filter(SupportCase.id.in_(selected['support_cases'])).all() if selected['support_cases'] else [],
-        'follow_ups': FollowUp.query.filter(FollowUp.id.in_(selected['follow_ups'])).all() if selected['follow_ups'] else [],
-        'notes': Note.query.filter(Note.id.in_(selected['notes'])).all() if selected['notes'] else [],
-        'live_povs': Opportunity.query.filter(Opportunity.id.in_(selected['live_povs']), Opportunity.pov_status == 'Active').all() if selected['live_povs'] else [],
-        'skill_matrix': []
-    }
 
-    if selected['skill_matrix']:
-        sm_members = TeamMember.query.filter(TeamMember.id.in_(selected['skill_matrix'])).all()
-        for member in sm_members:
-            ratings = {r.skill: r.proficiency for r in SkillRating.query.filter_by(team_member_id=member.id).all()}
-            data['skill_matrix'].append({'member': member, 'ratings': ratings})
+def report_response(load_data, report_format, start_date, end_date, key):
+    from reports import generate_csv_report
 
     if report_format == 'pdf':
-        filepath = generate_pdf_report(data, start_date, end_date)
-        return send_file(filepath, as_attachment=True, download_name='se_team_report.pdf')
+        # PDFs render in a worker process; identical requests share one job
+        try:
+            job = submit_report(app, report_key(*key, start_date, end_date), load_data, start_date, end_date)
+        except ReportQueueFull:
+            flash('Too many reports are being generated right now. Please try again in a few minutes.', 'warning')
+            return redirect(url_for('reports'))
+        return redirect(url_for('report_job', job_id=job.id))
     else:
-        filepath = generate_csv_report(data, start_date, end_date)
-        return send_file(filepath, as_attachment=True, download_name='se_team_report.csv')
-
-
-def migrate_db():
-    """Add new opportunity columns if they don't exist and migrate old stage values."""
-    from sqlalchemy import inspect
-    inspector = inspect(db.engine)
-    existing_cols = {col['name'] for col in inspector.get_columns('opportunities')}
-
-    new_cols = {
-        'salesforce_link': 'VARCHAR(500)',
-        'confidence': 'INTEGER',
-        'sales_rep': 'VARCHAR(100)',
-        'products': 'VARCHAR(500)',
-        'rfp': 'VARCHAR(1)',
-        'demo': 'VARCHAR(1)',
-        'pov_status': 'VARCHAR(20)',
-        'latest_update_date': 'DATE',
-        'latest_update_notes': 'TEXT',
-        'competitive': 'VARCHAR(1)',
-        'competitive_notes': 'TEXT',
-    }
-    for col_name, col_type in new_cols.items():
-        if col_name not in existing_cols:
-            db.session.execute(db.text(f'ALTER TABLE opportunities ADD COLUMN {col_name} {col_type}'))
-
-    # Migrate old text stages to numeric 1-6
-    stage_map = {
-        'Prospecting': '1', 'Qualification': '2', 'Demo': '3',
-        'POC': '4', 'Negotiation': '5', 'Closed Won': '6', 'Closed Lost': '6',
-    }
-    for old, new in stage_map.items():
-        db.session.execute(
-            db.text("UPDATE opportunities SET stage = :new WHERE stage = :old"),
-            {'new': new, 'old': old}
-        )
-    # Set POV status for old POC-stage records
-    if 'pov_status' not in existing_cols:
-        db.session.execute(
-            db.text("UPDATE opportunities SET pov_status = 'None' WHERE pov_status IS NULL")
+        # Sections are queried as the client reads the rows, so the session must outlive the view
+        return Response(
+            stream_with_context(generate_csv_report(load_data(stream=True), start_date, end_date)),
+            mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename=se_team_report.csv'}
         )
 
-    db.session.commit()
 
-    # Migrate support_cases table
-    sc_cols = {col['name'] for col in inspector.get_columns('support_cases')}
-    sc_new_cols = {
-        'case_number': 'VARCHAR(50)',
-        'escalated': 'VARCHAR(1)',
-        'opportunity': 'VARCHAR(200)',
-        'product': 'VARCHAR(100)',
-        'customer_email': 'VARCHAR(200)',
-    }
-    for col_name, col_type in sc_new_cols.items():
-        if col_name not in sc_cols:
-            db.session.execute(db.text(f'ALTER TABLE support_cases ADD COLUMN {col_name} {col_type}'))
+# Saved Reports
+@app.route('/reports/definitions', methods=['POST'])
+def add_report_definition():
+    sections = [s for s in request.form.getlist('sections') if s in REPORT_SECTIONS]
+    if not request.form.get('name') or not sections:
+        flash('A saved report needs a name and at least one section.', 'danger')
+        return redirect(url_for('reports'))
+
+    period_days = request.form.get('period_days', type=int) or None
+    if period_days is not None and period_days not in REPORT_PERIODS:
+        flash(f'{period_days} days is not one of the report periods.', 'danger')
+        return redirect(url_for('reports'))
+    try:
+        start_date, end_date = (None, None) if period_days else report_dates(request.form)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('reports'))
+
+    definition = ReportDefinition(
+        name=request.form['name'],
+        sections=','.join(sections),
+        member_ids=','.join(i for i in request.form.getlist('member_ids') if i.isdigit()),
+        stages=','.join(s for s in request.form.getlist('stages') if s in OPPORTUNITY_STAGES),
+        case_statuses=','.join(s for s in request.form.getlist('case_statuses') if s in CASE_STATUSES),
+        followup_statuses=','.join(s for s in request.form.getlist('followup_statuses') if s in FOLLOWUP_STATUSES),
+        period_days=period_days,
+        start_date=start_date,
+        end_date=end_date
+    )
+    db.session.add(definition)
     db.session.commit()
+    flash('Saved report created successfully', 'success')
+    return redirect(url_for('reports'))
 
-    # Migrate team_members table for new rep/location columns
-    tm_cols = {col['name'] for col in inspector.get_columns('team_members')}
-    tm_new_cols = {
-        'aligned_rep_3': 'VARCHAR(100)',
-        'aligned_rep_4': 'VARCHAR(100)',
-        'location': 'VARCHAR(100)',
-        'aligned_rep_location': 'VARCHAR(100)',
-        'aligned_rep_2_location': 'VARCHAR(100)',
-        'aligned_rep_3_location': 'VARCHAR(100)',
-        'aligned_rep_4_location': 'VARCHAR(100)',
-        'category': "VARCHAR(50) DEFAULT 'Solution Engineers'",
-        'show_in_one_on_ones': "VARCHAR(1) DEFAULT 'Y'",
-    }
-    for col_name, col_type in tm_new_cols.items():
-        if col_name not in tm_cols:
-            db.session.execute(db.text(f'ALTER TABLE team_members ADD COLUMN {col_name} {col_type}'))
+
+@app.route('/reports/definitions/delete/<int:id>', methods=['POST'])
+def delete_report_definition(id):
+    definition = ReportDefinition.query.get_or_404(id)
+    db.session.delete(definition)
     db.session.commit()
+    flash('Saved report deleted successfully', 'success')
+    return redirect(url_for('reports'))
+
+
+@app.route('/reports/definitions/<int:id>/preview')
+def preview_report_definition(id):
+    definition = ReportDefinition.query.get_or_404(id)
+    start_date, end_date = definition.date_range(date.today())
+    data = load_definition_data(definition, date.today())
+
+    return render_template('report_preview.html', data=data, definition=definition,
+                           start_date=start_date, end_date=end_date, has_data=any(data.values()),
+                           generated_at=datetime.now().strftime('%Y-%m-%d %H:%M'))
+
+
+@app.route('/reports/definitions/<int:id>/generate')
+def generate_report_definition(id):
+    definition = ReportDefinition.query.get_or_404(id)
+    start_date, end_date = definition.date_range(date.today())
+    return report_response(partial(load_definition_data, definition, date.today()),
+                           request.args.get('format', 'pdf'), start_date, end_date, ('definition', definition.id))
+
+
+# Report Jobs
+@app.route('/reports/jobs/<job_id>')
+def report_job(job_id):
+    expire_report_jobs(app)
+    job = ReportJob.query.get_or_404(job_id)
+    return render_template('report_job.html', job=job)
+
+
+@app.route('/reports/jobs/<job_id>/status')
+def report_job_status_json(job_id):
+    expire_report_jobs(app)
+    job = ReportJob.query.get_or_404(job_id)
+    status = report_job_status(job)
+    if job.status == 'Completed':
+        status['download_url'] = url_for('download_report_job', job_id=job.id)
+    return jsonify(status)
+
+
+@app.route('/reports/jobs/<job_id>/download')
+def download_report_job(job_id):
+    expire_report_jobs(app)
+    job = ReportJob.query.get_or_404(job_id)
+    path = report_path(app, job.id)
+    if job.status != 'Completed' or not os.path.exists(path):
+        abort(404)
+    return send_file(path, mimetype='application/pdf', as_attachment=True, download_name='se_team_report.pdf')
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     with app.app_context():
-        db.create_all()
-        migrate_db()
+        run_migrations()
     app.run(host='0.0.0.0', debug=True)
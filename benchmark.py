@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""Benchmark the main routes against a copy of a database.
+
+Each case in build_cases() is requested through the Flask test client: once
+cold, then --iterations more times for latency percentiles, then once more
+under tracemalloc for peak Python memory. Query counts and database time
+come from the Server-Timing header that querystats adds to every response.
+Results are written as JSON so runs can be compared:
+
+    python generate_data.py --database /tmp/bench.db --reset
+    python benchmark.py --database /tmp/bench.db --output before.json
+    ... change something ...
+    python benchmark.py --database /tmp/bench.db --output after.json --compare before.json
+
+The database is copied to a scratch directory first, so the import case
+doesn't change it. Import latency is measured from upload until the
+background job reports finished.
+"""
+
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+_SERVER_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+PERCENTILES = (50, 90, 99)
+IMPORT_ROWS = 1000
+REPORT_MEMBERS = 10
+JOB_TIMEOUT = 300
+
+
+class Case:
+    def __init__(self, label, url, method='GET', data=None, heavy=False, wait_for_job=False):
+        self.label = label
+        self.url = url
+        self.method = method
+        # A callable, so uploaded files are fresh for every request
+        self.data = data
+        self.heavy = heavy
+        # Follow the redirect to a background job and wait for (and download) its result
+        self.wait_for_job = wait_for_job
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)), 1) - 1]
+
+
+def import_csv():
+    """A CSV of IMPORT_ROWS new opportunities in the import template's layout."""
+    from importer import OPPORTUNITY_IMPORT_COLUMNS
+    from models import TeamMember
+
+    names = [name for (name,) in TeamMember.query.with_entities(TeamMember.name).limit(20)]
+    batch = uuid.uuid4().hex[:8]
+    output = io.StringIO()
+    writer = csv.DictWriter(output, OPPORTUNITY_IMPORT_COLUMNS)
+    writer.writeheader()
+    for i in range(IMPORT_ROWS):
+        writer.writerow({
+            'name': f'Benchmark Deal {batch}-{i}', 'account': f'Benchmark Account {i % 50}',
+            'se_name': names[i % len(names)], 'stage': str(i % 6 + 1), 'value': 10000 + i,
+            'close_date': '2027-03-31', 'salesforce_link': f'https://example.my.salesforce.com/bench{batch}{i}',
+            'confidence': 50, 'sales_rep': 'Rep 1', 'products': 'PRA,EPM', 'rfp': 'N', 'demo': 'Y',
+            'pov_status': 'None',
+        })
+    return output.getvalue().encode()
+
+
+def build_cases(report_size):
+    """Cases with filter values and ids picked from the data; call in an app context."""
+    from models import (db, TeamMember, OneOnOne, Opportunity, SupportCase, FollowUp, Note, Tag,
+                        REGIONS)
+
+    busiest = (db.session.query(Opportunity.team_member_id)
+               .group_by(Opportunity.team_member_id)
+               .order_by(db.func.count().desc()).limit(1).scalar())
+    one_on_one_member = (db.session.query(OneOnOne.team_member_id)
+                         .group_by(OneOnOne.team_member_id)
+                         .order_by(db.func.count().desc()).limit(1).scalar())
+    top_tag = db.session.query(Tag.name).order_by(Tag.note_count.desc()).limit(1).scalar()
+
+    def ids(model, *criteria):
+        rows = db.session.query(model.id).filter(*criteria).order_by(model.id.desc()).limit(report_size)
+        return [str(id) for (id,) in rows]
+
+    # Few members, as in real reports; selecting them all would hide lazy member loads
+    members = ids(TeamMember)[:REPORT_MEMBERS]
+    report = {
+        'team_members': members,
+        'one_on_ones': ids(OneOnOne),
+        'opportunities': ids(Opportunity),
+        'support_cases': ids(SupportCase),
+        'follow_ups': ids(FollowUp),
+        'notes': ids(Note),
+        'skill_matrix': members,
+        'live_povs': ids(Opportunity, Opportunity.pov_status == 'Active'),
+    }
+    csv_bytes = import_csv()
+
+    def upload():
+        # Same rows each time; without upsert every upload inserts them again
+        return {'csv_file': (io.BytesIO(csv_bytes), 'benchmark.csv')}
+
+    return [
+        Case('dashboard', '/'),
+        Case('team', '/team'),
+        Case('opportunities', '/opportunities'),
+        Case('opportunities by stage', '/opportunities?stage=4'),
+        Case('opportunities by member', f'/opportunities?member_id={busiest}'),
+        Case('opportunities by product', '/opportunities?product=PRA'),
+        Case('opportunities by pov status', '/opportunities?pov_status=Active'),
+        Case('support cases', '/support-cases'),
+        Case('support cases by status', '/support-cases?status=Open'),
+        Case('support cases by member', f'/support-cases?member_id={busiest}'),
+        Case('follow-ups', '/follow-ups'),
+        Case('follow-ups by status', '/follow-ups?status=Pending'),
+        Case('notes', '/notes'),
+        Case('notes by member', f'/notes?member_id={busiest}'),
+        Case('notes by tag', f'/notes?tag={top_tag}'),
+        Case('notes search', '/notes?search=requirements'),
+        Case('one_on_ones member', f'/one-on-ones?member_id={one_on_one_member}'),
+        Case('one_on_one meetings page', f'/one-on-ones/{one_on_one_member}/meetings'),
+        Case('skill matrix', '/skill-matrix'),
+        Case('skill matrix filtered', f'/skill-matrix?region={REGIONS[0]}&skill_PRA=%3E%3DTraining'),
+        Case('reports', '/reports', heavy=True),
+        Case('report preview', '/reports/preview', 'POST', lambda: report, heavy=True),
+        Case('report csv', '/reports/generate', 'POST', lambda: {**report, 'format': 'csv'}, heavy=True),
+        Case('report pdf', '/reports/generate', 'POST', lambda: {**report, 'format': 'pdf'}, heavy=True,
+             wait_for_job=True),
+        Case('opportunity import', '/opportunities/import', 'POST', upload, heavy=True, wait_for_job=True),
+    ]
+
+
+def request(client, case):
+    """Run ``case`` once; return (elapsed ms, queries, db ms)."""
+    started = time.perf_counter()
+    response = client.open(case.url, method=case.method, data=case.data() if case.data else None)
+    response.get_data()
+    if response.status_code >= 400:
+        raise RuntimeError(f'{case.method} {case.url} returned {response.status_code}')
+    if case.wait_for_job:
+        job_url = response.headers['Location'].rstrip('/') + '/status'
+        deadline = time.monotonic() + JOB_TIMEOUT
+        while not (job := client.get(job_url).get_json())['finished']:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'{case.label} did not finish within {JOB_TIMEOUT}s')
+            time.sleep(0.01)
+        if job['status'] == 'Failed':
+            raise RuntimeError(f'{case.label} failed: {job["message"]}')
+        if job.get('download_url'):
+            client.get(job['download_url']).get_data()
+    elapsed = (time.perf_counter() - started) * 1000
+    response.close()
+    match = _SERVER_TIMING.search(response.headers.get('Server-Timing', ''))
+    if not match:
+        return elapsed, None, None
+    return elapsed, int(match.group(2)), float(match.group(1))
+
+
+def run_case(client, case, iterations):
+    first_ms, queries, _ = request(client, case)
+    timings, db_timings = [], []
+    for _ in range(iterations):
+        elapsed, queries, db_ms = request(client, case)
+        timings.append(elapsed)
+        if db_ms is not None:
+            db_timings.append(db_ms)
+
+    tracemalloc.start()
+    try:
+        request(client, case)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    result = {'iterations': iterations, 'first_ms': round(first_ms, 2)}
+    for p in PERCENTILES:
+        result[f'p{p}_ms'] = round(percentile(timings, p), 2)
+    result.update({
+        'max_ms': round(max(timings), 2),
+        'mean_ms': round(sum(timings) / len(timings), 2),
+        'db_p50_ms': round(percentile(db_timings, 50), 2) if db_timings else None,
+        'queries': queries,
+        'peak_memory_kb': round(peak / 1024),
+    })
+    return result
+
+
+def row_counts():
+    from models import db
+    return {name: db.session.execute(db.select(db.func.count()).select_from(table)).scalar()
+            for name, table in sorted(db.metadata.tables.items())}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    """Print p50/p90 and query count changes for the cases both runs have."""
+    print(f'\n{"case":32} {"p50 ms":>26} {"p90 ms":>26} {"queries":>14}')
+    for label, result in new['results'].items():
+        before = old['results'].get(label)
+        if not before:
+            continue
+        columns = []
+        for key in ('p50_ms', 'p90_ms'):
+            change = (result[key] - before[key]) / before[key] * 100 if before[key] else 0
+            columns.append(f'{before[key]:.1f} → {result[key]:.1f} {change:+4.0f}%')
+        print(f'{label:32} {columns[0]:>26} {columns[1]:>26} {before["queries"]!s:>5} → {result["queries"]!s:<5}')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark SE Team Manager routes.')
+    parser.add_argument('--database', default=os.path.join('instance', 'se_team.db'))
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--report-size', type=int, default=100, help='records of each kind in report cases')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', metavar='OLD_RESULTS', help='print changes against an earlier results file')
+    parser.add_argument('--only', help='run only cases whose label contains this text')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    if not os.path.exists(args.database):
+        sys.exit(f'{args.database} not found; create one with generate_data.py')
+    workdir = tempfile.mkdtemp()
+    try:
+        database = os.path.join(workdir, 'benchmark.db')
+        shutil.copyfile(args.database, database)
+        os.environ['DATABASE_URL'] = 'sqlite:///' + database
+        results = run(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {args.output}')
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    return 0
+
+
+def run(args, workdir):
+    # Imported here so the app picks up the scratch DATABASE_URL
+    from app import app
+    from migrations import run_migrations
+    from report_jobs import shutdown_report_workers
+
+    # Import and report jobs write their files under the instance folder
+    app.instance_path = workdir
+    with app.app_context():
+        run_migrations()
+        cases = build_cases(args.report_size)
+        counts = row_counts()
+    if args.only:
+        cases = [case for case in cases if args.only in case.label]
+
+    client = app.test_client()
+    results = {}
+    try:
+        for case in cases:
+            iterations = max(args.iterations // 5, 1) if case.heavy else args.iterations
+            results[case.label] = result = run_case(client, case, iterations)
+            print(f'{case.label:32} p50 {result["p50_ms"]:8.1f} ms  p90 {result["p90_ms"]:8.1f} ms  '
+                  f'{result["queries"]!s:>4} queries  {result["peak_memory_kb"]:7} KB peak')
+    finally:
+        shutdown_report_workers()
+
+    return {
+        'metadata': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'database': os.path.abspath(args.database),
+            'iterations': args.iterations,
+            'report_size': args.report_size,
+            'row_counts': counts,
+        },
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""Check that the queries behind every page are served by indexes.
+
+Builds a scratch database with init_db's sample data, requests each route in
+ROUTES and runs EXPLAIN QUERY PLAN on every statement the route issued. A
+plan that reads a whole table (see full_scans()) fails the check unless
+ALLOWED_SCANS lists that table for the route. The database is not ANALYZEd,
+so plans depend on the indexes available rather than on how many sample rows
+there are.
+
+    python check_query_plans.py [-v]
+
+-v prints every plan. Exits with status 1 if any route falls back to a
+full table scan.
+"""
+
+import contextlib
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+# (label, method, url, form data); writes come last since they change the data
+ROUTES = [
+    ('dashboard', 'GET', '/', None),
+    ('team', 'GET', '/team', None),
+    ('one_on_ones', 'GET', '/one-on-ones', None),
+    ('one_on_ones member', 'GET', '/one-on-ones?member_id=1', None),
+    ('one_on_one meetings page', 'GET', '/one-on-ones/1/meetings', None),
+    ('one_on_one detail', 'GET', '/one-on-ones/meeting/1', None),
+    ('opportunities', 'GET', '/opportunities', None),
+    ('opportunities by stage', 'GET', '/opportunities?stage=4', None),
+    ('opportunities by member', 'GET', '/opportunities?member_id=1', None),
+    ('opportunities by product', 'GET', '/opportunities?product=PRA', None),
+    ('opportunities by pov status', 'GET', '/opportunities?pov_status=Active', None),
+    ('opportunity history', 'GET', '/opportunities/1/history', None),
+    ('support cases', 'GET', '/support-cases', None),
+    ('support cases by status', 'GET', '/support-cases?status=Open', None),
+    ('support cases by priority', 'GET', '/support-cases?priority=High', None),
+    ('support cases by member', 'GET', '/support-cases?member_id=1', None),
+    ('follow-ups', 'GET', '/follow-ups', None),
+    ('follow-ups by status', 'GET', '/follow-ups?status=Pending', None),
+    ('follow-ups by priority', 'GET', '/follow-ups?priority=High', None),
+    ('follow-ups by member', 'GET', '/follow-ups?member_id=1', None),
+    ('notes', 'GET', '/notes', None),
+    ('notes by member', 'GET', '/notes?member_id=1', None),
+    ('notes by tag', 'GET', '/notes?tag=acme', None),
+    ('notes search', 'GET', '/notes?search=requirements', None),
+    ('skill matrix', 'GET', '/skill-matrix', None),
+    ('skill matrix filtered', 'GET', '/skill-matrix?region=Americas&skill_PRA=%3E%3DTraining', None),
+    ('reports', 'GET', '/reports', None),
+    ('metrics', 'GET', '/metrics', None),
+    ('report preview', 'POST', '/reports/preview', {
+        'team_members': ['1', '2'], 'one_on_ones': ['1'], 'opportunities': ['1', '2'],
+        'support_cases': ['1'], 'follow_ups': ['1'], 'notes': ['1'], 'skill_matrix': ['1'], 'live_povs': ['1'],
+    }),
+    ('report preview by date', 'POST', '/reports/preview', {
+        'opportunities': ['1', '2'], 'support_cases': ['1'], 'notes': ['1'],
+        'start_date': '2024-01-01', 'end_date': '2024-12-31',
+    }),
+    ('report pdf job', 'POST', '/reports/generate', {
+        'opportunities': ['1', '2'], 'notes': ['1'], 'start_date': '2024-01-01', 'format': 'pdf',
+    }),
+    ('save dated report definition', 'POST', '/reports/definitions', {
+        'name': 'Year', 'sections': ['one_on_ones', 'opportunities', 'support_cases', 'follow_ups', 'notes',
+                                     'live_povs'],
+        'start_date': '2024-01-01', 'end_date': '2024-12-31',
+    }),
+    ('report definition by date', 'GET', '/reports/definitions/1/preview', None),
+    ('save report definition', 'POST', '/reports/definitions', {
+        'name': 'Weekly', 'sections': ['team_members', 'one_on_ones', 'opportunities', 'support_cases',
+                                       'follow_ups', 'notes', 'skill_matrix', 'live_povs'],
+        'member_ids': ['1', '2'], 'stages': ['3', '4'], 'case_statuses': ['Open'], 'period_days': '30',
+    }),
+    ('report definition preview', 'GET', '/reports/definitions/2/preview', None),
+    ('report definition csv', 'GET', '/reports/definitions/2/generate?format=csv', None),
+    ('opportunity comment', 'POST', '/opportunities/comment/1', {'comment': 'Checked plans', 'stage': '5'}),
+    ('complete follow-up', 'POST', '/follow-ups/complete/1', {}),
+    ('delete support case', 'POST', '/support-cases/delete/1', {}),
+    ('delete opportunity', 'POST', '/opportunities/delete/2', {}),
+    ('delete note', 'POST', '/notes/delete/1', {}),
+    ('delete team member', 'POST', '/team/delete/3', {}),
+]
+
+# Whole-table reads that are the point of the route, as {label: {table: reason}}
+ALLOWED_SCANS = {
+    '*': {
+        'team_members': 'member pickers list every member',
+        'skill_ratings': 'the skill matrix cache is built from every rating',
+    },
+    'metrics': {
+        'table_row_counts': 'one row per counted table',
+    },
+    'reports': {
+        'one_on_ones': 'the report builder lists every record',
+        'opportunities': 'the report builder lists every record',
+        'support_cases': 'the report builder lists every record',
+        'follow_ups': 'the report builder lists every record',
+        'notes': 'the report builder lists every record',
+        'skill_ratings': 'the report builder lists every record',
+        'report_definitions': 'the reports page lists every saved report',
+    },
+}
+
+_SCAN = re.compile(r'^SCAN (\w+)( USING (?:COVERING )?INDEX \w+)?$')
+_ALIAS_SUFFIX = re.compile(r'_\d+$')
+
+
+def full_scans(plan, tables):
+    """Names of the tables a plan reads in full.
+
+    That is a SCAN without an index, or a SCAN along an index when the rows
+    still have to be sorted afterwards. An index walk that already yields the
+    ORDER BY can stop at the LIMIT, so it passes.
+    """
+    sorted_after = any(row[3].startswith('USE TEMP B-TREE FOR ORDER BY') for row in plan)
+    scanned = []
+    for row in plan:
+        match = _SCAN.match(row[3])
+        if match and (not match.group(2) or sorted_after):
+            # SQLAlchemy aliases repeated tables as <table>_1, <table>_2, ...
+            name = _ALIAS_SUFFIX.sub('', match.group(1))
+            if name in tables:
+                scanned.append(name)
+    return scanned
+
+
+def main(argv):
+    verbose = '-v' in argv
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'plans.db')
+    try:
+        return check(verbose, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def check(verbose, workdir):
+    # Imported here so the app picks up the scratch DATABASE_URL
+    from sqlalchemy import event
+    from app import app, db
+    from init_db import init_database
+    from migrations import run_migrations
+    from report_jobs import shutdown_report_workers
+
+    # Report jobs write their PDFs under the instance folder
+    app.instance_path = workdir
+    with app.app_context():
+        run_migrations()
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_database()
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+            statements.append((statement, parameters))
+
+    client = app.test_client()
+    failures = []
+    with app.app_context():
+        tables = set(db.metadata.tables)
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        for label, method, url, data in ROUTES:
+            statements.clear()
+            response = client.open(url, method=method, data=data)
+            if response.status_code >= 400:
+                failures.append(f'{label}: {method} {url} returned {response.status_code}')
+                continue
+            allowed = {**ALLOWED_SCANS['*'], **ALLOWED_SCANS.get(label, {})}
+            seen = set()
+            for statement, parameters in list(statements):
+                if statement in seen:
+                    continue
+                seen.add(statement)
+                with engine.connect() as conn:
+                    plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+                scans = [table for table in full_scans(plan, tables) if table not in allowed]
+                if verbose or scans:
+                    print(f'-- {label}: {" ".join(statement.split())}')
+                    for row in plan:
+                        print(f'     {row[3]}')
+                for table in scans:
+                    failures.append(f'{label}: full scan of {table}')
+    finally:
+        # Let queued PDFs finish while the scratch database is still there
+        shutdown_report_workers()
+        event.remove(engine, 'before_cursor_execute', record)
+
+    for failure in failures:
+        print('FAIL', failure)
+    print(f'{len(ROUTES)} routes checked, {len(failures)} failure(s)')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""Fill a database with synthetic data at realistic scale for performance work.
+
+Every model is generated in bulk with skewed distributions: a few members own
+most of the pipeline, a few accounts and tags dominate, most opportunities
+and cases are closed, and dates cluster towards the present. Rows are
+written with Core executemany in batches, and the derived tables that ORM
+events normally maintain (opportunity products, the notes search index,
+note tags) are filled in directly.
+
+    python generate_data.py [--database PATH] [--reset] [--seed N]
+                            [--members 200] [--opportunities 100000] ...
+
+Without --database the app's DATABASE_URL is used. --reset drops every
+table first; otherwise rows are added to what is already there. Run
+python generate_data.py --help for every size option.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+BATCH_SIZE = 5000
+
+FIRST_NAMES = ['Alex', 'Blake', 'Casey', 'Dana', 'Eli', 'Frankie', 'Gray', 'Harper', 'Indy', 'Jordan',
+               'Kai', 'Logan', 'Morgan', 'Noel', 'Oakley', 'Parker', 'Quinn', 'Reese', 'Sage', 'Taylor']
+LAST_NAMES = ['Adams', 'Baker', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Ito', 'Jensen',
+              'Khan', 'Lopez', 'Murphy', 'Nguyen', 'Okafor', 'Patel', 'Rossi', 'Silva', 'Tanaka', 'Weber']
+ACCOUNT_WORDS = ['Acme', 'Global', 'Northwind', 'Summit', 'Pioneer', 'Harbor', 'Vertex', 'Atlas', 'Beacon',
+                 'Cobalt', 'Evergreen', 'Granite', 'Horizon', 'Keystone', 'Meridian', 'Quantum', 'Sterling']
+ACCOUNT_SUFFIXES = ['Bank', 'Health', 'Energy', 'Retail', 'Logistics', 'Insurance', 'Systems', 'Foods', 'Labs']
+DEAL_WORDS = ['Expansion', 'Renewal', 'Platform', 'Migration', 'Pilot', 'Enterprise', 'Consolidation']
+WORDS = ('customer requirements integration rollout security audit renewal pricing timeline architecture '
+         'stakeholder workshop demo feedback roadmap escalation training budget approval pilot deployment '
+         'identity privileged access endpoint compliance onboarding competitive risk forecast').split()
+TAGS = ['acme', 'requirements', 'discovery', 'competitive', 'strategy', 'planning', 'q1', 'q2', 'q3', 'q4',
+        'team', 'pricing', 'security', 'renewal', 'escalation', 'training', 'roadmap', 'partner', 'emea',
+        'apac', 'pov', 'demo', 'legal', 'procurement', 'architecture', 'onboarding', 'risk', 'forecast']
+
+
+def zipf_weights(n, exponent=1.0):
+    """Weights for n items where item k is about 1/k^exponent as likely as the first."""
+    return [1 / (k + 1) ** exponent for k in range(n)]
+
+
+class Generator:
+    def __init__(self, conn, sizes, seed):
+        self.conn = conn
+        self.sizes = sizes
+        self.random = random.Random(seed)
+        self.now = datetime.utcnow()
+        self.horizon = timedelta(days=365 * sizes.years)
+
+    def next_id(self, table):
+        from models import db
+        return (self.conn.execute(db.select(db.func.max(table.c.id))).scalar() or 0) + 1
+
+    def insert(self, table, rows):
+        for start in range(0, len(rows), BATCH_SIZE):
+            self.conn.execute(table.insert(), rows[start:start + BATCH_SIZE])
+
+    def recent(self, scale=0.25):
+        """A datetime within the horizon, exponentially biased towards now."""
+        age = min(self.random.expovariate(1 / (self.horizon.total_seconds() * scale)), self.horizon.total_seconds())
+        return self.now - timedelta(seconds=age)
+
+    def sentence(self, low, high):
+        return ' '.join(self.random.choice(WORDS) for _ in range(self.random.randint(low, high))).capitalize() + '.'
+
+    def paragraphs(self, count):
+        return ''.join(f'<p>{self.sentence(12, 40)}</p>' for _ in range(count))
+
+    def pick(self, items, weights, k):
+        return self.random.choices(items, cum_weights=self._cumulative(weights), k=k)
+
+    def _cumulative(self, weights):
+        total, cumulative = 0, []
+        for weight in weights:
+            total += weight
+            cumulative.append(total)
+        return cumulative
+
+    def members(self):
+        from models import TeamMember, REGIONS, MEMBER_CATEGORIES
+        table = TeamMember.__table__
+        first = self.next_id(table)
+        rows = []
+        for i in range(self.sizes.members):
+            category = self.random.choices(MEMBER_CATEGORIES, weights=[85, 5, 5, 5])[0]
+            name = f'{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)} {first + i}'
+            rows.append({
+                'id': first + i, 'name': name, 'email': f'member{first + i}@example.com',
+                'region': self.random.choices(REGIONS, weights=[35, 25, 30, 10])[0],
+                'aligned_rep': f'Rep {self.random.randint(1, 80)}',
+                'aligned_rep_2': f'Rep {self.random.randint(1, 80)}' if self.random.random() < 0.4 else '',
+                'role': 'Solution Engineer', 'category': category, 'show_in_one_on_ones': 'Y',
+                'created_at': self.recent(0.5),
+            })
+        self.insert(table, rows)
+        self.member_ids = [row['id'] for row in rows]
+        self.se_ids = [row['id'] for row in rows if row['category'] == 'Solution Engineers']
+        # Busy members own most records; shuffled so the busiest aren't simply the lowest ids
+        self.member_weights = zipf_weights(len(self.member_ids), 0.8)
+        self.random.shuffle(self.member_weights)
+
+    def skill_ratings(self):
+        from models import SkillRating, SKILLS, PROFICIENCY_LEVELS
+        rows = []
+        for member_id in self.se_ids:
+            for skill in SKILLS:
+                if self.random.random() < 0.7:
+                    rows.append({'team_member_id': member_id, 'skill': skill,
+                                 'proficiency': self.random.choices(PROFICIENCY_LEVELS, weights=[15, 30, 30, 18, 7])[0],
+                                 'created_at': self.now, 'updated_at': self.now})
+        self.insert(SkillRating.__table__, rows)
+
+    def accounts(self):
+        count = max(self.sizes.opportunities // 20, 10)
+        names = [f'{self.random.choice(ACCOUNT_WORDS)} {self.random.choice(ACCOUNT_SUFFIXES)} {i}' for i in range(count)]
+        return names, zipf_weights(count, 0.9)
+
+    def opportunities(self, accounts, account_weights):
+        from models import Opportunity, OpportunityProduct, OpportunityUpdate, PRODUCTS, POV_STATUSES
+        table = Opportunity.__table__
+        first = self.next_id(table)
+        n = self.sizes.opportunities
+        owners = self.pick(self.member_ids, self.member_weights, n)
+        customers = self.pick(accounts, account_weights, n)
+        rows, links, updates = [], [], []
+        for i in range(n):
+            opp_id = first + i
+            created = self.recent()
+            updated = min(created + timedelta(days=self.random.randint(0, 120)), self.now)
+            stage = self.random.choices(['1', '2', '3', '4', '5', '6'], weights=[12, 12, 10, 8, 8, 50])[0]
+            products = self.random.sample(PRODUCTS, self.random.choices([1, 2, 3], weights=[60, 30, 10])[0])
+            rows.append({
+                'id': opp_id, 'name': f'{customers[i]} {self.random.choice(DEAL_WORDS)} {opp_id}',
+                'account': customers[i], 'stage': stage,
+                'value': round(self.random.lognormvariate(11, 1.1), -2), 'team_member_id': owners[i],
+                'close_date': (created + timedelta(days=self.random.randint(30, 270))).date(),
+                'salesforce_link': f'https://example.my.salesforce.com/006{opp_id:012d}',
+                'confidence': self.random.randint(1, 10) * 10, 'sales_rep': f'Rep {self.random.randint(1, 80)}',
+                'products': ','.join(products), 'rfp': self.random.choice('YN'), 'demo': self.random.choice('YN'),
+                'pov_status': self.random.choices(POV_STATUSES, weights=[70, 10, 15, 5])[0],
+                'competitive': 'Y' if self.random.random() < 0.2 else 'N',
+                'latest_update_date': updated.date(), 'latest_update_notes': self.sentence(6, 20),
+                'created_at': created, 'updated_at': updated,
+            })
+            links.extend({'opportunity_id': opp_id, 'product': product} for product in products)
+            for _ in range(self.random.randint(0, 2 * self.sizes.updates_per_opportunity)):
+                updates.append({'opportunity_id': opp_id, 'stage_from': None, 'stage_to': stage,
+                                'comment': self.sentence(5, 25),
+                                'created_at': created + (updated - created) * self.random.random()})
+        self.insert(table, rows)
+        self.insert(OpportunityProduct.__table__, links)
+        self.insert(OpportunityUpdate.__table__, updates)
+        return len(updates)
+
+    def support_cases(self, accounts, account_weights):
+        from models import SupportCase, SupportCaseComment, CASE_STATUSES, PRIORITIES, PRODUCTS
+        table = SupportCase.__table__
+        first = self.next_id(table)
+        n = self.sizes.cases
+        owners = self.pick(self.member_ids, self.member_weights, n)
+        customers = self.pick(accounts, account_weights, n)
+        rows, comments = [], []
+        for i in range(n):
+            created = self.recent()
+            status = self.random.choices(CASE_STATUSES, weights=[8, 6, 4, 40, 42])[0]
+            rows.append({
+                'id': first + i, 'title': self.sentence(3, 8), 'description': self.paragraphs(1),
+                'status': status, 'priority': self.random.choices(PRIORITIES, weights=[20, 50, 30])[0],
+                'team_member_id': owners[i], 'customer': customers[i], 'case_number': f'CS{first + i:08d}',
+                'escalated': 'Y' if self.random.random() < 0.05 else 'N', 'product': self.random.choice(PRODUCTS),
+                'created_at': created,
+                'resolved_at': created + timedelta(days=self.random.randint(1, 60)) if status in ('Resolved', 'Closed') else None,
+            })
+            for _ in range(self.random.randint(0, 2 * self.sizes.comments_per_case)):
+                comments.append({'case_id': first + i, 'comment': self.sentence(5, 30),
+                                 'created_at': created + timedelta(hours=self.random.randint(1, 500))})
+        self.insert(table, rows)
+        self.insert(SupportCaseComment.__table__, comments)
+        return len(comments)
+
+    def one_on_ones(self):
+        from models import OneOnOne, MOODS
+        rows = []
+        weeks = self.sizes.years * 52
+        for member_id in self.member_ids:
+            # Members joined at different times, so history lengths vary
+            for week in range(self.random.randint(weeks // 4, weeks)):
+                if self.random.random() < 0.8:
+                    when = self.now - timedelta(weeks=week, days=self.random.randint(0, 4))
+                    rows.append({'team_member_id': member_id, 'date': when.date(),
+                                 'notes': self.paragraphs(self.random.randint(1, 4)),
+                                 'action_items': '\n'.join(f'- {self.sentence(3, 10)}' for _ in range(self.random.randint(0, 4))),
+                                 'mood': self.random.choices(MOODS, weights=[15, 45, 25, 10, 5])[0],
+                                 'created_at': when})
+        self.insert(OneOnOne.__table__, rows)
+        return len(rows)
+
+    def follow_ups(self):
+        from models import FollowUp, FOLLOWUP_STATUSES, PRIORITIES
+        n = self.sizes.follow_ups
+        owners = self.pick(self.member_ids, self.member_weights, n)
+        rows = []
+        for i in range(n):
+            created = self.recent()
+            rows.append({'title': self.sentence(3, 8), 'description': self.sentence(8, 30),
+                         'due_date': (created + timedelta(days=self.random.randint(-5, 30))).date(),
+                         'status': self.random.choices(FOLLOWUP_STATUSES, weights=[15, 10, 70, 5])[0],
+                         'priority': self.random.choices(PRIORITIES, weights=[20, 50, 30])[0],
+                         'team_member_id': owners[i], 'created_at': created})
+        self.insert(FollowUp.__table__, rows)
+
+    def notes(self):
+        from models import Note
+        from search import index_notes
+        from tags import set_note_tags
+        table = Note.__table__
+        first = self.next_id(table)
+        n = self.sizes.notes
+        owners = self.pick(self.member_ids + [None], self.member_weights + [sum(self.member_weights) / 9], n)
+        tag_weights = zipf_weights(len(TAGS))
+        rows = []
+        for i in range(n):
+            tags = dict.fromkeys(self.pick(TAGS, tag_weights, self.random.randint(0, 4)))
+            rows.append({'id': first + i, 'title': self.sentence(2, 6), 'content': self.paragraphs(self.random.randint(1, 6)),
+                         'tags': ', '.join(tags), 'team_member_id': owners[i], 'created_at': self.recent()})
+        self.insert(table, rows)
+        for start in range(0, n, BATCH_SIZE):
+            batch = rows[start:start + BATCH_SIZE]
+            index_notes(self.conn, [Note(**row) for row in batch])
+            set_note_tags(self.conn, {row['id']: row['tags'] for row in batch})
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Generate synthetic SE Team Manager data.')
+    parser.add_argument('--database', help='SQLite file to fill (default: the app database)')
+    parser.add_argument('--reset', action='store_true', help='drop all tables before generating')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--members', type=int, default=200)
+    parser.add_argument('--opportunities', type=int, default=100000)
+    parser.add_argument('--updates-per-opportunity', type=int, default=3, help='average')
+    parser.add_argument('--cases', type=int, default=50000)
+    parser.add_argument('--comments-per-case', type=int, default=2, help='average')
+    parser.add_argument('--years', type=int, default=3, help='years of history, including weekly 1-1s')
+    parser.add_argument('--follow-ups', type=int, default=30000)
+    parser.add_argument('--notes', type=int, default=20000)
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    sizes = parse_args(argv)
+    if sizes.database:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(sizes.database)
+
+    from app import app
+    from models import db
+    from migrations import run_migrations
+    from skills import bump_skill_matrix_version
+
+    started = time.perf_counter()
+    with app.app_context():
+        if sizes.reset:
+            db.drop_all()
+        run_migrations()
+
+        generator = Generator(db.session.connection(), sizes, sizes.seed)
+        accounts, account_weights = generator.accounts()
+        generator.members()
+        generator.skill_ratings()
+        updates = generator.opportunities(accounts, account_weights)
+        print(f'{sizes.opportunities} opportunities, {updates} updates')
+        comments = generator.support_cases(accounts, account_weights)
+        print(f'{sizes.cases} support cases, {comments} comments')
+        print(f'{generator.one_on_ones()} 1-1 meetings')
+        generator.follow_ups()
+        generator.notes()
+        print(f'{sizes.members} members, {sizes.follow_ups} follow-ups, {sizes.notes} notes')
+        bump_skill_matrix_version()
+        db.session.commit()
+    print(f'Generated in {time.perf_counter() - started:.1f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
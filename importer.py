@@ -0,0 +1,496 @@
+"""Streaming CSV imports.
+
+Rows are decoded and validated one at a time straight off the upload stream
+and written in batches with executemany, so memory stays flat no matter how
+large the file is. In opportunity upsert mode each batch is matched against
+existing rows on salesforce_link, or account + name when there is no link,
+and only changed columns are written. Support cases, follow-ups, notes and
+1-1 meetings are imported by a generic engine driven by the column specs in
+CSV_IMPORTS.
+"""
+
+import csv
+import io
+from collections import defaultdict
+from datetime import date, datetime
+from types import SimpleNamespace
+
+from dateutil.parser import parse as parse_date
+
+from models import (db, TeamMember, OneOnOne, Opportunity, OpportunityUpdate, OpportunityProduct, SupportCase,
+                    FollowUp, Note, OPPORTUNITY_STAGES, CASE_STATUSES, PRIORITIES, FOLLOWUP_STATUSES, MOODS,
+                    POV_STATUSES, PRODUCT_ALIASES)
+from search import index_notes
+from tags import set_note_tags
+
+IMPORT_BATCH_SIZE = 1000
+OPPORTUNITY_IMPORT_COLUMNS = ['name', 'account', 'se_name', 'stage', 'value', 'close_date',
+                              'salesforce_link', 'confidence', 'sales_rep', 'products',
+                              'rfp', 'demo', 'pov_status']
+# Opportunity columns an upsert import compares and overwrites
+UPSERT_COLUMNS = ['name', 'account', 'team_member_id', 'stage', 'value', 'close_date', 'salesforce_link',
+                  'confidence', 'sales_rep', 'products', 'rfp', 'demo', 'pov_status']
+
+
+class RowError(ValueError):
+    """A CSV row that can't be imported."""
+
+
+class ImportResult:
+    """Counts and per-row error messages from one import run."""
+
+    def __init__(self):
+        self.rows_processed = 0
+        self.success_count = 0
+        self.updated_count = 0
+        self.unchanged_count = 0
+        # Rows replaced by a later row for the same opportunity in the same batch
+        self.duplicate_count = 0
+        self.error_count = 0
+        self.errors = []
+
+
+def parse_csv_date(value):
+    """Parse a CSV date, trying plain ISO format before falling back to dateutil."""
+    value = value.strip()
+    if len(value) == 10 and value[4] == '-' and value[7] == '-':
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            pass
+    return parse_date(value).date()
+
+
+def parse_csv_datetime(value):
+    """Parse a CSV timestamp, trying ISO format before falling back to dateutil."""
+    value = value.strip()
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return parse_date(value)
+
+
+def expand_product_aliases(raw):
+    """Map a comma-separated CRM product list onto PRODUCTS codes via PRODUCT_ALIASES."""
+    return list(dict.fromkeys(
+        prod
+        for p in (raw or '').split(',') if p.strip()
+        for prod in PRODUCT_ALIASES.get(p.strip().lower(), p.strip()).split(',')
+    ))
+
+
+def member_lookup():
+    """Return a case-insensitive team member name -> id map."""
+    rows = db.session.execute(db.select(TeamMember.id, TeamMember.name))
+    return {name.strip().lower(): member_id for member_id, name in rows}
+
+
+def read_csv_rows(stream):
+    """Yield (row_number, row) pairs decoded incrementally from a binary upload stream."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    # Row 2 is the first data row after the header
+    yield from enumerate(csv.DictReader(text), start=2)
+
+
+def parse_opportunity_row(row, members):
+    """Validate one CSV row and return (column values, products); raises RowError."""
+    name = (row.get('name') or '').strip()
+    account = (row.get('account') or '').strip()
+    se_name = (row.get('se_name') or '').strip()
+
+    # Validate required fields
+    missing = []
+    if not name:
+        missing.append('name')
+    if not account:
+        missing.append('account')
+    if not se_name:
+        missing.append('se_name')
+    if missing:
+        raise RowError(f"missing required field(s): {', '.join(missing)}")
+
+    # Resolve SE name
+    team_member_id = members.get(se_name.lower())
+    if not team_member_id:
+        raise RowError(f"SE name '{se_name}' not found")
+
+    # Parse optional fields with defaults
+    stage = (row.get('stage') or '1').strip()
+    if stage not in OPPORTUNITY_STAGES:
+        stage = '1'
+
+    try:
+        raw_value = (row.get('value') or '0').strip()
+        raw_value = raw_value.replace('$', '').replace(',', '')
+        value = float(raw_value or 0)
+    except ValueError:
+        value = 0
+
+    close_date = None
+    if (row.get('close_date') or '').strip():
+        try:
+            close_date = parse_csv_date(row['close_date'])
+        except (ValueError, TypeError, OverflowError):
+            raise RowError(f"invalid close_date '{row['close_date']}'")
+
+    confidence = None
+    if (row.get('confidence') or '').strip():
+        try:
+            confidence = int(row['confidence'].strip())
+            if confidence < 1 or confidence > 10:
+                confidence = None
+        except ValueError:
+            pass
+
+    rfp = (row.get('rfp') or 'N').strip().upper()
+    if rfp not in ('Y', 'N'):
+        rfp = 'N'
+
+    demo = (row.get('demo') or 'N').strip().upper()
+    if demo not in ('Y', 'N'):
+        demo = 'N'
+
+    pov_status = (row.get('pov_status') or 'None').strip()
+    if pov_status not in POV_STATUSES:
+        pov_status = 'None'
+
+    products = expand_product_aliases(row.get('products'))
+    values = {
+        'name': name,
+        'account': account,
+        'team_member_id': team_member_id,
+        'stage': stage,
+        'value': value,
+        'close_date': close_date,
+        'salesforce_link': (row.get('salesforce_link') or '').strip(),
+        'confidence': confidence,
+        'sales_rep': (row.get('sales_rep') or '').strip(),
+        'products': ','.join(products),
+        'rfp': rfp,
+        'demo': demo,
+        'pov_status': pov_status,
+    }
+    return values, products
+
+
+def _insert_rows(conn, table, rows):
+    """Insert rows into ``table`` and return their ids in row order."""
+    return conn.execute(table.insert().returning(table.c.id, sort_by_parameter_order=True), rows).scalars().all()
+
+
+def _insert_batch(batch):
+    """Insert a batch of parsed rows with their import updates and product links."""
+    # Core table inserts skip per-object ORM bookkeeping
+    conn = db.session.connection()
+    ids = _insert_rows(conn, Opportunity.__table__, [values for values, _ in batch])
+    conn.execute(OpportunityUpdate.__table__.insert(), [
+        {'opportunity_id': opp_id, 'stage_to': values['stage'], 'comment': 'Imported from CSV'}
+        for opp_id, (values, _) in zip(ids, batch)
+    ])
+    links = [{'opportunity_id': opp_id, 'product': product}
+             for opp_id, (_, products) in zip(ids, batch)
+             for product in products]
+    if links:
+        conn.execute(OpportunityProduct.__table__.insert(), links)
+
+
+def _existing_opportunities(conn, batch):
+    """Look up existing rows for a batch by salesforce_link and by (account, name)."""
+    table = Opportunity.__table__
+    columns = [table.c.id] + [table.c[name] for name in UPSERT_COLUMNS]
+    links = {values['salesforce_link'] for values, _ in batch if values['salesforce_link']}
+    names = {(values['account'], values['name']) for values, _ in batch}
+    by_link, by_name = {}, {}
+    # Descending id so the oldest of any duplicates wins
+    if links:
+        rows = conn.execute(db.select(*columns)
+                            .where(table.c.salesforce_link.in_(links))
+                            .order_by(table.c.id.desc()))
+        by_link = {row.salesforce_link: row for row in rows}
+    rows = conn.execute(db.select(*columns)
+                        .where(db.tuple_(table.c.account, table.c.name).in_(names))
+                        .order_by(table.c.id.desc()))
+    by_name = {(row.account, row.name): row for row in rows}
+    return by_link, by_name
+
+
+def _match(values, by_link, by_name):
+    """Find the existing row for an imported row: by link first, then account + name."""
+    link = values['salesforce_link']
+    if link and link in by_link:
+        return by_link[link]
+    row = by_name.get((values['account'], values['name']))
+    # Only fall back to a name match when that row isn't tied to a different link
+    if row is not None and (not link or not row.salesforce_link):
+        return row
+    return None
+
+
+def _changed_columns(existing, values):
+    changed = {}
+    for name in UPSERT_COLUMNS:
+        old, new = getattr(existing, name), values[name]
+        if isinstance(new, str) or new is None:
+            # NULL and '' are the same thing for text imported from CSV
+            same = (old or None) == (new or None)
+        else:
+            same = old == new
+        if not same:
+            changed[name] = new
+    return changed
+
+
+def _upsert_batch(batch, result):
+    """Insert new rows and update changed ones, counting each outcome on ``result``."""
+    conn = db.session.connection()
+    table = Opportunity.__table__
+    by_link, by_name = _existing_opportunities(conn, batch)
+
+    # Collapse repeated rows for the same opportunity so the last one in the file wins
+    latest = {}
+    for values, products in batch:
+        row = _match(values, by_link, by_name)
+        key = ('id', row.id) if row is not None else values['salesforce_link'] or (values['account'], values['name'])
+        if key in latest:
+            result.duplicate_count += 1
+        latest[key] = (row, values, products)
+
+    inserts = []
+    updates = defaultdict(list)
+    stage_changes = []
+    product_changes = {}
+    for row, values, products in latest.values():
+        if row is None:
+            inserts.append((values, products))
+            continue
+        changed = _changed_columns(row, values)
+        if not changed:
+            result.unchanged_count += 1
+            continue
+        if 'stage' in changed:
+            stage_changes.append({'opportunity_id': row.id, 'stage_from': row.stage, 'stage_to': values['stage'],
+                                  'comment': f"Stage changed from {row.stage} to {values['stage']} by CSV import"})
+        if 'products' in changed:
+            product_changes[row.id] = products
+        # Group updates by the set of changed columns so each group is one executemany
+        # Bind names can't match column names in an UPDATE's SET clause
+        updates[tuple(sorted(changed))].append({f'new_{k}': v for k, v in changed.items()} | {'_id': row.id})
+        result.updated_count += 1
+
+    if inserts:
+        _insert_batch(inserts)
+        result.success_count += len(inserts)
+    now = datetime.utcnow()
+    for columns, rows in updates.items():
+        stmt = (table.update()
+                .where(table.c.id == db.bindparam('_id'))
+                .values({name: db.bindparam(f'new_{name}') for name in columns} | {'updated_at': now}))
+        conn.execute(stmt, rows)
+    if stage_changes:
+        conn.execute(OpportunityUpdate.__table__.insert(), stage_changes)
+    if product_changes:
+        links = OpportunityProduct.__table__
+        conn.execute(links.delete().where(links.c.opportunity_id.in_(list(product_changes))))
+        new_links = [{'opportunity_id': opp_id, 'product': product}
+                     for opp_id, products in product_changes.items()
+                     for product in products]
+        if new_links:
+            conn.execute(links.insert(), new_links)
+
+
+def import_opportunities_csv(stream, batch_size=IMPORT_BATCH_SIZE, on_error=None, on_progress=None,
+                             upsert=False):
+    """Stream opportunities from a CSV upload into the database.
+
+    Valid rows are inserted in batches of ``batch_size``, or merged into
+    matching existing rows when ``upsert`` is set. Invalid rows are skipped
+    and passed to ``on_error(row_number, message)``, or collected in the
+    result's ``errors`` when no callback is given. ``on_progress(result)``
+    runs after every batch. The caller owns the transaction.
+    """
+    def write_batch(batch, result):
+        if upsert:
+            _upsert_batch(batch, result)
+        else:
+            _insert_batch(batch)
+            result.success_count += len(batch)
+
+    return _stream_import(stream, parse_opportunity_row, write_batch, batch_size, on_error, on_progress)
+
+
+def _stream_import(stream, parse_row, write_batch, batch_size, on_error, on_progress):
+    """Parse rows off ``stream`` and hand them to ``write_batch(batch, result)`` in batches."""
+    members = member_lookup()
+    result = ImportResult()
+    batch = []
+
+    def flush():
+        if batch:
+            write_batch(batch, result)
+        batch.clear()
+        if on_progress:
+            on_progress(result)
+
+    for i, row in read_csv_rows(stream):
+        result.rows_processed += 1
+        try:
+            batch.append(parse_row(row, members))
+        except RowError as e:
+            result.error_count += 1
+            if on_error:
+                on_error(i, str(e))
+            else:
+                result.errors.append(f"Row {i}: {e}")
+        if result.rows_processed % batch_size == 0:
+            flush()
+    flush()
+    return result
+
+
+class ImportColumn:
+    """One column of a generic CSV import and how to turn its text into a model value.
+
+    ``parse`` receives the stripped, non-empty cell text and may raise
+    ValueError; blank cells get ``default``. A ``member`` column holds an SE
+    name and is resolved to ``team_member_id``.
+    """
+
+    def __init__(self, name, parse=None, required=False, default='', member=False):
+        self.name = name
+        self.parse = parse
+        self.required = required
+        self.default = default
+        self.member = member
+
+
+class ImportSpec:
+    """A model and the CSV columns a generic import fills in for it.
+
+    ``after_insert(conn, ids, rows)``, if given, runs after each batch with
+    the new row ids, for derived data the ORM events would normally maintain.
+    """
+
+    def __init__(self, model, label, columns, after_insert=None):
+        self.model = model
+        self.label = label
+        self.columns = columns
+        self.after_insert = after_insert
+
+    @property
+    def column_names(self):
+        return [column.name for column in self.columns]
+
+    @property
+    def required_columns(self):
+        return [column.name for column in self.columns if column.required]
+
+    def parse_row(self, row, members):
+        """Validate one CSV row and return its column values; raises RowError."""
+        values = {}
+        missing = []
+        for column in self.columns:
+            raw = (row.get(column.name) or '').strip()
+            attr = 'team_member_id' if column.member else column.name
+            if not raw:
+                if column.required:
+                    missing.append(column.name)
+                values[attr] = column.default
+            elif column.member:
+                values[attr] = members.get(raw.lower())
+                if not values[attr]:
+                    raise RowError(f"SE name '{raw}' not found")
+            elif column.parse:
+                try:
+                    values[attr] = column.parse(raw)
+                except (ValueError, TypeError, OverflowError):
+                    raise RowError(f"invalid {column.name} '{raw}'")
+            else:
+                values[attr] = raw
+        if missing:
+            raise RowError(f"missing required field(s): {', '.join(missing)}")
+        return values
+
+
+def _choice(choices, default):
+    """Parser that matches ``choices`` case-insensitively, falling back to ``default``."""
+    lookup = {choice.lower(): choice for choice in choices}
+    return lambda value: lookup.get(value.lower(), default)
+
+
+def _yes_no(value):
+    return 'Y' if value.upper() in ('Y', 'YES', 'TRUE', '1') else 'N'
+
+
+def _index_imported_notes(conn, ids, rows):
+    index_notes(conn, [SimpleNamespace(id=note_id, **values) for note_id, values in zip(ids, rows)])
+    set_note_tags(conn, {note_id: values['tags'] for note_id, values in zip(ids, rows) if values['tags']})
+
+
+# Keyed by the list page endpoint each import returns to
+CSV_IMPORTS = {
+    'support_cases': ImportSpec(SupportCase, 'Support Cases', [
+        ImportColumn('title', required=True),
+        ImportColumn('se_name', required=True, member=True),
+        ImportColumn('description'),
+        ImportColumn('status', _choice(CASE_STATUSES, 'Open'), default='Open'),
+        ImportColumn('priority', _choice(PRIORITIES, 'Medium'), default='Medium'),
+        ImportColumn('customer'),
+        ImportColumn('case_number'),
+        ImportColumn('escalated', _yes_no, default='N'),
+        ImportColumn('opportunity'),
+        ImportColumn('product'),
+        ImportColumn('customer_email'),
+        ImportColumn('created_at', parse_csv_datetime, default=None),
+        ImportColumn('resolved_at', parse_csv_datetime, default=None),
+    ]),
+    'follow_ups': ImportSpec(FollowUp, 'Follow-ups', [
+        ImportColumn('title', required=True),
+        ImportColumn('due_date', parse_csv_date, required=True),
+        ImportColumn('se_name', member=True, default=None),
+        ImportColumn('description'),
+        ImportColumn('status', _choice(FOLLOWUP_STATUSES, 'Pending'), default='Pending'),
+        ImportColumn('priority', _choice(PRIORITIES, 'Medium'), default='Medium'),
+        ImportColumn('related_type'),
+        ImportColumn('related_id', int, default=None),
+        ImportColumn('created_at', parse_csv_datetime, default=None),
+    ]),
+    'notes': ImportSpec(Note, 'Notes', [
+        ImportColumn('title', required=True),
+        ImportColumn('se_name', member=True, default=None),
+        ImportColumn('content'),
+        ImportColumn('tags'),
+        ImportColumn('created_at', parse_csv_datetime, default=None),
+    ], after_insert=_index_imported_notes),
+    'one_on_ones': ImportSpec(OneOnOne, '1-1 Meetings', [
+        ImportColumn('se_name', required=True, member=True),
+        ImportColumn('date', parse_csv_date, required=True),
+        ImportColumn('notes'),
+        ImportColumn('action_items'),
+        ImportColumn('mood', _choice(MOODS, ''), default=''),
+    ]),
+}
+
+
+def import_records_csv(kind, stream, batch_size=IMPORT_BATCH_SIZE, on_error=None, on_progress=None):
+    """Stream rows for one of the CSV_IMPORTS specs into the database.
+
+    Rows are validated against the spec and inserted in batches with one
+    executemany each. Error and progress callbacks work as for
+    import_opportunities_csv. The caller owns the transaction.
+    """
+    spec = CSV_IMPORTS[kind]
+    table = spec.model.__table__
+    now = datetime.utcnow()
+
+    def write_batch(batch, result):
+        for values in batch:
+            # A blank created_at column would otherwise be stored as NULL
+            if 'created_at' in table.c and values.get('created_at') is None:
+                values['created_at'] = now
+        conn = db.session.connection()
+        ids = _insert_rows(conn, table, batch)
+        if spec.after_insert:
+            spec.after_insert(conn, ids, batch)
+        result.success_count += len(batch)
+
+    return _stream_import(stream, spec.parse_row, write_batch, batch_size, on_error, on_progress)
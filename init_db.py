@@ -42,10 +42,10 @@ def init_database():
 
         # Add sample opportunities
         opportunities = [
-            Opportunity(name="Acme Corp Enterprise Deal", account="Acme Corporation", stage="POC", value=150000, team_member_id=1, close_date=date.today() + timedelta(days=30)),
-            Opportunity(name="TechStart Expansion", account="TechStart Inc", stage="Demo", value=75000, team_member_id=1, close_date=date.today() + timedelta(days=45)),
-            Opportunity(name="Global Bank Platform", account="Global Bank", stage="Negotiation", value=500000, team_member_id=2, close_date=date.today() + timedelta(days=15)),
-            Opportunity(name="Retail Plus Integration", account="Retail Plus", stage="Prospecting", value=50000, team_member_id=3, close_date=date.today() + timedelta(days=60)),
+            Opportunity(name="Acme Corp Enterprise Deal", account="Acme Corporation", stage="4", value=150000, team_member_id=1, close_date=date.today() + timedelta(days=30)),
+            Opportunity(name="TechStart Expansion", account="TechStart Inc", stage="3", value=75000, team_member_id=1, close_date=date.today() + timedelta(days=45)),
+            Opportunity(name="Global Bank Platform", account="Global Bank", stage="5", value=500000, team_member_id=2, close_date=date.today() + timedelta(days=15)),
+            Opportunity(name="Retail Plus Integration", account="Retail Plus", stage="1", value=50000, team_member_id=3, close_date=date.today() + timedelta(days=60)),
         ]
         for opp in opportunities:
             db.session.add(opp)
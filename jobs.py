@@ -0,0 +1,270 @@
+"""Background CSV import jobs.
+
+Uploads are saved to the instance folder and processed on a small thread
+pool so the request returns immediately. Job state lives in the import_jobs
+table, committed after every batch, so any request (or process) can report
+progress and the job outlives the page that started it. Atomic jobs instead
+run in a single transaction, which holds SQLite's write lock until it ends,
+so their progress can't be written anywhere another process could read it
+meanwhile. It is kept in the running process's memory instead: polls served
+by that process see live counts, and polls served by any other process get
+None counts, shown as "in progress", until the job finishes. Rows that fail validation are written to a per-job error
+CSV, created with the first error, instead of a flash message. Finished jobs
+and their error files are pruned after IMPORT_JOB_TTL.
+
+Like report jobs, import jobs carry the PROCESS_TOKEN of the process running
+them, and a heartbeat thread refreshes heartbeat_at while that process has
+unfinished jobs. prune_import_jobs() fails a queued or running job whose
+heartbeat has stopped, since its process died without finishing it, and
+deletes the upload it left behind.
+"""
+
+import csv
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+from models import db, ImportJob, PROCESS_TOKEN
+from kpis import invalidate_dashboard
+from metrics import observe_import
+from profiles import invalidate_member_profiles
+
+JOB_FINAL_STATUSES = ['Completed', 'Failed']
+JOB_ACTIVE_STATUSES = ['Queued', 'Running']
+# Finished jobs and their error files are kept this long
+IMPORT_JOB_TTL = timedelta(days=7)
+# Seconds between heartbeats, and how long an unfinished job may go without one
+IMPORT_JOB_HEARTBEAT = 15
+IMPORT_JOB_HEARTBEAT_TIMEOUT = timedelta(minutes=1)
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_heartbeat = None
+_lock = threading.Lock()
+# Live counts for atomic jobs, whose rows can't be committed mid-import
+_progress = {}
+
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=app.config.get('IMPORT_WORKERS', 2),
+                                       thread_name_prefix='import-job')
+    return _executor
+
+
+def job_dir(app):
+    path = os.path.join(app.instance_path, 'import_jobs')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def upload_path(app, job_id):
+    return os.path.join(job_dir(app), f'{job_id}.csv')
+
+
+def error_file_path(app, job_id):
+    return os.path.join(job_dir(app), f'{job_id}_errors.csv')
+
+
+def _remove_files(app, job_id):
+    for path in (upload_path(app, job_id), error_file_path(app, job_id)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _beat(app):
+    """Refresh this process's unfinished jobs until it has none left."""
+    global _heartbeat
+    while True:
+        time.sleep(IMPORT_JOB_HEARTBEAT)
+        try:
+            with app.app_context(), _lock:
+                beating = db.session.execute(
+                    db.update(ImportJob)
+                    .where(ImportJob.owner == PROCESS_TOKEN, ImportJob.status.in_(JOB_ACTIVE_STATUSES))
+                    .values(heartbeat_at=datetime.utcnow())).rowcount
+                db.session.commit()
+                if not beating:
+                    _heartbeat = None
+                    return
+        except OperationalError:
+            # An atomic import holds the write lock; nothing else can expire its job meanwhile
+            logger.debug('Import job heartbeat skipped', exc_info=True)
+        except Exception:
+            logger.exception('Import job heartbeat failed')
+
+
+def _start_heartbeat(app):
+    global _heartbeat
+    with _lock:
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_beat, args=(app,), name='import-heartbeat', daemon=True)
+            _heartbeat.start()
+
+
+def _expire_stale_jobs(app):
+    """Fail unfinished jobs whose process stopped sending heartbeats, and delete their uploads."""
+    stale = (db.func.coalesce(ImportJob.heartbeat_at, ImportJob.created_at)
+             < datetime.utcnow() - IMPORT_JOB_HEARTBEAT_TIMEOUT)
+    if not db.session.query(ImportJob.id).filter(ImportJob.status.in_(JOB_ACTIVE_STATUSES), stale).first():
+        return
+    try:
+        # Conditional on the status so a job that finished meanwhile is left alone
+        expired = db.session.execute(
+            db.update(ImportJob)
+            .where(ImportJob.status.in_(JOB_ACTIVE_STATUSES), stale)
+            .values(status='Failed', finished_at=datetime.utcnow(),
+                    message='Import was interrupted by a restart before it finished. Rows from batches'
+                            ' saved before then have been kept.')
+            .returning(ImportJob.id)).scalars().all()
+        db.session.commit()
+    except OperationalError:
+        # Locked by a running atomic import; try again on the next prune
+        db.session.rollback()
+        return
+    for job_id in expired:
+        if os.path.exists(upload_path(app, job_id)):
+            os.remove(upload_path(app, job_id))
+
+
+def prune_import_jobs(app):
+    """Fail abandoned jobs, then delete finished jobs older than IMPORT_JOB_TTL and their files."""
+    _expire_stale_jobs(app)
+    old = ImportJob.query.filter(ImportJob.status.in_(JOB_FINAL_STATUSES),
+                                 ImportJob.created_at < datetime.utcnow() - IMPORT_JOB_TTL).all()
+    for job in old:
+        _remove_files(app, job.id)
+        db.session.delete(job)
+    db.session.commit()
+
+
+def submit_import(app, kind, file, import_func, atomic=False):
+    """Save an uploaded file and queue ``import_func(stream, **callbacks)`` for it.
+
+    Returns the new ImportJob. ``import_func`` must accept the ``on_error`` and
+    ``on_progress`` keyword arguments used by importer.import_opportunities_csv.
+    With ``atomic`` the whole file is written in one transaction, so a failure
+    part way through leaves nothing behind.
+    """
+    prune_import_jobs(app)
+    now = datetime.utcnow()
+    job = ImportJob(id=uuid.uuid4().hex, kind=kind, filename=file.filename, status='Queued', atomic=atomic,
+                    owner=PROCESS_TOKEN, created_at=now, heartbeat_at=now)
+    file.save(upload_path(app, job.id))
+    db.session.add(job)
+    db.session.commit()
+    _start_heartbeat(app)
+    _get_executor(app).submit(_run_import, app, job.id, import_func, atomic)
+    return job
+
+
+def _set_counts(job, result):
+    job.rows_processed = result.rows_processed
+    job.success_count = result.success_count
+    job.updated_count = result.updated_count
+    job.unchanged_count = result.unchanged_count
+    job.duplicate_count = result.duplicate_count
+    job.error_count = result.error_count
+
+
+class _ErrorFile:
+    """A job's error CSV, only created once there is an error to write."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.writer = None
+
+    def write(self, row, message):
+        if self.file is None:
+            self.file = open(self.path, 'w', newline='', encoding='utf-8')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(['row', 'error'])
+        self.writer.writerow([row, message])
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def _run_import(app, job_id, import_func, atomic):
+    with app.app_context():
+        job = db.session.get(ImportJob, job_id)
+        job.status = 'Running'
+        job.started_at = datetime.utcnow()
+        db.session.commit()
+
+        def on_progress(result):
+            if atomic:
+                _progress[job_id] = result
+                return
+            # Committing per batch publishes progress and releases the write lock
+            _set_counts(job, result)
+            db.session.commit()
+
+        path = upload_path(app, job_id)
+        error_file = _ErrorFile(error_file_path(app, job_id))
+        try:
+            with open(path, 'rb') as upload:
+                result = import_func(upload, on_error=error_file.write, on_progress=on_progress)
+            _set_counts(job, result)
+            job.status = 'Completed'
+            if not result.rows_processed:
+                job.message = 'CSV file was empty or had no data rows.'
+        except Exception as e:
+            db.session.rollback()
+            job.status = 'Failed'
+            job.message = f'Import failed: {e}'
+            if atomic:
+                job.message += ' (no rows were imported)'
+                job.success_count = 0
+            else:
+                # The rollback reloaded the counts of the last committed batch
+                saved = (job.success_count or 0) + (job.updated_count or 0)
+                job.message += (f' ({saved} of the first {job.rows_processed or 0} rows were saved before the'
+                                f' failure and have been kept, so importing the whole file again would'
+                                f' duplicate them)')
+        finally:
+            error_file.close()
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            observe_import(job.kind, job.status, (job.finished_at - job.started_at).total_seconds(), job)
+            _progress.pop(job_id, None)
+            os.remove(path)
+            invalidate_dashboard()
+            invalidate_member_profiles()
+            db.session.remove()
+
+
+COUNT_FIELDS = ['rows_processed', 'success_count', 'updated_count', 'unchanged_count', 'duplicate_count',
+                'error_count']
+
+
+def job_status(job):
+    """JSON-friendly view of a job's progress.
+
+    The counts and rows_per_second are None for a running atomic job in
+    another process, whose progress isn't visible until it finishes.
+    """
+    finished = job.status in JOB_FINAL_STATUSES
+    live = _progress.get(job.id) if not finished else None
+    status = {'id': job.id, 'kind': job.kind, 'filename': job.filename, 'status': job.status}
+    if job.atomic and job.status == 'Running' and live is None:
+        status.update(dict.fromkeys(COUNT_FIELDS), rows_per_second=None)
+    else:
+        counts = live or job
+        status.update({field: getattr(counts, field) or 0 for field in COUNT_FIELDS})
+        status['rows_per_second'] = job.rows_per_second
+        if live is not None and job.started_at:
+            elapsed = (datetime.utcnow() - job.started_at).total_seconds()
+            status['rows_per_second'] = round(live.rows_processed / elapsed, 1) if elapsed > 0 else 0
+    status.update(message=job.message, finished=finished)
+    return status
@@ -0,0 +1,108 @@
+"""Dashboard KPI snapshot.
+
+All dashboard counters are computed in one aggregate SELECT and kept in
+process memory along with the short dashboard lists. Write handlers call
+invalidate_dashboard() after they commit, which bumps the cache_versions row
+'dashboard'. Every process compares that version with its own snapshot's on
+each dashboard hit, a primary key read, so a write made by any process
+rebuilds the snapshot everywhere and every other hit is a dictionary read.
+"""
+
+import threading
+from datetime import date
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, TeamMember, OneOnOne, Opportunity, OpportunityProduct, SupportCase, FollowUp, CacheVersion
+
+OPEN_FOLLOWUP_STATUSES = ['Pending', 'In Progress']
+CLOSED_CASE_STATUSES = ['Resolved', 'Closed']
+DASHBOARD_LIST_LIMIT = 5
+CACHE_NAME = 'dashboard'
+
+_lock = threading.Lock()
+_state = {'snapshot': None}
+
+
+def _count(model, *criteria):
+    return db.select(db.func.count(model.id)).where(*criteria).scalar_subquery()
+
+
+def compute_counters():
+    """Return every dashboard counter from a single aggregate query."""
+    stmt = db.select(
+        _count(TeamMember).label('team_count'),
+        _count(Opportunity, Opportunity.pov_status == 'Active').label('live_povs'),
+        _count(Opportunity, Opportunity.stage != '6').label('open_opps'),
+        _count(SupportCase, ~SupportCase.status.in_(CLOSED_CASE_STATUSES)).label('open_cases'),
+        _count(FollowUp, FollowUp.status.in_(OPEN_FOLLOWUP_STATUSES)).label('pending_followups'),
+    )
+    return dict(db.session.execute(stmt).one()._mapping)
+
+
+def compute_product_pipeline():
+    """Return open opportunity count and value per product, keyed by product code."""
+    stmt = (db.select(OpportunityProduct.product,
+                      db.func.count(Opportunity.id).label('count'),
+                      db.func.coalesce(db.func.sum(Opportunity.value), 0).label('value'))
+            .join(Opportunity, Opportunity.id == OpportunityProduct.opportunity_id)
+            .where(Opportunity.stage != '6')
+            .group_by(OpportunityProduct.product))
+    return {row.product: {'count': row.count, 'value': row.value} for row in db.session.execute(stmt)}
+
+
+def _follow_up_rows(*criteria, limit=None):
+    stmt = (db.select(FollowUp.id, FollowUp.title, FollowUp.due_date, FollowUp.priority,
+                      TeamMember.name.label('member_name'))
+            .outerjoin(TeamMember, FollowUp.team_member_id == TeamMember.id)
+            .where(FollowUp.status.in_(OPEN_FOLLOWUP_STATUSES), *criteria)
+            .order_by(FollowUp.due_date, FollowUp.id)
+            .limit(limit))
+    return [dict(row._mapping) for row in db.session.execute(stmt)]
+
+
+def _build_snapshot(today):
+    snapshot = compute_counters()
+    snapshot['as_of'] = today
+    snapshot['product_pipeline'] = compute_product_pipeline()
+    snapshot['overdue_followups'] = _follow_up_rows(FollowUp.due_date < today)
+    snapshot['upcoming_followups'] = _follow_up_rows(limit=DASHBOARD_LIST_LIMIT)
+    recent = (db.select(OneOnOne.id, OneOnOne.date, OneOnOne.mood,
+                        TeamMember.name.label('member_name'))
+              .join(TeamMember, OneOnOne.team_member_id == TeamMember.id)
+              .order_by(OneOnOne.date.desc(), OneOnOne.id.desc())
+              .limit(DASHBOARD_LIST_LIMIT))
+    snapshot['recent_one_on_ones'] = [dict(row._mapping) for row in db.session.execute(recent)]
+    return snapshot
+
+
+def _stored_version():
+    version = db.session.execute(
+        db.select(CacheVersion.version).where(CacheVersion.name == CACHE_NAME)).scalar()
+    return version or 0
+
+
+def get_dashboard_snapshot():
+    """Return the cached dashboard snapshot, rebuilding it if stale."""
+    today = date.today()
+    version = _stored_version()
+    snapshot = _state['snapshot']
+    # Overdue items depend on the date, so a new day forces a rebuild
+    if snapshot is not None and snapshot['version'] == version and snapshot['as_of'] == today:
+        return snapshot
+
+    # Built after reading the version, so a write that lands meanwhile
+    # leaves this copy one version behind and it is rebuilt on the next hit
+    snapshot = _build_snapshot(today)
+    snapshot['version'] = version
+    with _lock:
+        _state['snapshot'] = snapshot
+    return snapshot
+
+
+def invalidate_dashboard():
+    """Mark every process's snapshot stale after a committed write to any dashboard table."""
+    stmt = sqlite_insert(CacheVersion.__table__).values(name=CACHE_NAME, version=1)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['name'], set_={'version': CacheVersion.__table__.c.version + 1}))
+    db.session.commit()
@@ -0,0 +1,272 @@
+"""Prometheus metrics for the /metrics endpoint.
+
+Metrics live in process memory and are rendered in the Prometheus text
+format, so each worker process exposes its own series. Request hooks time
+every request by endpoint and track how many are in flight. Pool gauges are
+read from the engine's pool at scrape time, and MeteredQueuePool times how
+long each checkout waits for a connection. Import jobs and report builds
+record themselves through observe_import(), CSV reports through the
+timed_report decorator and PDFs rendered by a report worker process through
+observe_report().
+Table row counts come from table_row_counts, which triggers keep current on
+every write, so a scrape never counts a table.
+"""
+
+import functools
+import threading
+import time
+
+from flask import Response, g, request
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from models import db, ReportJob, TableRowCount
+
+PREFIX = 'se_team_'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+JOB_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+SIZE_BUCKETS = tuple(2 ** n * 1024 for n in range(0, 18, 2))
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.label_names)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f'{self.name}{_labels(self.label_names, key)} {_number(value)}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # [count per bucket..., count above the last bucket, sum]
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            else:
+                state[len(self.buckets)] += 1
+            state[-1] += value
+
+    def render(self):
+        # Copy under the lock so a bucket and its _count can't disagree
+        with self._lock:
+            snapshot = {key: list(state) for key, state in self._values.items()}
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for key, state in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), state):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, key, [("le", bound)])} {cumulative}')
+            labels = _labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {_number(state[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'Request latency by endpoint.',
+                             ['endpoint', 'method'])
+REQUESTS = Counter('http_requests_total', 'Requests handled, by endpoint and status.',
+                   ['endpoint', 'method', 'status'])
+IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests currently being handled.')
+POOL_WAIT = Histogram('db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection.',
+                      buckets=POOL_WAIT_BUCKETS)
+POOL_TIMEOUTS = Counter('db_pool_checkout_timeouts_total', 'Checkouts that gave up waiting for a connection.')
+IMPORTS = Counter('imports_total', 'Finished CSV import jobs.', ['kind', 'status'])
+IMPORT_DURATION = Histogram('import_duration_seconds', 'CSV import job run time.', ['kind'],
+                            buckets=JOB_BUCKETS)
+IMPORT_ROWS = Counter('import_rows_total', 'CSV rows processed by import jobs, by outcome.', ['kind', 'outcome'])
+REPORT_BUILDS = Counter('report_builds_total', 'Report builds, by format and status.', ['format', 'status'])
+REPORT_DURATION = Histogram('report_build_duration_seconds', 'Report build time.', ['format'],
+                            buckets=JOB_BUCKETS)
+REPORT_SIZE = Histogram('report_size_bytes', 'Size of built reports.', ['format'], buckets=SIZE_BUCKETS)
+REPORT_QUEUE_WAIT = Histogram('report_queue_wait_seconds', 'Time report jobs waited for a worker process.',
+                              buckets=JOB_BUCKETS)
+
+IN_FLIGHT.inc(0)
+POOL_TIMEOUTS.inc(0)
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - started)
+
+
+def observe_import(kind, status, seconds, job):
+    """Record a finished import job and its row counts."""
+    IMPORTS.inc(kind=kind, status=status)
+    IMPORT_DURATION.observe(seconds, kind=kind)
+    for outcome, count in (('created', job.success_count), ('updated', job.updated_count),
+                           ('unchanged', job.unchanged_count), ('duplicate', job.duplicate_count),
+                           ('error', job.error_count)):
+        if count:
+            IMPORT_ROWS.inc(count, kind=kind, outcome=outcome)
+
+
+def observe_report(report_format, status, seconds, size, waited=None):
+    """Record a finished report build and, for a queued job, its wait for a worker."""
+    REPORT_BUILDS.inc(format=report_format, status=status)
+    REPORT_DURATION.observe(seconds, format=report_format)
+    if status == 'ok':
+        REPORT_SIZE.observe(size, format=report_format)
+    if waited is not None:
+        REPORT_QUEUE_WAIT.observe(waited)
+
+
+def timed_report(report_format):
+    """Decorate a report builder, a generator of byte chunks, to count, time and size its runs.
+
+    A run is timed until its last chunk has been sent.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def stream(*args, **kwargs):
+            started = time.perf_counter()
+            status, size = 'error', 0
+            try:
+                for chunk in func(*args, **kwargs):
+                    size += len(chunk)
+                    yield chunk
+                status = 'ok'
+            finally:
+                observe_report(report_format, status, time.perf_counter() - started, size)
+        return stream
+    return decorator
+
+
+def _gauge_lines(name, help, samples, label_names=()):
+    """Lines for a gauge read at scrape time from [(label values, value)]."""
+    lines = [f'# HELP {PREFIX}{name} {help}', f'# TYPE {PREFIX}{name} gauge']
+    lines.extend(f'{PREFIX}{name}{_labels(label_names, values)} {value}' for values, value in samples)
+    return lines
+
+
+def _pool_lines():
+    pool = db.engine.pool
+    if not isinstance(pool, QueuePool):
+        return []
+    lines = []
+    for name, help, value in (('db_pool_size', 'Connections the pool keeps open.', pool.size()),
+                              ('db_pool_checked_out', 'Connections in use.', pool.checkedout()),
+                              ('db_pool_checked_in', 'Idle connections in the pool.', pool.checkedin()),
+                              ('db_pool_overflow', 'Connections open beyond the pool size.', max(pool.overflow(), 0))):
+        lines.extend(_gauge_lines(name, help, [((), value)]))
+    return lines
+
+
+def _row_count_lines():
+    rows = db.session.execute(db.select(TableRowCount.table_name, TableRowCount.row_count)
+                              .order_by(TableRowCount.table_name))
+    return _gauge_lines('table_rows', 'Rows in each main table.', [((table,), count) for table, count in rows],
+                        ('table',))
+
+
+def _report_queue_lines():
+    queued = db.session.execute(db.select(db.func.count()).where(ReportJob.status == 'Queued')).scalar()
+    return _gauge_lines('report_jobs_queued', 'Report jobs queued or rendering.', [((), queued)])
+
+
+def render_metrics():
+    """The /metrics response body."""
+    lines = []
+    for metric in (REQUEST_DURATION, REQUESTS, IN_FLIGHT, POOL_WAIT, POOL_TIMEOUTS,
+                   IMPORTS, IMPORT_DURATION, IMPORT_ROWS, REPORT_BUILDS, REPORT_DURATION, REPORT_SIZE,
+                   REPORT_QUEUE_WAIT):
+        lines.extend(metric.render())
+    lines.extend(_pool_lines())
+    lines.extend(_report_queue_lines())
+    lines.extend(_row_count_lines())
+    return Response('\n'.join(lines) + '\n', content_type=CONTENT_TYPE)
+
+
+def _begin_request():
+    g.metrics_started = time.perf_counter()
+    IN_FLIGHT.inc()
+
+
+def _record_request(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+
+def _end_request(error):
+    if g.pop('metrics_started', None) is not None:
+        IN_FLIGHT.dec()
+
+
+def init_metrics(app):
+    """Record request metrics for every request handled by ``app``."""
+    app.before_request(_begin_request)
+    app.after_request(_record_request)
+    app.teardown_request(_end_request)
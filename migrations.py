@@ -0,0 +1,236 @@
+"""Versioned schema migrations.
+
+MIGRATIONS is an ordered list of (version, step) pairs. run_migrations()
+applies the steps newer than the highest version recorded in schema_version,
+recording each one as it commits, so a database that is already current
+costs a single primary key read at startup. Missing tables are created with
+db.create_all() only when there is something to apply, so adding a model
+needs a migration step too (one that calls db.create_all() will do). Steps
+must be idempotent: a database that predates schema_version replays all of them
+once, and two processes starting together may both run the same step.
+"""
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+
+from models import db, OpportunityProduct, Note, NoteTag, SchemaVersion, ROW_COUNT_TABLES, row_count_ddl
+from search import rebuild_notes_index
+from tags import rebuild_tag_index
+
+# Old text stages and the numeric stage each maps to
+LEGACY_STAGES = {
+    'Prospecting': '1', 'Qualification': '2', 'Demo': '3',
+    'POC': '4', 'Negotiation': '5', 'Closed Won': '6', 'Closed Lost': '6',
+}
+
+
+def _add_columns(table, columns):
+    """ALTER ``table`` to add any missing {name: sql type} columns; return the names added."""
+    inspector = db.inspect(db.session.connection())
+    if not inspector.has_table(table):
+        return []
+    existing = {col['name'] for col in inspector.get_columns(table)}
+    added = [name for name in columns if name not in existing]
+    for name in added:
+        db.session.execute(db.text(f'ALTER TABLE {table} ADD COLUMN {name} {columns[name]}'))
+    return added
+
+
+def _create_indexes(*names):
+    """Create the named indexes, as declared on the models, if they don't exist."""
+    conn = db.session.connection()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in names:
+                index.create(conn, checkfirst=True)
+
+
+def add_opportunity_columns():
+    added = _add_columns('opportunities', {
+        'salesforce_link': 'VARCHAR(500)',
+        'confidence': 'INTEGER',
+        'sales_rep': 'VARCHAR(100)',
+        'products': 'VARCHAR(500)',
+        'rfp': 'VARCHAR(1)',
+        'demo': 'VARCHAR(1)',
+        'pov_status': 'VARCHAR(20)',
+        'latest_update_date': 'DATE',
+        'latest_update_notes': 'TEXT',
+        'competitive': 'VARCHAR(1)',
+        'competitive_notes': 'TEXT',
+    })
+    if 'pov_status' in added:
+        db.session.execute(db.text("UPDATE opportunities SET pov_status = 'None' WHERE pov_status IS NULL"))
+
+
+def renumber_opportunity_stages():
+    opportunities = db.table('opportunities', db.column('stage'))
+    db.session.execute(opportunities.update()
+                       .where(opportunities.c.stage.in_(list(LEGACY_STAGES)))
+                       .values(stage=db.case(LEGACY_STAGES, value=opportunities.c.stage)))
+
+
+def add_support_case_columns():
+    _add_columns('support_cases', {
+        'case_number': 'VARCHAR(50)',
+        'escalated': 'VARCHAR(1)',
+        'opportunity': 'VARCHAR(200)',
+        'product': 'VARCHAR(100)',
+        'customer_email': 'VARCHAR(200)',
+    })
+
+
+def add_team_member_columns():
+    _add_columns('team_members', {
+        'aligned_rep_3': 'VARCHAR(100)',
+        'aligned_rep_4': 'VARCHAR(100)',
+        'location': 'VARCHAR(100)',
+        'aligned_rep_location': 'VARCHAR(100)',
+        'aligned_rep_2_location': 'VARCHAR(100)',
+        'aligned_rep_3_location': 'VARCHAR(100)',
+        'aligned_rep_4_location': 'VARCHAR(100)',
+        'category': "VARCHAR(50) DEFAULT 'Solution Engineers'",
+        'show_in_one_on_ones': "VARCHAR(1) DEFAULT 'Y'",
+    })
+
+
+def backfill_opportunity_products():
+    if db.session.query(OpportunityProduct.opportunity_id).first():
+        return
+    rows = db.session.execute(
+        db.text("SELECT id, products FROM opportunities WHERE products IS NOT NULL AND products != ''")
+    ).all()
+    links = [{'opportunity_id': opp_id, 'product': product}
+             for opp_id, products in rows
+             for product in dict.fromkeys(p.strip() for p in products.split(',') if p.strip())]
+    if links:
+        db.session.execute(db.insert(OpportunityProduct), links)
+
+
+def backfill_notes_fts():
+    if (db.session.execute(db.text('SELECT COUNT(*) FROM notes_fts')).scalar() == 0
+            and db.session.query(Note.id).first()):
+        rebuild_notes_index(db.session.connection())
+
+
+def backfill_note_tags():
+    if (not db.session.query(NoteTag.note_id).first()
+            and db.session.query(Note.id).filter(Note.tags.is_not(None), Note.tags != '').first()):
+        rebuild_tag_index(db.session.connection())
+
+
+def add_upsert_match_indexes():
+    _create_indexes('ix_opportunities_salesforce_link', 'ix_opportunities_account_name')
+
+
+def add_member_profile_indexes():
+    _create_indexes('ix_one_on_ones_member_date', 'ix_opportunities_member_stage',
+                    'ix_support_cases_member_status', 'ix_follow_ups_member_status',
+                    'ix_notes_member_created')
+
+
+def add_import_job_counters():
+    _add_columns('import_jobs', {'updated_count': 'INTEGER DEFAULT 0', 'unchanged_count': 'INTEGER DEFAULT 0'})
+
+
+def add_secondary_indexes():
+    _create_indexes('ix_opportunities_stage', 'ix_opportunities_pov_status',
+                    'ix_opportunity_updates_opportunity', 'ix_support_cases_status',
+                    'ix_support_case_comments_case', 'ix_follow_ups_status_due', 'ix_follow_ups_due_date')
+
+
+def add_list_order_indexes():
+    _create_indexes('ix_one_on_ones_date', 'ix_opportunities_updated', 'ix_support_cases_priority',
+                    'ix_support_cases_created', 'ix_follow_ups_priority', 'ix_notes_created',
+                    'ix_import_jobs_kind')
+
+
+def add_table_row_counts():
+    # create_all() has made the table; seed it and add the triggers for existing data
+    for table in ROW_COUNT_TABLES:
+        for statement in row_count_ddl(table):
+            db.session.execute(db.text(statement))
+
+
+def add_report_definitions():
+    db.create_all()
+
+
+def add_report_date_indexes():
+    _create_indexes('ix_opportunities_close_date', 'ix_support_cases_resolved')
+
+
+def add_report_jobs():
+    db.create_all()
+
+
+def add_import_job_status_index():
+    _create_indexes('ix_import_jobs_status')
+
+
+def add_import_job_duplicate_count():
+    _add_columns('import_jobs', {'duplicate_count': 'INTEGER DEFAULT 0'})
+
+
+def add_report_job_heartbeat():
+    _add_columns('report_jobs', {'owner': 'VARCHAR(32)', 'heartbeat_at': 'DATETIME'})
+
+
+def add_import_job_heartbeat():
+    _add_columns('import_jobs', {'owner': 'VARCHAR(32)', 'heartbeat_at': 'DATETIME'})
+
+
+def add_import_job_atomic():
+    _add_columns('import_jobs', {'atomic': 'BOOLEAN DEFAULT 0'})
+
+
+MIGRATIONS = [
+    (1, add_opportunity_columns),
+    (2, renumber_opportunity_stages),
+    (3, add_support_case_columns),
+    (4, add_team_member_columns),
+    (5, backfill_opportunity_products),
+    (6, backfill_notes_fts),
+    (7, backfill_note_tags),
+    (8, add_upsert_match_indexes),
+    (9, add_member_profile_indexes),
+    (10, add_import_job_counters),
+    (11, add_secondary_indexes),
+    (12, add_list_order_indexes),
+    (13, add_table_row_counts),
+    (14, add_report_definitions),
+    (15, add_report_date_indexes),
+    (16, add_report_jobs),
+    (17, add_import_job_status_index),
+    (18, add_import_job_duplicate_count),
+    (19, add_report_job_heartbeat),
+    (20, add_import_job_heartbeat),
+    (21, add_import_job_atomic),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version():
+    """Highest applied migration version, 0 for a database that predates them."""
+    return db.session.execute(db.select(db.func.max(SchemaVersion.version))).scalar() or 0
+
+
+def run_migrations():
+    """Create missing tables and apply pending migrations in order."""
+    try:
+        current = schema_version()
+    except OperationalError:
+        # No schema_version table: a new database, or one from before migrations
+        db.session.rollback()
+        current = 0
+    if current >= LATEST_VERSION:
+        return
+    db.create_all()
+    for version, step in MIGRATIONS:
+        if version <= current:
+            continue
+        step()
+        db.session.execute(sqlite_insert(SchemaVersion.__table__)
+                           .values(version=version, name=step.__name__)
+                           .on_conflict_do_nothing())
+        db.session.commit()
@@ -1,8 +1,49 @@
+import uuid
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, timedelta
 
 db = SQLAlchemy()
 
+# Identifies this process's background jobs; unlike a pid it is never reused
+PROCESS_TOKEN = uuid.uuid4().hex
+
+REGIONS = ['East', 'Central', 'West', 'Global']
+OPPORTUNITY_STAGES = ['1', '2', '3', '4', '5', '6']
+CASE_STATUSES = ['Open', 'In Progress', 'Pending', 'Resolved', 'Closed']
+PRIORITIES = ['High', 'Medium', 'Low']
+FOLLOWUP_STATUSES = ['Pending', 'In Progress', 'Completed', 'Deferred']
+MOODS = ['Excellent', 'Good', 'Neutral', 'Concerned', 'Needs Attention']
+SKILLS = ['Password Safe', 'EPM Win-Mac', 'EPM-L', 'Remote Support', 'PRA', 'AD Bridge', 'Insights', 'Entitle']
+PROFICIENCY_LEVELS = ["Haven't Started", 'Training', 'Demo Ready', 'POV Ready', 'Expert']
+PRODUCTS = ['EPM', 'EPM-L', 'PWS', 'RS', 'PRA', 'ADB', 'Insights', 'Entitle']
+MEMBER_CATEGORIES = ['Solution Engineers', 'SE Leaders', 'Sales Leaders', 'Sales Reps']
+PRODUCT_ALIASES = {
+    'ppm': 'PWS',
+    'password safe': 'PWS',
+    'workforce passwords': 'PWS',
+    'password safe with pra': 'PWS,PRA',
+    'isi': 'Insights',
+    'identity security insights': 'Insights',
+    'upem': 'EPM-L',
+    'pm for ul servers': 'EPM-L',
+    'pm desktops': 'EPM',
+    'pm for win servers': 'EPM',
+    'remote support': 'RS',
+}
+POV_STATUSES = ['None', 'Active', 'Completed', 'Tech Win']
+# Rolling periods, in days, a saved report can cover
+REPORT_PERIODS = [7, 14, 30, 90]
+
+
+def _owner_column(**kwargs):
+    """team_member_id for records shown on a member's profile.
+
+    active_history loads the previous owner before a reassignment, so the
+    profile cache can drop both members' profiles even when the row was expired.
+    """
+    return db.column_property(db.Column(db.Integer, db.ForeignKey('team_members.id'), **kwargs),
+                              active_history=True)
+
 
 class TeamMember(db.Model):
     __tablename__ = 'team_members'
@@ -37,13 +78,18 @@ class OneOnOne(db.Model):
     __tablename__ = 'one_on_ones'
 
     id = db.Column(db.Integer, primary_key=True)
-    team_member_id = db.Column(db.Integer, db.ForeignKey('team_members.id'), nullable=False)
+    team_member_id = _owner_column(nullable=False)
     date = db.Column(db.Date, nullable=False)
     notes = db.Column(db.Text)
     action_items = db.Column(db.Text)
     mood = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_one_on_ones_member_date', 'team_member_id', 'date'),
+        db.Index('ix_one_on_ones_date', 'date'),
+    )
+
 
 class Opportunity(db.Model):
     __tablename__ = 'opportunities'
@@ -53,7 +99,7 @@ class Opportunity(db.Model):
     account = db.Column(db.String(200), nullable=False)
     stage = db.Column(db.String(50), nullable=False, default='1')
     value = db.Column(db.Float, default=0)
-    team_member_id = db.Column(db.Integer, db.ForeignKey('team_members.id'), nullable=False)
+    team_member_id = _owner_column(nullable=False)
     close_date = db.Column(db.Date)
     salesforce_link = db.Column(db.String(500))
     confidence = db.Column(db.Integer)
@@ -70,6 +116,38 @@ class Opportunity(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     updates = db.relationship('OpportunityUpdate', backref='opportunity', lazy=True, cascade='all, delete-orphan')
+    product_links = db.relationship('OpportunityProduct', backref='opportunity', lazy=True, cascade='all, delete-orphan')
+    # Populated by list queries via with_expression() so rows don't load every update just to count them
+    update_count = db.query_expression()
+
+    # Natural keys an upsert CSV import matches rows on
+    __table_args__ = (
+        db.Index('ix_opportunities_salesforce_link', 'salesforce_link'),
+        db.Index('ix_opportunities_account_name', 'account', 'name'),
+        db.Index('ix_opportunities_member_stage', 'team_member_id', 'stage', 'updated_at'),
+        db.Index('ix_opportunities_stage', 'stage', 'updated_at'),
+        db.Index('ix_opportunities_pov_status', 'pov_status', 'updated_at'),
+        db.Index('ix_opportunities_updated', 'updated_at'),
+        db.Index('ix_opportunities_close_date', 'close_date'),
+    )
+
+    def set_products(self, products):
+        """Store products in the display string and the indexed opportunity_products table."""
+        products = list(dict.fromkeys(p.strip() for p in products if p and p.strip()))
+        self.products = ','.join(products)
+        existing = {link.product: link for link in self.product_links}
+        self.product_links = [existing.get(p) or OpportunityProduct(product=p) for p in products]
+
+
+class OpportunityProduct(db.Model):
+    __tablename__ = 'opportunity_products'
+
+    opportunity_id = db.Column(db.Integer, db.ForeignKey('opportunities.id'), primary_key=True)
+    product = db.Column(db.String(50), primary_key=True)
+
+    __table_args__ = (
+        db.Index('ix_opportunity_products_product', 'product', 'opportunity_id'),
+    )
 
 
 class OpportunityUpdate(db.Model):
@@ -82,6 +160,10 @@ class OpportunityUpdate(db.Model):
     comment = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_opportunity_updates_opportunity', 'opportunity_id', 'created_at'),
+    )
+
 
 class SupportCase(db.Model):
     __tablename__ = 'support_cases'
@@ -91,7 +173,7 @@ class SupportCase(db.Model):
     description = db.Column(db.Text)
     status = db.Column(db.String(50), nullable=False, default='Open')
     priority = db.Column(db.String(20), nullable=False, default='Medium')
-    team_member_id = db.Column(db.Integer, db.ForeignKey('team_members.id'), nullable=False)
+    team_member_id = _owner_column(nullable=False)
     customer = db.Column(db.String(200))
     case_number = db.Column(db.String(50))
     escalated = db.Column(db.String(1), default='N')
@@ -103,6 +185,14 @@ class SupportCase(db.Model):
 
     comments = db.relationship('SupportCaseComment', backref='support_case', lazy=True, cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.Index('ix_support_cases_member_status', 'team_member_id', 'status', 'created_at'),
+        db.Index('ix_support_cases_status', 'status', 'created_at'),
+        db.Index('ix_support_cases_priority', 'priority', 'created_at'),
+        db.Index('ix_support_cases_created', 'created_at'),
+        db.Index('ix_support_cases_resolved', 'resolved_at'),
+    )
+
 
 class SupportCaseComment(db.Model):
     __tablename__ = 'support_case_comments'
@@ -112,6 +202,10 @@ class SupportCaseComment(db.Model):
     comment = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_support_case_comments_case', 'case_id', 'created_at'),
+    )
+
 
 class FollowUp(db.Model):
     __tablename__ = 'follow_ups'
@@ -124,9 +218,16 @@ class FollowUp(db.Model):
     priority = db.Column(db.String(20), nullable=False, default='Medium')
     related_type = db.Column(db.String(50))
     related_id = db.Column(db.Integer)
-    team_member_id = db.Column(db.Integer, db.ForeignKey('team_members.id'))
+    team_member_id = _owner_column()
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_follow_ups_member_status', 'team_member_id', 'status', 'due_date'),
+        db.Index('ix_follow_ups_status_due', 'status', 'due_date'),
+        db.Index('ix_follow_ups_due_date', 'due_date'),
+        db.Index('ix_follow_ups_priority', 'priority', 'due_date'),
+    )
+
 
 class SkillRating(db.Model):
     __tablename__ = 'skill_ratings'
@@ -150,5 +251,179 @@ class Note(db.Model):
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text)
     tags = db.Column(db.String(500))
-    team_member_id = db.Column(db.Integer, db.ForeignKey('team_members.id'))
+    team_member_id = _owner_column()
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Highlighted FTS5 snippet, populated by note searches via with_expression()
+    search_snippet = db.query_expression()
+
+    __table_args__ = (
+        db.Index('ix_notes_member_created', 'team_member_id', 'created_at'),
+        db.Index('ix_notes_created', 'created_at'),
+    )
+
+
+class Tag(db.Model):
+    __tablename__ = 'tags'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # NOCASE so 'Acme' and 'acme' are one tag and lookups by name use the unique index
+    name = db.Column(db.String(100, collation='NOCASE'), nullable=False, unique=True)
+    # Maintained by triggers on note_tags
+    note_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class NoteTag(db.Model):
+    __tablename__ = 'note_tags'
+
+    note_id = db.Column(db.Integer, db.ForeignKey('notes.id'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tags.id'), primary_key=True)
+
+    __table_args__ = (
+        db.Index('ix_note_tags_tag', 'tag_id', 'note_id'),
+    )
+
+
+# Keep Tag.note_count in step with every insert and delete of a note's tag links
+db.event.listen(NoteTag.__table__, 'after_create', db.DDL(
+    "CREATE TRIGGER IF NOT EXISTS note_tags_count_insert AFTER INSERT ON note_tags "
+    "BEGIN UPDATE tags SET note_count = note_count + 1 WHERE id = NEW.tag_id; END"
+))
+db.event.listen(NoteTag.__table__, 'after_create', db.DDL(
+    "CREATE TRIGGER IF NOT EXISTS note_tags_count_delete AFTER DELETE ON note_tags "
+    "BEGIN UPDATE tags SET note_count = note_count - 1 WHERE id = OLD.tag_id; END"
+))
+
+
+class ImportJob(db.Model):
+    __tablename__ = 'import_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    filename = db.Column(db.String(255))
+    status = db.Column(db.String(20), nullable=False, default='Queued')
+    rows_processed = db.Column(db.Integer, default=0)
+    success_count = db.Column(db.Integer, default=0)
+    updated_count = db.Column(db.Integer, default=0)
+    unchanged_count = db.Column(db.Integer, default=0)
+    duplicate_count = db.Column(db.Integer, default=0)
+    error_count = db.Column(db.Integer, default=0)
+    message = db.Column(db.Text)
+    # Written in one transaction, so its progress is only known to the process running it
+    atomic = db.Column(db.Boolean, default=False)
+    # PROCESS_TOKEN of the process running the job, which keeps heartbeat_at
+    # current until it finishes; an unfinished job dies with it
+    owner = db.Column(db.String(32))
+    heartbeat_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    # Pages poll for a kind's unfinished jobs; old finished jobs are pruned by status
+    __table_args__ = (
+        db.Index('ix_import_jobs_kind', 'kind', 'created_at'),
+        db.Index('ix_import_jobs_status', 'status', 'created_at'),
+    )
+
+    @property
+    def rows_per_second(self):
+        if not self.started_at:
+            return 0
+        elapsed = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds()
+        return round(self.rows_processed / elapsed, 1) if elapsed > 0 else 0
+
+
+class ReportJob(db.Model):
+    __tablename__ = 'report_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    # Digest of what the report covers; identical requests share an unfinished job
+    key = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='Queued')
+    # PROCESS_TOKEN of the web process that submitted the job, which keeps
+    # heartbeat_at current until it finishes; a queued job dies with it
+    owner = db.Column(db.String(32))
+    heartbeat_at = db.Column(db.DateTime)
+    size = db.Column(db.Integer)
+    message = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_report_jobs_key', 'key', 'status'),
+        db.Index('ix_report_jobs_status', 'status', 'created_at'),
+    )
+
+
+class ReportDefinition(db.Model):
+    __tablename__ = 'report_definitions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    # Comma-separated lists; an empty list doesn't filter
+    sections = db.Column(db.String(300), nullable=False)
+    member_ids = db.Column(db.Text)
+    stages = db.Column(db.String(100))
+    case_statuses = db.Column(db.String(200))
+    followup_statuses = db.Column(db.String(200))
+    # A rolling window of this many days up to today, or else the fixed dates
+    period_days = db.Column(db.Integer)
+    start_date = db.Column(db.Date)
+    end_date = db.Column(db.Date)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def date_range(self, today):
+        """(start, end) dates the report covers on ``today``; either may be None."""
+        if self.period_days:
+            return today - timedelta(days=self.period_days - 1), today
+        return self.start_date, self.end_date
+
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+
+    # Bumped by every write to the data behind a process-local cache, so other
+    # processes can tell their copy is stale with a primary key read
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class TableRowCount(db.Model):
+    __tablename__ = 'table_row_counts'
+
+    # Maintained by triggers on each table in ROW_COUNT_TABLES, so reading
+    # the row counts never means counting a table
+    table_name = db.Column(db.String(50), primary_key=True)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+ROW_COUNT_TABLES = ['team_members', 'one_on_ones', 'opportunities', 'opportunity_updates',
+                    'support_cases', 'support_case_comments', 'follow_ups', 'notes']
+
+
+def row_count_ddl(table):
+    """Statements that seed ``table``'s row in table_row_counts and keep it current."""
+    return [
+        f"INSERT INTO table_row_counts (table_name, row_count) SELECT '{table}', COUNT(*) FROM {table} "
+        "WHERE true ON CONFLICT (table_name) DO NOTHING",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_row_count_insert AFTER INSERT ON {table} "
+        f"BEGIN UPDATE table_row_counts SET row_count = row_count + 1 WHERE table_name = '{table}'; END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_row_count_delete AFTER DELETE ON {table} "
+        f"BEGIN UPDATE table_row_counts SET row_count = row_count - 1 WHERE table_name = '{table}'; END",
+    ]
+
+
+# On the metadata rather than the table, since the counted tables must exist first
+for _table in ROW_COUNT_TABLES:
+    for _statement in row_count_ddl(_table):
+        db.event.listen(db.metadata, 'after_create', db.DDL(_statement))
+
+
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'
+
+    # One row per applied step in migrations.MIGRATIONS
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
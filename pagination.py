@@ -0,0 +1,125 @@
+"""Keyset (cursor) pagination for the list pages.
+
+Each page is fetched with ``WHERE (sort_key, id) < (last_sort_key, last_id)``
+instead of an OFFSET, so the cost of a page does not depend on how deep into
+the list it is. The row id is always used as the tiebreaker so the order is
+stable even when many rows share a sort value.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+
+from models import db
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+
+class SortOption:
+    """A user-selectable sort column for a list page."""
+
+    def __init__(self, expression, default_dir='asc'):
+        self.expression = expression
+        self.default_dir = default_dir
+
+
+class KeysetPage:
+    """One page of results plus the cursors needed to move between pages."""
+
+    def __init__(self, items, sort, direction, next_cursor, prev_cursor, args):
+        self.items = items
+        self.sort = sort
+        self.direction = direction
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        # Filter arguments that page and sort links must carry forward
+        self.args = args
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(value, row_id):
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    raw = json.dumps([value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, expression):
+    """Return (value, id) from a cursor, or None if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, row_id = json.loads(raw)
+        try:
+            python_type = expression.type.python_type
+        except NotImplementedError:
+            # Untyped SQL functions such as lower() round-trip as JSON values
+            python_type = None
+        if value is not None and python_type is datetime:
+            value = datetime.fromisoformat(value)
+        elif value is not None and python_type is date:
+            value = date.fromisoformat(value)
+        elif value is not None and python_type in (int, float, str):
+            value = python_type(value)
+        return value, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def paginate(query, id_column, sort_options, default_sort, args):
+    """Apply keyset pagination and sorting from request ``args`` to ``query``.
+
+    ``args`` may contain ``sort``, ``dir``, ``per_page`` and one of ``after`` or
+    ``before`` (cursors taken from a previous page). Every other argument is
+    treated as a filter and copied onto the returned page for link building.
+    """
+    sort = args.get('sort')
+    if sort not in sort_options:
+        sort = default_sort
+    option = sort_options[sort]
+    direction = args.get('dir')
+    if direction not in ('asc', 'desc'):
+        direction = option.default_dir
+    per_page = min(max(args.get('per_page', DEFAULT_PER_PAGE, type=int) or DEFAULT_PER_PAGE, 1), MAX_PER_PAGE)
+
+    expression = option.expression
+    after = decode_cursor(args['after'], expression) if args.get('after') else None
+    before = decode_cursor(args['before'], expression) if args.get('before') else None
+
+    # Walking backwards from a "before" cursor runs the query in reverse order
+    forward = before is None
+    descending = (direction == 'desc') == forward
+    key = db.tuple_(expression, id_column)
+    cursor = after if forward else before
+    if cursor is not None:
+        query = query.filter(key < cursor if descending else key > cursor)
+    if descending:
+        query = query.order_by(expression.desc(), id_column.desc())
+    else:
+        query = query.order_by(expression.asc(), id_column.asc())
+
+    rows = query.add_columns(expression).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    next_cursor = prev_cursor = None
+    if rows:
+        first_item, first_value = rows[0]
+        last_item, last_value = rows[-1]
+        if has_more or not forward:
+            next_cursor = encode_cursor(last_value, last_item.id)
+        if cursor is not None and (has_more or forward):
+            prev_cursor = encode_cursor(first_value, first_item.id)
+
+    filters = {k: v for k, v in args.items() if k not in ('sort', 'dir', 'after', 'before') and v}
+    return KeysetPage(items, sort, direction, next_cursor, prev_cursor, filters)
@@ -0,0 +1,201 @@
+"""Member 360 profiles for the 1-1 prep page.
+
+load_member_profile() fetches a member and everything the 1-1 page shows
+about them with one query per table. Active opportunities and live POVs come
+from a single opportunities query split in memory. Meeting history is
+limited to the first MEETING_PAGE_SIZE headers; meeting_page() serves later
+pages by keyset cursor, so a long tenure doesn't make the page heavier.
+Profiles hold immutable Core rows rather than ORM instances, so they can be
+shared between requests, and are cached for PROFILE_TTL seconds per member.
+
+A cached profile is also checked against two cache_versions rows: one for
+the member and one for all profiles. Any ORM change to a row carrying a
+team_member_id (or to the member itself) bumps the member's row in the
+writing transaction, via session events, so every process reloads that
+profile once the write commits. Bulk writers that bypass the ORM call
+invalidate_member_profiles() after committing.
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import db, CacheVersion, TeamMember, OneOnOne, Opportunity, SupportCase, FollowUp, Note
+from pagination import encode_cursor, decode_cursor
+
+PROFILE_TTL = 60
+# cache_versions row covering every member's profile
+CACHE_NAME = 'profiles'
+CLOSED_CASE_STATUSES = ['Resolved', 'Closed']
+# Models whose rows appear on a member's profile
+PROFILE_MODELS = (OneOnOne, Opportunity, SupportCase, FollowUp, Note)
+MEETING_PAGE_SIZE = 10
+# Meeting history lists headers only; notes and action items load per meeting
+MEETING_HEADER_COLUMNS = (OneOnOne.id, OneOnOne.team_member_id, OneOnOne.date, OneOnOne.mood)
+
+_lock = threading.Lock()
+_profiles = {}
+# Bumped on invalidation so a load that raced a write isn't cached
+_generations = defaultdict(int)
+_state = {'generation': 0}
+
+
+class MemberProfile:
+    """Everything the 1-1 page shows for one member, as Core rows."""
+
+    def __init__(self, version, member, meeting_count, meetings, opportunities, open_cases, open_followups, notes):
+        # Stored (all profiles, member) versions when the profile was loaded
+        self.version = version
+        self.member = member
+        self.meeting_count = meeting_count
+        # First page of meeting headers, newest first, and the cursor for the next
+        self.meetings, self.meetings_next = meetings
+        self.active_opps = [opp for opp in opportunities if opp.stage != '6']
+        self.live_povs = [opp for opp in opportunities if opp.pov_status == 'Active']
+        self.open_cases = open_cases
+        self.open_followups = open_followups
+        self.notes = notes
+        self.expires = time.monotonic() + PROFILE_TTL
+
+
+def _rows(model, *criteria, order_by):
+    table = model.__table__
+    return db.session.execute(db.select(table).where(*criteria).order_by(*order_by)).all()
+
+
+def meeting_page(member_id, after=None):
+    """One page of a member's meeting headers, newest first, as (rows, next_cursor).
+
+    ``after`` is a cursor from a previous page. Raises ValueError if it is malformed.
+    """
+    query = db.select(*MEETING_HEADER_COLUMNS).where(OneOnOne.team_member_id == member_id)
+    if after:
+        key = decode_cursor(after, OneOnOne.date)
+        if key is None:
+            raise ValueError('Invalid cursor')
+        query = query.where(db.tuple_(OneOnOne.date, OneOnOne.id) < key)
+    rows = db.session.execute(query.order_by(OneOnOne.date.desc(), OneOnOne.id.desc())
+                              .limit(MEETING_PAGE_SIZE + 1)).all()
+    next_cursor = None
+    if len(rows) > MEETING_PAGE_SIZE:
+        rows = rows[:MEETING_PAGE_SIZE]
+        next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+    return rows, next_cursor
+
+
+def _member_cache_name(member_id):
+    return f'profile:{member_id}'
+
+
+def _stored_version(member_id):
+    names = [CACHE_NAME, _member_cache_name(member_id)]
+    versions = dict(db.session.execute(
+        db.select(CacheVersion.name, CacheVersion.version).where(CacheVersion.name.in_(names))).all())
+    return tuple(versions.get(name, 0) for name in names)
+
+
+def _bump_versions(connection, names):
+    table = CacheVersion.__table__
+    stmt = sqlite_insert(table).values(version=1)
+    connection.execute(stmt.on_conflict_do_update(index_elements=['name'], set_={'version': table.c.version + 1}),
+                       [{'name': name} for name in names])
+
+
+def _build_profile(member_id, version):
+    member = db.session.execute(db.select(TeamMember.__table__).where(TeamMember.id == member_id)).first()
+    if member is None:
+        return None
+    return MemberProfile(
+        version=version,
+        member=member,
+        meeting_count=db.session.execute(
+            db.select(db.func.count()).select_from(OneOnOne).where(OneOnOne.team_member_id == member_id)).scalar(),
+        meetings=meeting_page(member_id),
+        # One scan covers both the active opportunity and live POV lists
+        opportunities=_rows(Opportunity, Opportunity.team_member_id == member_id,
+                            db.or_(Opportunity.stage != '6', Opportunity.pov_status == 'Active'),
+                            order_by=[Opportunity.updated_at.desc()]),
+        open_cases=_rows(SupportCase, SupportCase.team_member_id == member_id,
+                         ~SupportCase.status.in_(CLOSED_CASE_STATUSES),
+                         order_by=[SupportCase.created_at.desc()]),
+        open_followups=_rows(FollowUp, FollowUp.team_member_id == member_id,
+                             FollowUp.status != 'Completed',
+                             order_by=[FollowUp.due_date]),
+        notes=_rows(Note, Note.team_member_id == member_id,
+                    order_by=[Note.created_at.desc()]),
+    )
+
+
+def load_member_profile(member_id):
+    """Return the MemberProfile for ``member_id``, or None if there is no such member."""
+    version = _stored_version(member_id)
+    profile = _profiles.get(member_id)
+    if profile is not None and profile.version == version and profile.expires > time.monotonic():
+        return profile
+
+    generation = (_state['generation'], _generations[member_id])
+    profile = _build_profile(member_id, version)
+    with _lock:
+        if profile is not None and generation == (_state['generation'], _generations[member_id]):
+            _profiles[member_id] = profile
+    return profile
+
+
+def invalidate_member_profiles(member_ids=None):
+    """Mark every process's profiles for ``member_ids`` stale, or every profile if None.
+
+    For writes that bypass the ORM; call after committing them.
+    """
+    names = [CACHE_NAME] if member_ids is None else [_member_cache_name(member_id) for member_id in member_ids]
+    _bump_versions(db.session.connection(), names)
+    db.session.commit()
+    _drop_profiles(member_ids)
+
+
+def _drop_profiles(member_ids=None):
+    """Drop this process's cached profiles for ``member_ids``, or for every member if None."""
+    with _lock:
+        if member_ids is None:
+            _state['generation'] += 1
+            _profiles.clear()
+            return
+        for member_id in member_ids:
+            _generations[member_id] += 1
+            _profiles.pop(member_id, None)
+
+
+def _member_ids(obj):
+    """Member ids a flushed object belongs to, before and after the change."""
+    if isinstance(obj, TeamMember):
+        return {obj.id}
+    if not isinstance(obj, PROFILE_MODELS):
+        return set()
+    history = db.inspect(obj).attrs.team_member_id.history
+    # Routes assign ids straight from form data, so they may still be strings
+    return {int(member_id) for member_id in (obj.team_member_id, *history.deleted) if member_id not in (None, '')}
+
+
+@db.event.listens_for(Session, 'after_flush')
+def _collect_changed_members(session, flush_context):
+    flushed = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        flushed.update(_member_ids(obj))
+    if flushed:
+        # Part of the writing transaction, so other processes see it exactly when the change commits
+        _bump_versions(session.connection(), [_member_cache_name(member_id) for member_id in flushed])
+        session.info.setdefault('profile_members', set()).update(flushed)
+
+
+@db.event.listens_for(Session, 'after_commit')
+def _invalidate_changed_members(session):
+    changed = session.info.pop('profile_members', None)
+    if changed:
+        _drop_profiles(changed)
+
+
+@db.event.listens_for(Session, 'after_rollback')
+def _forget_changed_members(session):
+    session.info.pop('profile_members', None)
@@ -0,0 +1,113 @@
+"""Per-request SQL statistics.
+
+Engine events count and time every statement a request runs, grouped by its
+parametrized SQL. The totals so far go out in a Server-Timing header when
+the view returns, and the final totals in one JSON log line on the
+``querystats`` logger once the response is closed, so statements run while
+a streamed response is sent are counted too.
+
+Strict mode catches likely N+1 queries: with SQL_REPEAT_LIMIT set, a SELECT
+that runs more than that many times in one request is logged as a warning,
+or raises RepeatedQueryError if SQL_REPEAT_ACTION is 'raise'. Statements run
+outside a request (background imports, migrations) are not counted.
+"""
+
+import functools
+import json
+import logging
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('querystats')
+
+# Repeated statements listed in the log line, most frequent first
+LOGGED_REPEATS = 5
+
+
+class RepeatedQueryError(RuntimeError):
+    """A SELECT ran more than SQL_REPEAT_LIMIT times in one request."""
+
+
+class QueryStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def repeated(self):
+        return [(statement, n) for statement, n in self.statements.most_common(LOGGED_REPEATS) if n > 1]
+
+
+def _short(statement, length=200):
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= length else statement[:length] + '...'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or context is None:
+        return
+    stats = g.get('query_stats')
+    if stats is None:
+        return
+    stats.count += 1
+    stats.duration += time.perf_counter() - context.query_started
+    stats.statements[statement] += 1
+
+    limit = current_app.config.get('SQL_REPEAT_LIMIT')
+    # Report each statement once, as it crosses the limit
+    if limit and stats.statements[statement] == limit + 1 and statement.lstrip().upper().startswith('SELECT'):
+        message = f'SELECT ran more than {limit} times in {request.method} {request.path}: {_short(statement)}'
+        if current_app.config.get('SQL_REPEAT_ACTION') == 'raise':
+            raise RepeatedQueryError(message)
+        logger.warning(message)
+
+
+def _begin_request():
+    g.query_stats = QueryStats()
+
+
+def _report_request(response):
+    # Left in g: a streamed body runs more statements after this
+    stats = g.get('query_stats')
+    if stats is None:
+        return response
+    total_ms = (time.perf_counter() - stats.started) * 1000
+    db_ms = stats.duration * 1000
+    response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{stats.count} queries", app;dur={total_ms:.1f}')
+    entry = {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+    }
+    response.call_on_close(functools.partial(_log_request, stats, entry))
+    return response
+
+
+def _log_request(stats, entry):
+    # Runs after the request context is gone, so everything it needs is passed in
+    logger.info(json.dumps({
+        **entry,
+        'duration_ms': round((time.perf_counter() - stats.started) * 1000, 1),
+        'db_ms': round(stats.duration * 1000, 1),
+        'queries': stats.count,
+        'repeated': [{'count': n, 'sql': _short(statement)} for statement, n in stats.repeated()],
+    }))
+
+
+def init_query_stats(app):
+    """Collect query statistics for every request handled by ``app``."""
+    app.before_request(_begin_request)
+    app.after_request(_report_request)
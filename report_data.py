@@ -0,0 +1,154 @@
+"""Loading the records a report covers.
+
+A report is either an ad-hoc selection of ids posted from the report builder
+(load_report_data) or a saved ReportDefinition whose filters are resolved to
+queries when the report is built (load_definition_data), so a saved report
+stays a small request however much data it covers. Either way the report's
+date range is part of each section's query, so out-of-range rows are never
+loaded or rendered. Each section is fetched
+with the owning member joined in, so the preview template and the PDF/CSV
+renderers never lazy load per row. Skill ratings come from the cached skill
+matrix rather than a query per member.
+
+Sections are lists by default. With ``stream=True`` they are instead lazy
+iterables that run their queries as the CSV writer reaches them, fetching
+REPORT_STREAM_BATCH rows at a time, so a large CSV report never holds a
+whole section in memory. They can only be iterated once, and only while the
+request's session is still open.
+"""
+
+from datetime import datetime, time, timedelta
+
+from models import db, TeamMember, OneOnOne, Opportunity, SupportCase, FollowUp, Note
+from skills import get_skill_matrix
+
+REPORT_SECTIONS = ['team_members', 'one_on_ones', 'opportunities', 'support_cases', 'follow_ups',
+                   'notes', 'skill_matrix', 'live_povs']
+SECTION_LABELS = {
+    'team_members': 'Team Members', 'one_on_ones': '1-1 Meetings', 'opportunities': 'Opportunities',
+    'live_povs': 'Live POVs', 'support_cases': 'Support Cases', 'follow_ups': 'Follow-ups',
+    'notes': 'Notes', 'skill_matrix': 'Skill Matrix',
+}
+# The dates each section's date range applies to, a row being in range when
+# any of them is; the first also orders saved reports
+SECTION_DATES = {
+    'one_on_ones': (OneOnOne.date,),
+    'opportunities': (Opportunity.updated_at, Opportunity.close_date),
+    'live_povs': (Opportunity.updated_at, Opportunity.close_date),
+    'support_cases': (SupportCase.created_at, SupportCase.resolved_at),
+    'follow_ups': (FollowUp.due_date,),
+    'notes': (Note.created_at,),
+}
+# Ids bound per IN (...) so large selections stay under SQLite's parameter limit
+ID_CHUNK_SIZE = 500
+# Rows fetched per round trip when a section is streamed
+REPORT_STREAM_BATCH = 500
+
+
+def selected_ids(form):
+    """{section: [id, ...]} from a report builder form."""
+    return {section: form.getlist(section) for section in REPORT_SECTIONS}
+
+
+def split_list(value):
+    """Items of a comma-separated ReportDefinition column."""
+    return [item for item in (value or '').split(',') if item]
+
+
+def _in_range(column, start, end):
+    criteria = []
+    is_datetime = isinstance(column.type, db.DateTime)
+    if start:
+        criteria.append(column >= (datetime.combine(start, time.min) if is_datetime else start))
+    if end:
+        criteria.append(column < datetime.combine(end + timedelta(days=1), time.min) if is_datetime
+                        else column <= end)
+    return db.and_(*criteria)
+
+
+def date_criteria(section, start, end):
+    """Criteria keeping a section's rows within the inclusive dates ``start``..``end``."""
+    if section not in SECTION_DATES or not (start or end):
+        return []
+    return [db.or_(*(_in_range(column, start, end) for column in SECTION_DATES[section]))]
+
+
+def _query(model, *criteria, order_by=()):
+    query = model.query
+    if model is not TeamMember:
+        query = query.options(db.joinedload(model.team_member))
+    return query.filter(*criteria).order_by(*order_by)
+
+
+def _id_queries(model, ids, *criteria):
+    """Queries for the rows of ``model`` with the given ids, ID_CHUNK_SIZE ids each."""
+    return [_query(model, model.id.in_(ids[start:start + ID_CHUNK_SIZE]), *criteria)
+            for start in range(0, len(ids), ID_CHUNK_SIZE)]
+
+
+def _rows(queries, stream):
+    """The rows of ``queries`` in turn, as a list or, when ``stream``, a lazy iterator."""
+    if stream:
+        return (row for query in queries for row in query.yield_per(REPORT_STREAM_BATCH))
+    return [row for query in queries for row in query]
+
+
+def _skill_matrix(members, stream):
+    matrix = get_skill_matrix()
+    entries = ({'member': member, 'ratings': matrix.ratings_for(member.id)} for member in members)
+    return entries if stream else list(entries)
+
+
+def load_report_data(selected, start=None, end=None, stream=False):
+    """The records picked in ``selected`` that fall within start..end, keyed by section."""
+    def load(section, model, *criteria):
+        return _rows(_id_queries(model, selected[section], *criteria, *date_criteria(section, start, end)), stream)
+
+    return {
+        'team_members': load('team_members', TeamMember),
+        'one_on_ones': load('one_on_ones', OneOnOne),
+        'opportunities': load('opportunities', Opportunity),
+        'support_cases': load('support_cases', SupportCase),
+        'follow_ups': load('follow_ups', FollowUp),
+        'notes': load('notes', Note),
+        'live_povs': load('live_povs', Opportunity, Opportunity.pov_status == 'Active'),
+        'skill_matrix': _skill_matrix(load('skill_matrix', TeamMember), stream),
+    }
+
+
+def load_definition_data(definition, today, stream=False):
+    """The records a saved report covers on ``today``, keyed by section."""
+    sections = set(split_list(definition.sections))
+    member_ids = [int(member_id) for member_id in split_list(definition.member_ids)]
+    start, end = definition.date_range(today)
+    filters = {
+        'opportunities': [Opportunity.stage.in_(split_list(definition.stages))] if definition.stages else [],
+        'live_povs': [Opportunity.pov_status == 'Active'],
+        'support_cases': ([SupportCase.status.in_(split_list(definition.case_statuses))]
+                          if definition.case_statuses else []),
+        'follow_ups': ([FollowUp.status.in_(split_list(definition.followup_statuses))]
+                       if definition.followup_statuses else []),
+    }
+    models = {'one_on_ones': OneOnOne, 'opportunities': Opportunity, 'live_povs': Opportunity,
+              'support_cases': SupportCase, 'follow_ups': FollowUp, 'notes': Note}
+
+    data = {section: [] for section in REPORT_SECTIONS}
+    for section, model in models.items():
+        if section not in sections:
+            continue
+        criteria = [*filters.get(section, []), *date_criteria(section, start, end)]
+        if member_ids:
+            criteria.append(model.team_member_id.in_(member_ids))
+        data[section] = _rows([_query(model, *criteria, order_by=(SECTION_DATES[section][0].desc(),
+                                                                  model.id.desc()))], stream)
+
+    if sections & {'team_members', 'skill_matrix'}:
+        members = _query(TeamMember, *([TeamMember.id.in_(member_ids)] if member_ids else []),
+                         order_by=(TeamMember.name,))
+        if 'team_members' in sections:
+            data['team_members'] = _rows([members], stream)
+        if 'skill_matrix' in sections:
+            # A streamed section can only be read once, so the matrix runs the query again
+            rows = data['team_members'] if 'team_members' in sections and not stream else _rows([members], stream)
+            data['skill_matrix'] = _skill_matrix(rows, stream)
+    return data
@@ -0,0 +1,248 @@
+"""Background PDF report jobs.
+
+ReportLab layout is CPU bound, so PDFs are rendered in a pool of worker
+processes instead of the request that asked for them, and a few large
+reports can't stall every other page. The request loads the report data
+(report_data loads everything the renderer touches, so the records pickle
+into the worker whole) and the worker writes the PDF to the instance folder.
+Job state lives in the report_jobs table like import jobs; pages poll it
+and download the file once the job has completed.
+
+REPORT_WORKERS processes render at once and the rest wait their turn, up to
+REPORT_QUEUE_LIMIT jobs in all, after which submit_report raises
+ReportQueueFull. A request for a report that is already queued or rendering
+joins that job instead of rendering the same PDF again.
+
+Each web process tags its jobs with PROCESS_TOKEN and a heartbeat thread
+refreshes their heartbeat_at while any are unfinished. A queued job whose
+heartbeat stops was lost with its process, and expire_report_jobs(), run on
+every submit and status check, marks it failed.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from models import db, ReportJob, PROCESS_TOKEN
+from metrics import observe_report
+
+REPORT_JOB_FINAL_STATUSES = ['Completed', 'Failed']
+# Queued jobs older than this are given up on even if their process is alive
+REPORT_JOB_TIMEOUT = timedelta(hours=1)
+# Finished jobs and their files are kept this long for downloads
+REPORT_JOB_TTL = timedelta(days=1)
+# Seconds between heartbeats, and how long a job may go without one
+REPORT_JOB_HEARTBEAT = 15
+REPORT_JOB_HEARTBEAT_TIMEOUT = timedelta(minutes=1)
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_heartbeat = None
+# Futures of the jobs this process submitted, to tell running jobs from queued ones
+_futures = {}
+_lock = threading.Lock()
+
+
+class ReportQueueFull(Exception):
+    """Too many report jobs are already waiting for a worker."""
+
+
+def _get_executor(app):
+    global _executor
+    with _lock:
+        if _executor is None:
+            # Spawned rather than forked: the web process has threads and open connections
+            _executor = ProcessPoolExecutor(max_workers=app.config.get('REPORT_WORKERS', 2),
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def _discard_executor(executor):
+    """Drop a pool whose worker died, so the next job starts a fresh one."""
+    global _executor
+    with _lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def shutdown_report_workers():
+    """Wait for queued reports to finish, then stop the worker processes."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def report_dir(app):
+    path = os.path.join(app.instance_path, 'report_jobs')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def report_path(app, job_id):
+    return os.path.join(report_dir(app), f'{job_id}.pdf')
+
+
+def report_key(*parts):
+    """Digest identifying a report request; identical requests get the same key."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _beat(app):
+    """Refresh this process's unfinished jobs until it has none left."""
+    global _heartbeat
+    while True:
+        time.sleep(REPORT_JOB_HEARTBEAT)
+        try:
+            with app.app_context(), _lock:
+                beating = db.session.execute(
+                    db.update(ReportJob)
+                    .where(ReportJob.owner == PROCESS_TOKEN, ReportJob.status == 'Queued')
+                    .values(heartbeat_at=datetime.utcnow())).rowcount
+                db.session.commit()
+                if not beating:
+                    _heartbeat = None
+                    return
+        except Exception:
+            logger.exception('Report job heartbeat failed')
+
+
+def _start_heartbeat(app):
+    # Called with _lock held
+    global _heartbeat
+    if _heartbeat is None:
+        _heartbeat = threading.Thread(target=_beat, args=(app,), name='report-heartbeat', daemon=True)
+        _heartbeat.start()
+
+
+def expire_report_jobs(app):
+    """Fail queued jobs that lost their process or ran too long, and delete old finished ones."""
+    now = datetime.utcnow()
+    for job in ReportJob.query.filter(ReportJob.status == 'Queued').all():
+        if (job.heartbeat_at or job.created_at) < now - REPORT_JOB_HEARTBEAT_TIMEOUT:
+            job.message = 'Report was interrupted by a restart.'
+        elif job.created_at < now - REPORT_JOB_TIMEOUT:
+            job.message = 'Report did not finish in time.'
+        else:
+            continue
+        job.status = 'Failed'
+        job.finished_at = now
+    old = ReportJob.query.filter(ReportJob.status.in_(REPORT_JOB_FINAL_STATUSES),
+                                 ReportJob.created_at < now - REPORT_JOB_TTL).all()
+    for job in old:
+        if os.path.exists(report_path(app, job.id)):
+            os.remove(report_path(app, job.id))
+        db.session.delete(job)
+    db.session.commit()
+
+
+def submit_report(app, key, load_data, start_date=None, end_date=None):
+    """Queue a PDF of ``load_data()`` unless one for ``key`` is already on its way.
+
+    Returns the ReportJob to poll, which may be an earlier request's. Raises
+    ReportQueueFull when REPORT_QUEUE_LIMIT jobs are already queued.
+    """
+    with _lock:
+        expire_report_jobs(app)
+        job = ReportJob.query.filter(ReportJob.key == key, ReportJob.status == 'Queued').first()
+        if job:
+            return job
+        queued = ReportJob.query.filter(ReportJob.status == 'Queued').count()
+        if queued >= app.config.get('REPORT_QUEUE_LIMIT', 20):
+            raise ReportQueueFull(f'{queued} reports are already queued')
+        now = datetime.utcnow()
+        job = ReportJob(id=uuid.uuid4().hex, key=key, status='Queued', owner=PROCESS_TOKEN,
+                        created_at=now, heartbeat_at=now)
+        db.session.add(job)
+        db.session.commit()
+        _start_heartbeat(app)
+
+    path = report_path(app, job.id)
+    try:
+        executor = _get_executor(app)
+        # Pickled here rather than by the pool's feeder thread, which could see
+        # the records expired by a later commit in this session
+        payload = pickle.dumps(load_data())
+        future = executor.submit(_render, payload, start_date, end_date, path)
+    except Exception as e:
+        db.session.rollback()
+        job.status = 'Failed'
+        job.message = f'Report failed: {e}'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        raise
+    _futures[job.id] = future
+    future.add_done_callback(functools.partial(_finish, app, executor, job.id, path))
+    return job
+
+
+def _render(payload, start_date, end_date, path):
+    """Write the PDF of the pickled report data to ``path``; runs in a worker process.
+
+    Returns when rendering started.
+    """
+    from reports import write_pdf_report
+
+    started = datetime.utcnow()
+    data = pickle.loads(payload)
+    partial_path = path + '.part'
+    try:
+        with open(partial_path, 'wb') as output:
+            write_pdf_report(output, data, start_date, end_date)
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return started
+
+
+def _finish(app, executor, job_id, path, future):
+    with app.app_context():
+        job = db.session.get(ReportJob, job_id)
+        status = 'error'
+        try:
+            job.started_at = future.result()
+            job.size = os.path.getsize(path)
+            job.status = 'Completed'
+            status = 'ok'
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                _discard_executor(executor)
+            job.status = 'Failed'
+            job.message = f'Report failed: {e}'
+        finally:
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            started = job.started_at or job.finished_at
+            observe_report('pdf', status, (job.finished_at - started).total_seconds(), job.size or 0,
+                           waited=(started - job.created_at).total_seconds())
+            _futures.pop(job_id, None)
+            db.session.remove()
+
+
+def report_job_status(job):
+    """JSON-friendly view of a report job."""
+    status = job.status
+    future = _futures.get(job.id)
+    if status == 'Queued' and future is not None and future.running():
+        status = 'Running'
+    return {
+        'id': job.id,
+        'status': status,
+        'size': job.size,
+        'message': job.message,
+        'finished': job.status in REPORT_JOB_FINAL_STATUSES,
+    }
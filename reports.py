@@ -1,23 +1,29 @@
-import os
 import csv
-import tempfile
+import io
 from datetime import datetime
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from xml.sax.saxutils import escape
 
+from metrics import timed_report
+from search import html_to_text
 
-def generate_pdf_report(data, start_date=None, end_date=None):
-    """Generate a PDF report with selected items."""
-    fd, filepath = tempfile.mkstemp(suffix='.pdf')
-    os.close(fd)
+# Characters of note and meeting text shown in the PDF
+EXCERPT_LENGTH = 500
+# Characters of CSV buffered before a chunk is sent
+CSV_CHUNK_SIZE = 64 * 1024
+
+
+def _excerpt(value):
+    """Plain text from stored (possibly Quill HTML) text, cut short and escaped for Paragraph markup."""
+    return escape(html_to_text(value)[:EXCERPT_LENGTH])
 
-    doc = SimpleDocTemplate(filepath, pagesize=letter,
-                            rightMargin=72, leftMargin=72,
-                            topMargin=72, bottomMargin=18)
 
+def write_pdf_report(output, data, start_date=None, end_date=None):
+    """Lay out the PDF report for ``data`` into the binary file ``output``."""
     styles = getSampleStyleSheet()
     styles.add(ParagraphStyle(name='SectionTitle',
                               parent=styles['Heading2'],
@@ -77,9 +83,9 @@ def generate_pdf_report(data, start_date=None, end_date=None):
             if meeting.mood:
                 story.append(Paragraph(f"Mood: {meeting.mood}", styles['Normal']))
             if meeting.notes:
-                story.append(Paragraph(f"Notes: {meeting.notes[:500]}", styles['Normal']))
+                story.append(Paragraph(f"Notes: {_excerpt(meeting.notes)}", styles['Normal']))
             if meeting.action_items:
-                story.append(Paragraph(f"Action Items: {meeting.action_items[:500]}", styles['Normal']))
+                story.append(Paragraph(f"Action Items: {_excerpt(meeting.action_items)}", styles['Normal']))
             story.append(Spacer(1, 12))
         story.append(Spacer(1, 12))
 
@@ -204,7 +210,7 @@ def generate_pdf_report(data, start_date=None, end_date=None):
             if note.tags:
                 story.append(Paragraph(f"Tags: {note.tags}", styles['Normal']))
             if note.content:
-                story.append(Paragraph(f"{note.content[:500]}", styles['Normal']))
+                story.append(Paragraph(f"{_excerpt(note.content)}", styles['Normal']))
             story.append(Spacer(1, 12))
 
     # Skill Matrix Section
@@ -235,155 +241,152 @@ def generate_pdf_report(data, start_date=None, end_date=None):
         story.append(table)
         story.append(Spacer(1, 24))
 
+    doc = SimpleDocTemplate(output, pagesize=letter,
+                            rightMargin=72, leftMargin=72,
+                            topMargin=72, bottomMargin=18)
     doc.build(story)
-    return filepath
 
 
+def _csv_section(title, header, records, to_row, last=False):
+    """Rows for one CSV section, or none if ``records`` is empty; reads ``records`` once."""
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return
+    yield [title]
+    yield header
+    yield to_row(first)
+    for record in records:
+        yield to_row(record)
+    if not last:
+        yield []
+
+
+def _member_row(member):
+    return [
+        member.name,
+        member.email,
+        member.region,
+        member.location or '',
+        member.aligned_rep or '',
+        member.aligned_rep_location or '',
+        member.aligned_rep_2 or '',
+        member.aligned_rep_2_location or '',
+        member.aligned_rep_3 or '',
+        member.aligned_rep_3_location or '',
+        member.aligned_rep_4 or '',
+        member.aligned_rep_4_location or '',
+        member.role,
+        member.created_at.strftime('%Y-%m-%d')
+    ]
+
+
+def _meeting_row(meeting):
+    return [
+        meeting.team_member.name,
+        meeting.date.strftime('%Y-%m-%d'),
+        meeting.mood or '',
+        meeting.notes or '',
+        meeting.action_items or ''
+    ]
+
+
+def _opportunity_row(opp):
+    return [
+        opp.name,
+        opp.account,
+        opp.stage,
+        opp.value,
+        opp.team_member.name,
+        opp.close_date.strftime('%Y-%m-%d') if opp.close_date else '',
+        opp.created_at.strftime('%Y-%m-%d'),
+        opp.updated_at.strftime('%Y-%m-%d')
+    ]
+
+
+def _case_row(case):
+    return [
+        case.title,
+        case.customer or '',
+        case.status,
+        case.priority,
+        case.team_member.name,
+        case.description or '',
+        case.created_at.strftime('%Y-%m-%d'),
+        case.resolved_at.strftime('%Y-%m-%d') if case.resolved_at else ''
+    ]
+
+
+def _follow_up_row(item):
+    return [
+        item.title,
+        item.description or '',
+        item.due_date.strftime('%Y-%m-%d'),
+        item.status,
+        item.priority,
+        item.team_member.name if item.team_member else '',
+        item.related_type or '',
+        item.related_id or ''
+    ]
+
+
+def _note_row(note):
+    return [
+        note.title,
+        note.content or '',
+        note.tags or '',
+        note.team_member.name if note.team_member else '',
+        note.created_at.strftime('%Y-%m-%d')
+    ]
+
+
+def _csv_rows(data, start_date, end_date):
+    """Yield the rows of a CSV report, section by section.
+
+    Each section of ``data`` is read once, in order, so it may be a lazy
+    iterable that loads its records as the CSV is written.
+    """
+    # Header
+    yield ['SE Team Manager Report']
+    yield [f'Generated: {datetime.now().strftime("%Y-%m-%d %H:%M")}']
+    if start_date or end_date:
+        yield [f'Date Range: {start_date or "Beginning"} to {end_date or "Now"}']
+    yield []
+
+    opportunity_header = ['Name', 'Account', 'Stage', 'Value', 'SE', 'Close Date', 'Created', 'Updated']
+    yield from _csv_section('TEAM MEMBERS', ['Name', 'Email', 'Region', 'Location', 'Rep 1', 'Rep 1 Territory', 'Rep 2', 'Rep 2 Territory', 'Rep 3', 'Rep 3 Territory', 'Rep 4', 'Rep 4 Territory', 'Role', 'Created'],
+                            data['team_members'], _member_row)
+    yield from _csv_section('1-1 MEETINGS', ['Team Member', 'Date', 'Mood', 'Notes', 'Action Items'],
+                            data['one_on_ones'], _meeting_row)
+    yield from _csv_section('OPPORTUNITIES', opportunity_header, data['opportunities'], _opportunity_row)
+    yield from _csv_section('LIVE POVS', opportunity_header, data.get('live_povs', []), _opportunity_row)
+    yield from _csv_section('SUPPORT CASES', ['Title', 'Customer', 'Status', 'Priority', 'SE', 'Description', 'Created', 'Resolved'],
+                            data['support_cases'], _case_row)
+    yield from _csv_section('FOLLOW-UPS', ['Title', 'Description', 'Due Date', 'Status', 'Priority', 'Team Member', 'Related Type', 'Related ID'],
+                            data['follow_ups'], _follow_up_row)
+    yield from _csv_section('NOTES', ['Title', 'Content', 'Tags', 'Team Member', 'Created'],
+                            data['notes'], _note_row)
+
+    skills = ['Password Safe', 'EPM Win-Mac', 'EPM-L', 'Remote Support', 'PRA', 'AD Bridge', 'Insights', 'Entitle']
+    yield from _csv_section('SKILL MATRIX', ['SE', 'Region'] + skills, data.get('skill_matrix', []),
+                            lambda entry: [entry['member'].name, entry['member'].region]
+                            + [entry['ratings'].get(skill, "Haven't Started") for skill in skills],
+                            last=True)
+
+
+@timed_report('csv')
 def generate_csv_report(data, start_date=None, end_date=None):
-    """Generate a CSV report with selected items."""
-    fd, filepath = tempfile.mkstemp(suffix='.csv')
-    os.close(fd)
-
-    with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
-
-        # Header
-        writer.writerow(['SE Team Manager Report'])
-        writer.writerow([f'Generated: {datetime.now().strftime("%Y-%m-%d %H:%M")}'])
-        if start_date or end_date:
-            writer.writerow([f'Date Range: {start_date or "Beginning"} to {end_date or "Now"}'])
-        writer.writerow([])
-
-        # Team Members
-        if data['team_members']:
-            writer.writerow(['TEAM MEMBERS'])
-            writer.writerow(['Name', 'Email', 'Region', 'Location', 'Rep 1', 'Rep 1 Territory', 'Rep 2', 'Rep 2 Territory', 'Rep 3', 'Rep 3 Territory', 'Rep 4', 'Rep 4 Territory', 'Role', 'Created'])
-            for member in data['team_members']:
-                writer.writerow([
-                    member.name,
-                    member.email,
-                    member.region,
-                    member.location or '',
-                    member.aligned_rep or '',
-                    member.aligned_rep_location or '',
-                    member.aligned_rep_2 or '',
-                    member.aligned_rep_2_location or '',
-                    member.aligned_rep_3 or '',
-                    member.aligned_rep_3_location or '',
-                    member.aligned_rep_4 or '',
-                    member.aligned_rep_4_location or '',
-                    member.role,
-                    member.created_at.strftime('%Y-%m-%d')
-                ])
-            writer.writerow([])
-
-        # 1-1 Meetings
-        if data['one_on_ones']:
-            writer.writerow(['1-1 MEETINGS'])
-            writer.writerow(['Team Member', 'Date', 'Mood', 'Notes', 'Action Items'])
-            for meeting in data['one_on_ones']:
-                writer.writerow([
-                    meeting.team_member.name,
-                    meeting.date.strftime('%Y-%m-%d'),
-                    meeting.mood or '',
-                    meeting.notes or '',
-                    meeting.action_items or ''
-                ])
-            writer.writerow([])
-
-        # Opportunities
-        if data['opportunities']:
-            writer.writerow(['OPPORTUNITIES'])
-            writer.writerow(['Name', 'Account', 'Stage', 'Value', 'SE', 'Close Date', 'Created', 'Updated'])
-            for opp in data['opportunities']:
-                writer.writerow([
-                    opp.name,
-                    opp.account,
-                    opp.stage,
-                    opp.value,
-                    opp.team_member.name,
-                    opp.close_date.strftime('%Y-%m-%d') if opp.close_date else '',
-                    opp.created_at.strftime('%Y-%m-%d'),
-                    opp.updated_at.strftime('%Y-%m-%d')
-                ])
-            writer.writerow([])
-
-        # Live POVs
-        if data.get('live_povs'):
-            writer.writerow(['LIVE POVS'])
-            writer.writerow(['Name', 'Account', 'Stage', 'Value', 'SE', 'Close Date', 'Created', 'Updated'])
-            for pov in data['live_povs']:
-                writer.writerow([
-                    pov.name,
-                    pov.account,
-                    pov.stage,
-                    pov.value,
-                    pov.team_member.name,
-                    pov.close_date.strftime('%Y-%m-%d') if pov.close_date else '',
-                    pov.created_at.strftime('%Y-%m-%d'),
-                    pov.updated_at.strftime('%Y-%m-%d')
-                ])
-            writer.writerow([])
-
-        # Support Cases
-        if data['support_cases']:
-            writer.writerow(['SUPPORT CASES'])
-            writer.writerow(['Title', 'Customer', 'Status', 'Priority', 'SE', 'Description', 'Created', 'Resolved'])
-            for case in data['support_cases']:
-                writer.writerow([
-                    case.title,
-                    case.customer or '',
-                    case.status,
-                    case.priority,
-                    case.team_member.name,
-                    case.description or '',
-                    case.created_at.strftime('%Y-%m-%d'),
-                    case.resolved_at.strftime('%Y-%m-%d') if case.resolved_at else ''
-                ])
-            writer.writerow([])
-
-        # Follow-ups
-        if data['follow_ups']:
-            writer.writerow(['FOLLOW-UPS'])
-            writer.writerow(['Title', 'Description', 'Due Date', 'Status', 'Priority', 'Team Member', 'Related Type', 'Related ID'])
-            for item in data['follow_ups']:
-                writer.writerow([
-                    item.title,
-                    item.description or '',
-                    item.due_date.strftime('%Y-%m-%d'),
-                    item.status,
-                    item.priority,
-                    item.team_member.name if item.team_member else '',
-                    item.related_type or '',
-                    item.related_id or ''
-                ])
-            writer.writerow([])
-
-        # Notes
-        if data['notes']:
-            writer.writerow(['NOTES'])
-            writer.writerow(['Title', 'Content', 'Tags', 'Team Member', 'Created'])
-            for note in data['notes']:
-                writer.writerow([
-                    note.title,
-                    note.content or '',
-                    note.tags or '',
-                    note.team_member.name if note.team_member else '',
-                    note.created_at.strftime('%Y-%m-%d')
-                ])
-            writer.writerow([])
-
-        # Skill Matrix
-        if data.get('skill_matrix'):
-            skills = ['Password Safe', 'EPM Win-Mac', 'EPM-L', 'Remote Support', 'PRA', 'AD Bridge', 'Insights', 'Entitle']
-            writer.writerow(['SKILL MATRIX'])
-            writer.writerow(['SE', 'Region'] + skills)
-            for entry in data['skill_matrix']:
-                member = entry['member']
-                ratings = entry['ratings']
-                row = [member.name, member.region]
-                for skill in skills:
-                    row.append(ratings.get(skill, "Haven't Started"))
-                writer.writerow(row)
-
-    return filepath
+    """Generate a CSV report with selected items as a stream of UTF-8 chunks.
+
+    Rows are written into a small buffer that is handed out every
+    CSV_CHUNK_SIZE characters, so the whole file is never held in memory.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in _csv_rows(data, start_date, end_date):
+        writer.writerow(row)
+        if buffer.tell() >= CSV_CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
@@ -0,0 +1,118 @@
+"""Full-text search over notes with SQLite FTS5.
+
+notes_fts holds the plain text of each note's title, content and tags, keyed
+by the note's id as its rowid. Note content is Quill HTML, so the index is
+maintained from Python with the markup stripped: ORM mapper events cover the
+add/edit/delete routes and index_notes() is called directly by bulk writers
+that bypass the ORM. Searches are ranked with bm25 and every term is a prefix
+match, so partially typed words still find results.
+"""
+
+import html
+import re
+
+from markupsafe import Markup
+
+from models import db, Note
+
+# Relative bm25 weights for the title, content and tags columns
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+TAGS_WEIGHT = 5.0
+SNIPPET_TOKENS = 16
+# Searches return the best matches only, so snippets are built for shown rows
+SEARCH_LIMIT = 200
+
+# Control characters can't appear in indexed text, so they safely mark
+# highlights until the snippet has been HTML-escaped
+_HIGHLIGHT_START = '\x02'
+_HIGHLIGHT_END = '\x03'
+
+db.event.listen(db.metadata, 'after_create', db.DDL(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5("
+    "title, content, tags, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+))
+# Make the built-in rank column the weighted bm25 so ORDER BY rank takes FTS5's fast path
+db.event.listen(db.metadata, 'after_create', db.DDL(
+    f"INSERT INTO notes_fts(notes_fts, rank) VALUES ('rank', 'bm25({TITLE_WEIGHT}, {CONTENT_WEIGHT}, {TAGS_WEIGHT})')"
+))
+db.event.listen(db.metadata, 'after_drop', db.DDL("DROP TABLE IF EXISTS notes_fts"))
+
+notes_fts = db.table('notes_fts', db.column('rowid'), db.column('rank'),
+                     db.column('title'), db.column('content'), db.column('tags'))
+_fts = db.literal_column('notes_fts')
+
+
+def html_to_text(value):
+    """Strip tags from stored note HTML and decode entities."""
+    if not value:
+        return ''
+    text = re.sub(r'<[^>]+>', ' ', value)
+    text = html.unescape(text).replace(_HIGHLIGHT_START, '').replace(_HIGHLIGHT_END, '')
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def index_notes(conn, notes):
+    """(Re)index an iterable of objects or rows with id, title, content and tags."""
+    rows = [{'rowid': note.id, 'title': note.title or '', 'content': html_to_text(note.content),
+             'tags': (note.tags or '').replace(',', ' ')}
+            for note in notes]
+    if rows:
+        unindex_notes(conn, [row['rowid'] for row in rows])
+        conn.execute(notes_fts.insert(), rows)
+
+
+def unindex_notes(conn, note_ids):
+    conn.execute(notes_fts.delete().where(notes_fts.c.rowid.in_(note_ids)))
+
+
+def rebuild_notes_index(conn):
+    """Repopulate notes_fts from the notes table."""
+    conn.execute(notes_fts.delete())
+    notes = conn.execute(db.select(Note.id, Note.title, Note.content, Note.tags))
+    index_notes(conn, notes)
+
+
+@db.event.listens_for(Note, 'after_insert')
+@db.event.listens_for(Note, 'after_update')
+def _index_note(mapper, connection, note):
+    index_notes(connection, [note])
+
+
+@db.event.listens_for(Note, 'after_delete')
+def _unindex_note(mapper, connection, note):
+    unindex_notes(connection, [note.id])
+
+
+def match_expression(search):
+    """Turn free text into an FTS5 query where every word is a quoted prefix term."""
+    terms = re.findall(r'\w+', search)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def note_search(search, *criteria):
+    """Return a subquery of (note_id, score, snippet) for the best notes matching ``search``.
+
+    ``criteria`` filter the notes before ranking. Lower scores rank higher.
+    Returns None if ``search`` has no searchable words. Snippets are raw FTS5
+    output; pass them through highlight_snippet() before rendering.
+    """
+    expression = match_expression(search)
+    if not expression:
+        return None
+    return (db.select(notes_fts.c.rowid.label('note_id'),
+                      notes_fts.c.rank.label('score'),
+                      db.func.snippet(_fts, 1, _HIGHLIGHT_START, _HIGHLIGHT_END, '…', SNIPPET_TOKENS)
+                      .label('snippet'))
+            .select_from(notes_fts)
+            .join(Note, Note.id == notes_fts.c.rowid)
+            .where(_fts.op('MATCH')(expression), *criteria)
+            .order_by(notes_fts.c.rank)
+            .limit(SEARCH_LIMIT)
+            .subquery())
+
+
+def highlight_snippet(snippet):
+    """Escape an FTS5 snippet and wrap its matched terms in <mark>."""
+    escaped = html.escape(snippet or '')
+    return Markup(escaped.replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_END, '</mark>'))
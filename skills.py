@@ -0,0 +1,244 @@
+"""Pivoted skill matrix queries and the in-memory skill matrix cache.
+
+skill_ratings stores one row per (member, skill) and members with no row for
+a skill are implicitly "Haven't Started". skill_pivot() turns those rows
+into one row per member with an ordinal code per skill (the index into
+PROFICIENCY_LEVELS) using conditional aggregation.
+
+The matrix is read far more than it is written, so SkillMatrix keeps that
+pivot in process memory as one bytearray of codes per skill. Predicates
+become 0/1 byte strings via bytes.translate, packed into ints so that
+filters like "PRA at least Demo Ready and EPM-L exactly Expert" and coverage
+counts are a few C-level big-int operations. The
+cache_versions row 'skill_matrix' is bumped by every write, so each process
+can cheaply detect that its copy is stale; a process that made the write
+itself patches its copy in place instead of rebuilding.
+"""
+
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, TeamMember, SkillRating, CacheVersion, SKILLS, PROFICIENCY_LEVELS
+
+LEVEL_CODES = {level: code for code, level in enumerate(PROFICIENCY_LEVELS)}
+# Prefix on a filter value meaning "this level or higher"
+AT_LEAST = '>='
+CACHE_NAME = 'skill_matrix'
+SE_CATEGORY = 'Solution Engineers'
+
+# Byte translation tables turning a column of codes into 0/1 flags
+_AT_LEAST_TABLES = {code: bytes(int(c >= code) for c in range(256)) for code in LEVEL_CODES.values()}
+_EQUALS_TABLES = {code: bytes(int(c == code) for c in range(256)) for code in LEVEL_CODES.values()}
+
+MatrixMember = namedtuple('MatrixMember', 'id name region category')
+
+
+def proficiency_code(column):
+    """SQL expression mapping a proficiency name onto its PROFICIENCY_LEVELS ordinal."""
+    return db.case(LEVEL_CODES, value=column, else_=0)
+
+
+def skill_pivot():
+    """Subquery with team_member_id plus one proficiency code column per skill in SKILLS."""
+    columns = [
+        db.func.max(db.case((SkillRating.skill == skill, proficiency_code(SkillRating.proficiency)))).label(skill)
+        for skill in SKILLS
+    ]
+    return (db.select(SkillRating.team_member_id, *columns)
+            .group_by(SkillRating.team_member_id)
+            .subquery())
+
+
+def skill_code(pivot, skill):
+    """A member's code for ``skill``, treating a missing rating as "Haven't Started"."""
+    return db.func.coalesce(pivot.c[skill], 0)
+
+
+def parse_skill_filters(args):
+    """Read ``skill_<name>`` filters from request args as {skill: (op, code)}.
+
+    A value is either a proficiency level (exact match) or AT_LEAST followed
+    by a level. Unknown levels are ignored.
+    """
+    filters = {}
+    for skill in SKILLS:
+        value = args.get('skill_' + skill) or ''
+        op = '='
+        if value.startswith(AT_LEAST):
+            op, value = AT_LEAST, value[len(AT_LEAST):]
+        if value in LEVEL_CODES:
+            filters[skill] = (op, LEVEL_CODES[value])
+    return filters
+
+
+class SkillMatrix:
+    """Members x SKILLS proficiency codes, one bytearray per skill in member-name order."""
+
+    def __init__(self, version, members, codes):
+        self.version = version
+        self.members = members
+        self.codes = codes
+        self.rows = {member.id: row for row, member in enumerate(members)}
+        self._group_masks = {}
+
+    @classmethod
+    def load(cls, version):
+        pivot = skill_pivot()
+        query = (db.select(TeamMember.id, TeamMember.name, TeamMember.region, TeamMember.category,
+                           *[skill_code(pivot, skill) for skill in SKILLS])
+                 .outerjoin(pivot, pivot.c.team_member_id == TeamMember.id)
+                 .order_by(TeamMember.name, TeamMember.id))
+        members = []
+        codes = {skill: bytearray() for skill in SKILLS}
+        for row in db.session.execute(query):
+            members.append(MatrixMember(*row[:4]))
+            for skill, code in zip(SKILLS, row[4:]):
+                codes[skill].append(code)
+        return cls(version, members, codes)
+
+    def level(self, member_id, skill):
+        row = self.rows.get(member_id)
+        if row is None:
+            return PROFICIENCY_LEVELS[0]
+        return PROFICIENCY_LEVELS[self.codes[skill][row]]
+
+    def ratings_for(self, member_id):
+        """{skill: level} for one member, including "Haven't Started" defaults."""
+        return {skill: self.level(member_id, skill) for skill in SKILLS}
+
+    def patch(self, member_id, skill, proficiency):
+        self.codes[skill][self.rows[member_id]] = LEVEL_CODES[proficiency]
+
+    # Masks are ints holding one 0x01/0x00 byte per member, in row order
+    def _mask(self, flags):
+        return int.from_bytes(flags, 'big')
+
+    def skill_mask(self, skill, op, code):
+        tables = _AT_LEAST_TABLES if op == AT_LEAST else _EQUALS_TABLES
+        return self._mask(self.codes[skill].translate(tables[code]))
+
+    def group_mask(self, field, value):
+        """Mask of members whose ``field`` (region or category) equals ``value``."""
+        key = (field, value)
+        if key not in self._group_masks:
+            self._group_masks[key] = self._mask(bytes(getattr(m, field) == value for m in self.members))
+        return self._group_masks[key]
+
+    def se_mask(self):
+        # Members with no category predate categories and count as SEs
+        return self.group_mask('category', SE_CATEGORY) | self.group_mask('category', None)
+
+    def select(self, mask):
+        """Members whose byte is set in ``mask``, in name order."""
+        flags = mask.to_bytes(len(self.members), 'big')
+        return [member for member, flag in zip(self.members, flags) if flag]
+
+    def filter(self, filters, region=None):
+        """SEs matching parsed skill ``filters`` (see parse_skill_filters) and ``region``."""
+        mask = self.se_mask()
+        if region:
+            mask &= self.group_mask('region', region)
+        for skill, (op, code) in filters.items():
+            mask &= self.skill_mask(skill, op, code)
+        return self.select(mask)
+
+    def coverage(self, level, regions):
+        """Count SEs at ``level`` or above, as {skill: {region: count, 'Total': count}}."""
+        code = LEVEL_CODES[level]
+        se = self.se_mask()
+        region_masks = {region: self.group_mask('region', region) & se for region in regions}
+        result = {}
+        for skill in SKILLS:
+            mask = self.skill_mask(skill, AT_LEAST, code) & se
+            counts = {region: (mask & region_mask).bit_count() for region, region_mask in region_masks.items()}
+            counts['Total'] = mask.bit_count()
+            result[skill] = counts
+        return result
+
+    def at_least(self, skill, level):
+        """SEs rated ``level`` or above in ``skill``."""
+        return self.select(self.se_mask() & self.skill_mask(skill, AT_LEAST, LEVEL_CODES[level]))
+
+
+_lock = threading.Lock()
+_state = {'matrix': None}
+
+
+def _stored_version():
+    version = db.session.execute(
+        db.select(CacheVersion.version).where(CacheVersion.name == CACHE_NAME)).scalar()
+    return version or 0
+
+
+def get_skill_matrix():
+    """Return the cached skill matrix, reloading it if another write made it stale."""
+    version = _stored_version()
+    matrix = _state['matrix']
+    if matrix is not None and matrix.version == version:
+        return matrix
+    matrix = SkillMatrix.load(version)
+    with _lock:
+        _state['matrix'] = matrix
+    return matrix
+
+
+def bump_skill_matrix_version():
+    """Mark every process's skill matrix stale; call inside the writing transaction."""
+    stmt = sqlite_insert(CacheVersion.__table__).values(name=CACHE_NAME, version=1)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['name'], set_={'version': CacheVersion.__table__.c.version + 1}))
+
+
+def apply_skill_changes(changes):
+    """Patch this process's matrix after committing ``changes`` [(member_id, skill, proficiency)].
+
+    The commit bumped the stored version once. If that bump is the only one
+    since this copy was loaded, the copy is patched and adopts the new
+    version; otherwise it is dropped and reloaded on the next read.
+    """
+    version = _stored_version()
+    with _lock:
+        matrix = _state['matrix']
+        if matrix is None:
+            return
+        if matrix.version + 1 != version or any(member_id not in matrix.rows for member_id, _, _ in changes):
+            _state['matrix'] = None
+            return
+        for member_id, skill, proficiency in changes:
+            matrix.patch(member_id, skill, proficiency)
+        matrix.version = version
+
+
+def apply_skill_ratings(changes):
+    """Upsert many (team_member_id, skill, proficiency) cells in the current transaction.
+
+    Cells already at the requested level are skipped, and a missing rating
+    counts as "Haven't Started". Returns the cells that actually changed;
+    the caller commits and then passes them to apply_skill_changes().
+    """
+    # The last value given for a cell wins
+    requested = {(member_id, skill): proficiency for member_id, skill, proficiency in changes}
+    if not requested:
+        return []
+    current = dict(((member_id, skill), proficiency) for member_id, skill, proficiency in db.session.execute(
+        db.select(SkillRating.team_member_id, SkillRating.skill, SkillRating.proficiency)
+        .where(db.tuple_(SkillRating.team_member_id, SkillRating.skill).in_(list(requested)))))
+    changed = [(member_id, skill, proficiency) for (member_id, skill), proficiency in requested.items()
+               if current.get((member_id, skill), PROFICIENCY_LEVELS[0]) != proficiency]
+    if not changed:
+        return []
+
+    now = datetime.utcnow()
+    table = SkillRating.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['team_member_id', 'skill'],
+        set_={'proficiency': stmt.excluded.proficiency, 'updated_at': stmt.excluded.updated_at})
+    db.session.execute(stmt, [{'team_member_id': member_id, 'skill': skill, 'proficiency': proficiency,
+                               'created_at': now, 'updated_at': now}
+                              for member_id, skill, proficiency in changed])
+    bump_skill_matrix_version()
+    return changed
@@ -0,0 +1,82 @@
+"""Normalized note tags.
+
+Note.tags stays the comma-separated display string, and the tags and
+note_tags tables mirror it so the notes page can list tags with counts and
+filter by an exact tag without reading every note. Links are rewritten from
+ORM mapper events whenever a note's tags change, and bulk writers that bypass
+the ORM call set_note_tags() directly. Tag.note_count is kept current by
+triggers on note_tags.
+"""
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Note, Tag, NoteTag
+
+
+def split_tags(raw):
+    """Split a comma-separated tag string into unique names, ignoring case."""
+    names = {}
+    for name in (raw or '').split(','):
+        name = name.strip()
+        if name and name.lower() not in names:
+            names[name.lower()] = name
+    return list(names.values())
+
+
+def _tag_ids(conn, names):
+    """Return a lower-cased name -> id map, creating any tags that don't exist yet."""
+    conn.execute(sqlite_insert(Tag.__table__).on_conflict_do_nothing(),
+                 [{'name': name, 'note_count': 0} for name in names])
+    rows = conn.execute(db.select(Tag.id, Tag.name).where(Tag.name.in_(names)))
+    return {name.lower(): tag_id for tag_id, name in rows}
+
+
+def set_note_tags(conn, note_tags):
+    """Replace the tag links for each note id in a {note_id: tag string} map."""
+    if not note_tags:
+        return
+    links = NoteTag.__table__
+    conn.execute(links.delete().where(links.c.note_id.in_(list(note_tags))))
+    names = {note_id: split_tags(raw) for note_id, raw in note_tags.items()}
+    all_names = list({name.lower(): name for tags in names.values() for name in tags}.values())
+    if not all_names:
+        return
+    ids = _tag_ids(conn, all_names)
+    conn.execute(links.insert(), [{'note_id': note_id, 'tag_id': ids[name.lower()]}
+                                  for note_id, tags in names.items() for name in tags])
+
+
+def rebuild_tag_index(conn):
+    """Repopulate note_tags from the notes table and recount every tag."""
+    conn.execute(NoteTag.__table__.delete())
+    conn.execute(Tag.__table__.update().values(note_count=0))
+    rows = conn.execute(db.select(Note.id, Note.tags).where(Note.tags.is_not(None), Note.tags != ''))
+    set_note_tags(conn, dict(rows.all()))
+
+
+@db.event.listens_for(Note, 'after_insert')
+def _tag_new_note(mapper, connection, note):
+    set_note_tags(connection, {note.id: note.tags})
+
+
+@db.event.listens_for(Note, 'after_update')
+def _retag_note(mapper, connection, note):
+    if db.inspect(note).attrs.tags.history.has_changes():
+        set_note_tags(connection, {note.id: note.tags})
+
+
+@db.event.listens_for(Note, 'before_delete')
+def _untag_note(mapper, connection, note):
+    connection.execute(NoteTag.__table__.delete().where(NoteTag.note_id == note.id))
+
+
+def tag_counts():
+    """Tags in use, alphabetically, with their cached note counts."""
+    return Tag.query.filter(Tag.note_count > 0).order_by(Tag.name).all()
+
+
+def tagged_note_ids(name):
+    """Subquery of ids for notes carrying the tag ``name`` (case-insensitive)."""
+    return (db.select(NoteTag.note_id)
+            .join(Tag, Tag.id == NoteTag.tag_id)
+            .where(Tag.name == name))
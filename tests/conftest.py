@@ -0,0 +1,67 @@
+"""Fixtures running the app against a scratch SQLite database.
+
+DATABASE_URL has to be set before app.py is imported, so the database lives
+in a temporary directory made when this module loads. Every test starts
+from an empty, fully migrated schema with the process-local caches cleared.
+"""
+
+import os
+import shutil
+import tempfile
+from datetime import date
+
+import pytest
+
+_workdir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_workdir, 'test.db')
+
+from app import app as flask_app  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+from models import db, TeamMember, Opportunity  # noqa: E402
+import kpis  # noqa: E402
+import profiles  # noqa: E402
+import skills  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+@pytest.fixture
+def app(tmp_path):
+    flask_app.config['TESTING'] = True
+    flask_app.instance_path = str(tmp_path)
+    with flask_app.app_context():
+        db.drop_all()
+        run_migrations()
+        skills._state['matrix'] = None
+        kpis._state['snapshot'] = None
+        profiles.invalidate_member_profiles()
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_member(app):
+    def make(name, region='East', **fields):
+        member = TeamMember(name=name, email=f'{name.lower()}@example.com', region=region, **fields)
+        db.session.add(member)
+        db.session.commit()
+        return member
+    return make
+
+
+@pytest.fixture
+def make_opportunity(app):
+    def make(member, name, account='Acme', **fields):
+        fields.setdefault('close_date', date(2024, 6, 30))
+        opp = Opportunity(name=name, account=account, team_member_id=member.id, **fields)
+        db.session.add(opp)
+        db.session.commit()
+        return opp
+    return make
@@ -0,0 +1,84 @@
+import csv
+import io
+
+import pytest
+
+from importer import import_opportunities_csv
+from models import db, Opportunity, OpportunityProduct, OpportunityUpdate
+
+HEADER = ['name', 'account', 'se_name', 'stage', 'value', 'salesforce_link', 'products']
+
+
+def upload(rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(HEADER)
+    writer.writerows(rows)
+    return io.BytesIO(out.getvalue().encode())
+
+
+def upsert(rows, batch_size=100):
+    result = import_opportunities_csv(upload(rows), batch_size=batch_size, upsert=True)
+    db.session.commit()
+    return result
+
+
+def counts(result):
+    return (result.rows_processed, result.success_count, result.updated_count, result.unchanged_count,
+            result.duplicate_count, result.error_count)
+
+
+@pytest.fixture
+def alice(make_member):
+    return make_member('Alice')
+
+
+def test_new_rows_are_inserted(alice):
+    result = upsert([['Deal 1', 'Acme', 'Alice', '2', '100', 'https://sf/1', 'PRA'],
+                     ['Deal 2', 'Acme', 'Alice', '3', '200', '', 'EPM']])
+    assert counts(result) == (2, 2, 0, 0, 0, 0)
+    assert Opportunity.query.count() == 2
+
+
+def test_matching_rows_are_updated_or_left_unchanged(alice):
+    upsert([['Deal 1', 'Acme', 'Alice', '2', '100', 'https://sf/1', 'PRA'],
+            ['Deal 2', 'Acme', 'Alice', '3', '200', '', 'EPM']])
+
+    # Deal 1 matches by link despite the new name, Deal 2 by account and name
+    result = upsert([['Deal One', 'Acme', 'Alice', '4', '100', 'https://sf/1', 'PRA'],
+                     ['Deal 2', 'Acme', 'Alice', '3', '200', '', 'EPM']])
+    assert counts(result) == (2, 0, 1, 1, 0, 0)
+    opp = Opportunity.query.filter_by(salesforce_link='https://sf/1').one()
+    assert (opp.name, opp.stage) == ('Deal One', '4')
+    assert OpportunityUpdate.query.filter_by(opportunity_id=opp.id, stage_to='4').count() == 1
+
+
+def test_repeated_rows_in_a_batch_count_as_duplicates(alice):
+    upsert([['Deal 1', 'Acme', 'Alice', '2', '100', 'https://sf/1', 'PRA']])
+
+    result = upsert([['Deal 1', 'Acme', 'Alice', '3', '100', 'https://sf/1', 'PRA'],
+                     ['Deal 9', 'Acme', 'Alice', '1', '50', '', ''],
+                     ['Deal 1', 'Acme', 'Alice', '5', '100', 'https://sf/1', 'PRA,EPM'],
+                     ['Deal 9', 'Acme', 'Alice', '2', '75', '', '']])
+    # The last row for each opportunity wins; the ones before it are only counted
+    assert counts(result) == (4, 1, 1, 0, 2, 0)
+    assert Opportunity.query.count() == 2
+    opp = Opportunity.query.filter_by(salesforce_link='https://sf/1').one()
+    assert opp.stage == '5'
+    assert {link.product for link in OpportunityProduct.query.filter_by(opportunity_id=opp.id)} == {'PRA', 'EPM'}
+    assert Opportunity.query.filter_by(name='Deal 9').one().value == 75
+
+
+def test_repeats_in_different_batches_are_updates(alice):
+    result = upsert([['Deal 1', 'Acme', 'Alice', '2', '100', '', ''],
+                     ['Deal 1', 'Acme', 'Alice', '3', '100', '', '']], batch_size=1)
+    assert counts(result) == (2, 1, 1, 0, 0, 0)
+    assert Opportunity.query.one().stage == '3'
+
+
+def test_invalid_rows_are_reported_and_skipped(alice):
+    result = upsert([['Deal 1', 'Acme', 'Nobody', '2', '100', '', ''],
+                     ['', 'Acme', 'Alice', '2', '100', '', ''],
+                     ['Deal 3', 'Acme', 'Alice', '2', '100', '', '']])
+    assert counts(result) == (3, 1, 0, 0, 0, 2)
+    assert result.errors == ["Row 2: SE name 'Nobody' not found", 'Row 3: missing required field(s): name']
@@ -0,0 +1,113 @@
+import io
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from werkzeug.datastructures import FileStorage
+
+from importer import import_opportunities_csv
+from jobs import (IMPORT_JOB_HEARTBEAT_TIMEOUT, IMPORT_JOB_TTL, error_file_path, job_status, prune_import_jobs,
+                  submit_import, upload_path)
+from models import db, ImportJob, Opportunity, PROCESS_TOKEN
+
+
+def add_job(app, status='Running', heartbeat_age=timedelta(0), age=timedelta(0)):
+    now = datetime.utcnow()
+    job = ImportJob(id=uuid.uuid4().hex, kind='opportunities', filename='up.csv', status=status, owner='other',
+                    created_at=now - age, started_at=now - age, heartbeat_at=now - heartbeat_age)
+    db.session.add(job)
+    db.session.commit()
+    with open(upload_path(app, job.id), 'w') as f:
+        f.write('name\n')
+    return job
+
+
+def wait(client, job_id):
+    deadline = time.monotonic() + 30
+    while not (status := client.get(f'/imports/{job_id}/status').get_json())['finished']:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    return status
+
+
+def test_jobs_abandoned_by_their_process_fail(app, client):
+    alive = add_job(app, heartbeat_age=IMPORT_JOB_HEARTBEAT_TIMEOUT / 2)
+    lost = add_job(app, heartbeat_age=IMPORT_JOB_HEARTBEAT_TIMEOUT * 2)
+    queued = add_job(app, status='Queued', heartbeat_age=IMPORT_JOB_HEARTBEAT_TIMEOUT * 2)
+
+    # A poll is enough to end the job, so its page stops polling
+    status = client.get(f'/imports/{lost.id}/status').get_json()
+    assert status['finished'] and status['status'] == 'Failed'
+    assert 'interrupted' in status['message']
+    db.session.expire_all()
+    assert (alive.status, queued.status) == ('Running', 'Failed')
+    assert os.path.exists(upload_path(app, alive.id))
+    assert not os.path.exists(upload_path(app, lost.id)) and not os.path.exists(upload_path(app, queued.id))
+
+
+def test_old_finished_jobs_are_deleted_with_their_files(app):
+    old = add_job(app, status='Failed', age=IMPORT_JOB_TTL * 2)
+    with open(error_file_path(app, old.id), 'w') as f:
+        f.write('row,error\n')
+    old_id = old.id
+    prune_import_jobs(app)
+    assert db.session.get(ImportJob, old_id) is None
+    assert not os.path.exists(upload_path(app, old_id)) and not os.path.exists(error_file_path(app, old_id))
+
+
+def test_import_job_runs_with_a_heartbeat(app, client, make_member):
+    make_member('Alice')
+    upload = FileStorage(io.BytesIO(b'name,account,se_name\nDeal,Acme,Alice\nBad,Acme,Nobody\n'), filename='up.csv')
+    job = submit_import(app, 'opportunities', upload, import_opportunities_csv)
+    assert (job.owner, job.status) == (PROCESS_TOKEN, 'Queued') and job.heartbeat_at is not None
+
+    status = wait(client, job.id)
+    assert (status['status'], status['success_count'], status['error_count']) == ('Completed', 1, 1)
+    assert Opportunity.query.count() == 1
+    assert not os.path.exists(upload_path(app, job.id))
+    with open(error_file_path(app, job.id)) as f:
+        assert f.read().splitlines() == ['row,error', "3,SE name 'Nobody' not found"]
+    assert job_status(db.session.get(ImportJob, job.id))['finished']
+
+
+def test_heartbeat_refreshes_this_process_jobs_until_they_finish(app, monkeypatch):
+    import jobs
+
+    monkeypatch.setattr(jobs, 'IMPORT_JOB_HEARTBEAT', 0.05)
+    # Start a fresh thread rather than one left sleeping by an earlier test
+    monkeypatch.setattr(jobs, '_heartbeat', None)
+    mine = add_job(app, heartbeat_age=timedelta(hours=1))
+    mine.owner = PROCESS_TOKEN
+    other = add_job(app, heartbeat_age=timedelta(hours=1))
+    db.session.commit()
+    jobs._start_heartbeat(app)
+    thread = jobs._heartbeat
+
+    deadline = time.monotonic() + 5
+    while db.session.get(ImportJob, mine.id).heartbeat_at < datetime.utcnow() - timedelta(minutes=1):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+        db.session.expire_all()
+    assert other.heartbeat_at < datetime.utcnow() - timedelta(minutes=1)
+
+    mine.status = 'Completed'
+    db.session.commit()
+    thread.join(5)
+    assert not thread.is_alive() and jobs._heartbeat is None
+
+
+def test_atomic_job_counts_are_in_progress_outside_its_process(app, client):
+    job = add_job(app)
+    job.atomic, job.rows_processed = True, 0
+    db.session.commit()
+
+    # Another process is running it, so its counts aren't known here yet
+    status = client.get(f'/imports/{job.id}/status').get_json()
+    assert status['rows_processed'] is None and status['rows_per_second'] is None
+    assert 'in progress' in client.get(f'/imports/{job.id}').get_data(as_text=True)
+
+    job.status, job.rows_processed, job.success_count = 'Completed', 3, 3
+    db.session.commit()
+    status = client.get(f'/imports/{job.id}/status').get_json()
+    assert (status['rows_processed'], status['success_count'], status['error_count']) == (3, 3, 0)
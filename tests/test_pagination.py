@@ -0,0 +1,113 @@
+from datetime import date, datetime
+
+from werkzeug.datastructures import MultiDict
+
+from models import db, Opportunity
+from pagination import SortOption, encode_cursor, decode_cursor, paginate
+
+SORTS = {
+    'name': SortOption(db.func.lower(Opportunity.name)),
+    'value': SortOption(Opportunity.value, 'desc'),
+    'close_date': SortOption(Opportunity.close_date),
+    'updated': SortOption(Opportunity.updated_at, 'desc'),
+}
+
+
+def page(args):
+    return paginate(Opportunity.query, Opportunity.id, SORTS, 'updated', MultiDict(args))
+
+
+def walk(args):
+    """Ids of every row, following next cursors from the first page."""
+    ids, cursor = [], None
+    while True:
+        result = page({**args, **({'after': cursor} if cursor else {})})
+        ids.extend(opp.id for opp in result.items)
+        if not result.has_next:
+            return ids
+        cursor = result.next_cursor
+
+
+def test_cursor_round_trips_typed_values(app):
+    cases = [
+        (Opportunity.close_date, date(2024, 2, 29)),
+        (Opportunity.updated_at, datetime(2024, 2, 29, 13, 45, 7, 123456)),
+        (Opportunity.value, 12.5),
+        (Opportunity.name, 'Acme, "renewal"'),
+        (db.func.lower(Opportunity.name), 'acme'),
+        (Opportunity.close_date, None),
+    ]
+    for expression, value in cases:
+        assert decode_cursor(encode_cursor(value, 42), expression) == (value, 42)
+
+
+def test_malformed_cursor_is_ignored(app):
+    for cursor in ('', 'not base64!', encode_cursor('x', 1)[:-2], 'WzFd'):
+        assert decode_cursor(cursor, Opportunity.name) is None
+    assert decode_cursor(encode_cursor('not a date', 1), Opportunity.close_date) is None
+    # A bad cursor falls back to the first page instead of failing
+    assert page({'after': 'garbage'}).items == page({}).items
+
+
+def test_pages_cover_every_row_once_with_ties(make_member, make_opportunity):
+    member = make_member('Alice')
+    # Several rows share each value so the id tiebreaker decides their order
+    for i in range(23):
+        make_opportunity(member, f'Deal {i % 4}', value=float(i % 3))
+
+    for sort in SORTS:
+        for direction in ('asc', 'desc'):
+            ids = walk({'sort': sort, 'dir': direction, 'per_page': '5'})
+            assert sorted(ids) == sorted(opp.id for opp in Opportunity.query)
+            assert len(ids) == len(set(ids))
+
+    expected = [opp.id for opp in Opportunity.query.order_by(Opportunity.value.desc(), Opportunity.id.desc())]
+    assert walk({'sort': 'value', 'per_page': '5'}) == expected
+
+
+def test_previous_cursor_returns_the_earlier_page(make_member, make_opportunity):
+    member = make_member('Alice')
+    for i in range(12):
+        make_opportunity(member, f'Deal {i:02}')
+
+    first = page({'sort': 'name', 'per_page': '5'})
+    assert not first.has_prev
+    second = page({'sort': 'name', 'per_page': '5', 'after': first.next_cursor})
+    assert second.has_prev and second.has_next
+    back = page({'sort': 'name', 'per_page': '5', 'before': second.prev_cursor})
+    assert [opp.id for opp in back.items] == [opp.id for opp in first.items]
+    last = page({'sort': 'name', 'per_page': '5', 'after': second.next_cursor})
+    assert [opp.name for opp in last.items] == ['Deal 10', 'Deal 11']
+    assert not last.has_next
+
+
+def test_sort_and_page_size_are_clamped(make_member, make_opportunity):
+    member = make_member('Alice')
+    make_opportunity(member, 'Deal')
+    result = page({'sort': 'bogus', 'dir': 'sideways', 'per_page': '100000', 'stage': '3'})
+    assert (result.sort, result.direction) == ('updated', 'desc')
+    assert result.args == {'per_page': '100000', 'stage': '3'}
+
+
+def test_opportunity_list_sorts_page_in_order(client, make_member, make_opportunity):
+    from app import OPPORTUNITY_SORTS
+
+    members = [make_member(name) for name in ('bob', 'Alice', 'carol')]
+    for i in range(9):
+        make_opportunity(members[i % 3], f'Deal {i}', sales_rep=['Zed', None, 'amy'][i % 3],
+                         products=['PRA', None, 'EPM,PRA'][i % 2], pov_status=['Active', None][i % 2])
+
+    for sort in OPPORTUNITY_SORTS:
+        ids, cursor = [], None
+        while True:
+            args = MultiDict({'sort': sort, 'per_page': '2', **({'after': cursor} if cursor else {})})
+            result = paginate(Opportunity.query, Opportunity.id, OPPORTUNITY_SORTS, 'updated', args)
+            ids.extend(opp.id for opp in result.items)
+            if not result.has_next:
+                break
+            cursor = result.next_cursor
+        option = OPPORTUNITY_SORTS[sort]
+        descending = option.default_dir == 'desc'
+        order = (option.expression.desc(), Opportunity.id.desc()) if descending else (option.expression, Opportunity.id)
+        assert ids == [opp.id for opp in Opportunity.query.order_by(*order)], sort
+        assert client.get(f'/opportunities?sort={sort}').status_code == 200
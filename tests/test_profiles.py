@@ -0,0 +1,31 @@
+from models import db, Note
+from profiles import _bump_versions, load_member_profile
+
+
+def test_profile_is_cached_until_a_write_to_the_member(app, make_member):
+    alice, bob = make_member('Alice'), make_member('Bob')
+    profile = load_member_profile(alice.id)
+    assert load_member_profile(alice.id) is profile
+
+    db.session.add(Note(title='For Bob', team_member_id=bob.id))
+    db.session.commit()
+    assert load_member_profile(alice.id) is profile
+    db.session.add(Note(title='For Alice', team_member_id=alice.id))
+    db.session.commit()
+    assert [note.title for note in load_member_profile(alice.id).notes] == ['For Alice']
+
+
+def test_writes_by_another_process_reload_the_profile(app, make_member):
+    alice = make_member('Alice')
+    profile = load_member_profile(alice.id)
+
+    # Another process's write: the row and the version bump, with none of this process's session events
+    with db.engine.begin() as conn:
+        conn.execute(db.insert(Note.__table__).values(title='Elsewhere', team_member_id=alice.id))
+        _bump_versions(conn, [f'profile:{alice.id}'])
+    reloaded = load_member_profile(alice.id)
+    assert reloaded is not profile and [note.title for note in reloaded.notes] == ['Elsewhere']
+
+    with db.engine.begin() as conn:
+        _bump_versions(conn, ['profiles'])
+    assert load_member_profile(alice.id) is not reloaded
@@ -0,0 +1,33 @@
+import json
+import logging
+import re
+
+import pytest
+
+from querystats import RepeatedQueryError
+from test_report_data import records, selection  # noqa: F401
+
+
+def csv_form(records):
+    alice, rows = records
+    return {**selection(alice, rows), 'start_date': '2024-03-01', 'end_date': '2024-03-31', 'format': 'csv'}
+
+
+def test_streamed_statements_are_logged(client, records, caplog):
+    caplog.set_level(logging.INFO, logger='querystats')
+    with client.post('/reports/generate', data=csv_form(records)) as response:
+        header_queries = int(re.search(r'desc="(\d+) queries"', response.headers['Server-Timing']).group(1))
+        assert 'Old, closing' in response.get_data(as_text=True)
+    [line] = [json.loads(r.getMessage()) for r in caplog.records if r.name == 'querystats']
+    assert line['endpoint'] == 'generate_report' and line['status'] == 200
+    # The sections are queried while the body streams, after the header went out
+    assert line['queries'] > header_queries
+
+
+def test_repeat_limit_applies_while_streaming(app, client, records, monkeypatch):
+    monkeypatch.setitem(app.config, 'SQL_REPEAT_LIMIT', 1)
+    monkeypatch.setitem(app.config, 'SQL_REPEAT_ACTION', 'raise')
+    # The team_members section and the skill matrix each load the member, both while streaming
+    with pytest.raises(RepeatedQueryError):
+        with client.post('/reports/generate', data=csv_form(records)) as response:
+            response.get_data()
@@ -0,0 +1,126 @@
+from datetime import date, datetime
+
+import pytest
+
+from models import db, OneOnOne, Opportunity, SupportCase, FollowUp, Note, ReportDefinition
+from report_data import REPORT_SECTIONS, date_criteria, load_report_data, load_definition_data
+
+START, END = date(2024, 3, 1), date(2024, 3, 31)
+
+
+@pytest.fixture
+def records(make_member, make_opportunity):
+    """Two records per section: the first in March 2024, the second outside it."""
+    alice = make_member('Alice')
+    rows = {
+        'one_on_ones': [OneOnOne(team_member_id=alice.id, date=date(2024, 3, 1)),
+                        OneOnOne(team_member_id=alice.id, date=date(2024, 2, 29))],
+        # Last moment of the end date is in range; midnight after it is not
+        'opportunities': [
+            Opportunity(name='Old, closing', account='Acme', team_member_id=alice.id, pov_status='Active',
+                        updated_at=datetime(2023, 1, 1), close_date=date(2024, 3, 31)),
+            Opportunity(name='Later', account='Acme', team_member_id=alice.id, pov_status='Active',
+                        updated_at=datetime(2024, 4, 1), close_date=None)],
+        'support_cases': [
+            SupportCase(title='Resolved in range', team_member_id=alice.id, created_at=datetime(2024, 1, 5),
+                        resolved_at=datetime(2024, 3, 31, 23, 59, 59)),
+            SupportCase(title='Still open', team_member_id=alice.id, created_at=datetime(2024, 2, 1))],
+        'follow_ups': [FollowUp(title='Due', team_member_id=alice.id, due_date=date(2024, 3, 31)),
+                       FollowUp(title='Late', team_member_id=alice.id, due_date=date(2024, 4, 1))],
+        'notes': [Note(title='In', team_member_id=alice.id, created_at=datetime(2024, 3, 1, 0, 0)),
+                  Note(title='Out', team_member_id=alice.id, created_at=datetime(2024, 2, 29, 23, 59))],
+    }
+    for section in rows.values():
+        db.session.add_all(section)
+    db.session.commit()
+    rows['live_povs'] = rows['opportunities']
+    return alice, rows
+
+
+def ids(rows):
+    return [row.id for row in rows]
+
+
+def selection(alice, rows):
+    selected = {section: [str(row.id) for row in rows.get(section, [])] for section in REPORT_SECTIONS}
+    selected['team_members'] = selected['skill_matrix'] = [str(alice.id)]
+    return selected
+
+
+def test_criteria_keep_rows_with_any_date_in_range(records):
+    alice, rows = records
+    for section, (inside, outside) in rows.items():
+        model = type(inside)
+        found = ids(model.query.filter(model.id.in_([inside.id, outside.id]), *date_criteria(section, START, END)))
+        assert found == [inside.id], section
+
+
+def test_open_ended_ranges(records):
+    alice, rows = records
+    assert date_criteria('notes', None, None) == []
+    assert date_criteria('team_members', START, END) == []
+    notes = Note.query.filter(*date_criteria('notes', None, date(2024, 2, 29)))
+    assert [note.title for note in notes] == ['Out']
+    notes = Note.query.filter(*date_criteria('notes', date(2024, 3, 1), None))
+    assert [note.title for note in notes] == ['In']
+
+
+def test_selected_report_is_limited_to_the_range(records):
+    alice, rows = records
+    data = load_report_data(selection(alice, rows), START, END)
+    for section in rows:
+        assert ids(data[section]) == [rows[section][0].id], section
+    assert ids(data['team_members']) == [alice.id]
+    assert [entry['member'].id for entry in data['skill_matrix']] == [alice.id]
+
+    everything = load_report_data(selection(alice, rows))
+    for section in rows:
+        assert sorted(ids(everything[section])) == sorted(ids(rows[section])), section
+
+
+def test_streamed_sections_match_the_lists(records):
+    alice, rows = records
+    selected = selection(alice, rows)
+    listed = load_report_data(selected, START, END)
+    streamed = load_report_data(selected, START, END, stream=True)
+    for section in REPORT_SECTIONS:
+        assert not isinstance(streamed[section], list)
+        assert list(streamed[section]) == listed[section], section
+
+
+def test_saved_report_with_fixed_dates(records):
+    alice, rows = records
+    definition = ReportDefinition(name='March', sections=','.join(REPORT_SECTIONS), start_date=START, end_date=END)
+    data = load_definition_data(definition, date(2025, 1, 1))
+    for section in rows:
+        assert ids(data[section]) == [rows[section][0].id], section
+    assert ids(data['team_members']) == [alice.id]
+
+
+def test_saved_report_with_a_rolling_period(records):
+    alice, rows = records
+    definition = ReportDefinition(name='Last week', sections='follow_ups,notes', period_days=7)
+    assert definition.date_range(date(2024, 4, 6)) == (date(2024, 3, 31), date(2024, 4, 6))
+    data = load_definition_data(definition, date(2024, 4, 6))
+    assert [item.title for item in data['follow_ups']] == ['Late', 'Due']
+    assert data['notes'] == [] and data['opportunities'] == []
+
+
+def test_csv_report_covers_the_range(client, records):
+    alice, rows = records
+    form = {**selection(alice, rows), 'start_date': '2024-03-01', 'end_date': '2024-03-31', 'format': 'csv'}
+    body = client.post('/reports/generate', data=form).get_data(as_text=True)
+    assert 'Date Range: 2024-03-01 to 2024-03-31' in body
+    assert 'Old, closing' in body and 'Later' not in body
+    assert 'Resolved in range' in body and 'Still open' not in body
+
+
+@pytest.mark.parametrize('field, value', [('start_date', 'garbage'), ('end_date', '2024-02-30'),
+                                          ('start_date', '9' * 30)])
+def test_unreadable_dates_are_rejected(client, records, field, value):
+    for url in ('/reports/preview', '/reports/generate'):
+        response = client.post(url, data={field: value, 'format': 'csv'})
+        assert response.status_code == 302 and response.headers['Location'] == '/reports'
+    response = client.post('/reports/definitions', data={'name': 'Bad', 'sections': 'notes', field: value})
+    assert response.status_code == 302
+    assert ReportDefinition.query.count() == 0
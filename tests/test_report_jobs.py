@@ -0,0 +1,113 @@
+import os
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import pytest
+
+import report_jobs
+from models import db, ReportJob
+from report_jobs import (ReportQueueFull, PROCESS_TOKEN, REPORT_JOB_TIMEOUT, REPORT_JOB_TTL,
+                         REPORT_JOB_HEARTBEAT_TIMEOUT, expire_report_jobs, report_key, report_path,
+                         shutdown_report_workers, submit_report)
+
+
+def add_job(key='k', status='Queued', age=timedelta(0), heartbeat_age=timedelta(0), owner='other'):
+    now = datetime.utcnow()
+    job = ReportJob(id=uuid.uuid4().hex, key=key, status=status, owner=owner,
+                    created_at=now - age, heartbeat_at=now - heartbeat_age)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+class FakeExecutor:
+    """Accepts jobs and never runs them."""
+
+    def submit(self, *args):
+        return Future()
+
+
+def never_called():
+    raise AssertionError('a coalesced request must not load the report data')
+
+
+def test_report_key_ignores_dict_order():
+    assert report_key('selection', {'a': [1], 'b': [2]}) == report_key('selection', {'b': [2], 'a': [1]})
+    assert report_key('selection', {'a': [1]}) != report_key('selection', {'a': [2]})
+
+
+def test_identical_request_joins_the_unfinished_job(app):
+    job = add_job(key='same')
+    assert submit_report(app, 'same', never_called) is job
+    assert ReportJob.query.count() == 1
+
+
+def test_finished_jobs_are_not_joined(app, monkeypatch):
+    add_job(key='same', status='Completed')
+    submitted = []
+    monkeypatch.setattr(report_jobs, '_get_executor', lambda app: submitted.append(1) or FakeExecutor())
+    monkeypatch.setattr(report_jobs, '_start_heartbeat', lambda app: None)
+    monkeypatch.setattr(report_jobs, '_futures', {})
+    job = submit_report(app, 'same', lambda: {})
+    assert job.status == 'Queued' and job.owner == PROCESS_TOKEN
+    assert submitted == [1]
+
+
+def test_queue_limit(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'REPORT_QUEUE_LIMIT', 2)
+    add_job(key='a')
+    add_job(key='b')
+    with pytest.raises(ReportQueueFull):
+        submit_report(app, 'c', never_called)
+    # Joining a queued job is still allowed when the queue is full
+    assert submit_report(app, 'a', never_called).key == 'a'
+
+
+def test_jobs_without_a_heartbeat_or_past_the_timeout_fail(app):
+    alive = add_job(heartbeat_age=REPORT_JOB_HEARTBEAT_TIMEOUT / 2)
+    lost = add_job(heartbeat_age=REPORT_JOB_HEARTBEAT_TIMEOUT * 2)
+    slow = add_job(age=REPORT_JOB_TIMEOUT * 2)
+    expire_report_jobs(app)
+    assert alive.status == 'Queued'
+    assert (lost.status, lost.message) == ('Failed', 'Report was interrupted by a restart.')
+    assert (slow.status, slow.message) == ('Failed', 'Report did not finish in time.')
+    # A lost job no longer absorbs new requests for the same report
+    assert submit_report(app, 'k', never_called) is alive
+
+
+def test_old_finished_jobs_and_files_are_pruned(app, client):
+    old = add_job(status='Completed', age=REPORT_JOB_TTL * 2)
+    recent = add_job(status='Completed')
+    for job in (old, recent):
+        with open(report_path(app, job.id), 'wb') as f:
+            f.write(b'%PDF-')
+    old_id, old_path = old.id, report_path(app, old.id)
+
+    # Polling any job prunes, not just submitting a new one
+    assert client.get(f'/reports/jobs/{recent.id}/status').get_json()['status'] == 'Completed'
+    assert db.session.get(ReportJob, old_id) is None and not os.path.exists(old_path)
+    assert os.path.exists(report_path(app, recent.id))
+
+
+def test_pdf_renders_in_a_worker_and_downloads(client, make_member):
+    make_member('Alice')
+    form = {'team_members': ['1'], 'format': 'pdf'}
+    try:
+        first = client.post('/reports/generate', data=form)
+        second = client.post('/reports/generate', data=form)
+        assert first.status_code == second.status_code == 302
+        assert first.headers['Location'] == second.headers['Location']
+
+        status_url = first.headers['Location'] + '/status'
+        deadline = time.monotonic() + 60
+        while not (job := client.get(status_url).get_json())['finished']:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        assert job['status'] == 'Completed', job['message']
+        assert job['size'] > 0
+        download = client.get(job['download_url'])
+        assert download.mimetype == 'application/pdf' and download.data.startswith(b'%PDF-')
+    finally:
+        shutdown_report_workers()
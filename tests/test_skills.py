@@ -0,0 +1,121 @@
+import pytest
+
+from models import db, SkillRating, CacheVersion, SKILLS, PROFICIENCY_LEVELS
+from skills import (AT_LEAST, LEVEL_CODES, CACHE_NAME, get_skill_matrix, apply_skill_changes, apply_skill_ratings,
+                    bump_skill_matrix_version, parse_skill_filters)
+
+SKILL = SKILLS[0]
+
+
+@pytest.fixture
+def members(make_member):
+    return [make_member('Bob', 'West'), make_member('Alice', 'East'), make_member('Carol', 'East')]
+
+
+def rate(changes):
+    changed = apply_skill_ratings(changes)
+    db.session.commit()
+    apply_skill_changes(changed)
+    return changed
+
+
+def reload_levels(member):
+    """A member's levels read straight from skill_ratings."""
+    stored = {r.skill: r.proficiency for r in SkillRating.query.filter_by(team_member_id=member.id)}
+    return {skill: stored.get(skill, PROFICIENCY_LEVELS[0]) for skill in SKILLS}
+
+
+def test_matrix_rows_are_in_name_order_with_defaults(members):
+    matrix = get_skill_matrix()
+    assert [m.name for m in matrix.members] == ['Alice', 'Bob', 'Carol']
+    assert matrix.ratings_for(members[0].id) == {skill: PROFICIENCY_LEVELS[0] for skill in SKILLS}
+
+
+def test_write_patches_cached_matrix_in_place(members):
+    matrix = get_skill_matrix()
+    rate([(members[0].id, SKILL, 'Expert'), (members[1].id, SKILL, 'Training')])
+
+    assert get_skill_matrix() is matrix
+    assert matrix.version == db.session.get(CacheVersion, CACHE_NAME).version
+    for member in members:
+        assert matrix.ratings_for(member.id) == reload_levels(member)
+
+
+def test_unchanged_cells_are_skipped(members):
+    rate([(members[0].id, SKILL, 'Expert')])
+    version = db.session.get(CacheVersion, CACHE_NAME).version
+    assert apply_skill_ratings([(members[0].id, SKILL, 'Expert'), (members[1].id, SKILL, PROFICIENCY_LEVELS[0])]) == []
+    db.session.commit()
+    assert db.session.get(CacheVersion, CACHE_NAME).version == version
+
+
+def test_last_value_for_a_cell_wins(members):
+    changed = rate([(members[0].id, SKILL, 'Training'), (members[0].id, SKILL, 'POV Ready')])
+    assert changed == [(members[0].id, SKILL, 'POV Ready')]
+    assert get_skill_matrix().level(members[0].id, SKILL) == 'POV Ready'
+
+
+def test_another_writer_makes_the_copy_reload(members):
+    matrix = get_skill_matrix()
+    # A write by another process bumps the version without patching this copy
+    db.session.add(SkillRating(team_member_id=members[2].id, skill=SKILL, proficiency='Demo Ready'))
+    bump_skill_matrix_version()
+    db.session.commit()
+    rate([(members[0].id, SKILL, 'Expert')])
+
+    reloaded = get_skill_matrix()
+    assert reloaded is not matrix
+    assert reloaded.level(members[2].id, SKILL) == 'Demo Ready'
+    assert reloaded.level(members[0].id, SKILL) == 'Expert'
+
+
+def test_new_member_makes_the_copy_reload(members, make_member):
+    get_skill_matrix()
+    dave = make_member('Dave')
+    rate([(dave.id, SKILL, 'Expert')])
+    assert get_skill_matrix().level(dave.id, SKILL) == 'Expert'
+
+
+def test_filters_and_coverage_follow_patches(members):
+    get_skill_matrix()
+    rate([(members[0].id, SKILL, 'Expert'), (members[1].id, SKILL, 'Demo Ready'),
+          (members[2].id, SKILL, 'Training')])
+    matrix = get_skill_matrix()
+
+    filters = parse_skill_filters({'skill_' + SKILL: AT_LEAST + 'Demo Ready', 'skill_' + SKILLS[1]: 'bogus'})
+    assert filters == {SKILL: (AT_LEAST, LEVEL_CODES['Demo Ready'])}
+    assert [m.name for m in matrix.filter(filters)] == ['Alice', 'Bob']
+    assert [m.name for m in matrix.filter(filters, region='East')] == ['Alice']
+    assert matrix.coverage('Demo Ready', ['East', 'West'])[SKILL] == {'East': 1, 'West': 1, 'Total': 2}
+
+
+def test_update_route_rejects_unknown_values_before_writing(client, members):
+    matrix = get_skill_matrix()
+    for data in ({'team_member_id': members[0].id, 'skill': 'Juggling', 'proficiency': 'Expert'},
+                 {'team_member_id': members[0].id, 'skill': SKILL, 'proficiency': 'Wizard'},
+                 {'team_member_id': 999, 'skill': SKILL, 'proficiency': 'Expert'},
+                 {'skill': SKILL, 'proficiency': 'Expert'}):
+        response = client.post('/skill-matrix/update', data=data)
+        assert response.status_code == 302
+    assert SkillRating.query.count() == 0
+    assert get_skill_matrix() is matrix
+
+    client.post('/skill-matrix/update', data={'team_member_id': members[0].id, 'skill': SKILL, 'proficiency': 'Expert'})
+    assert get_skill_matrix().level(members[0].id, SKILL) == 'Expert'
+
+
+def test_batch_update_is_all_or_nothing(client, members):
+    response = client.post('/skill-matrix/batch-update', json={'changes': [
+        {'team_member_id': members[0].id, 'skill': SKILL, 'proficiency': 'Expert'},
+        {'team_member_id': members[1].id, 'skill': SKILL, 'proficiency': 'Wizard'},
+    ]})
+    assert response.status_code == 400
+    assert SkillRating.query.count() == 0
+
+    response = client.post('/skill-matrix/batch-update', json={'changes': [
+        {'team_member_id': members[0].id, 'skill': SKILL, 'proficiency': 'Expert'},
+        {'team_member_id': members[1].id, 'skill': SKILL, 'proficiency': PROFICIENCY_LEVELS[0]},
+    ]})
+    assert response.get_json() == {
+        'changed': [{'team_member_id': members[0].id, 'skill': SKILL, 'proficiency': 'Expert'}], 'unchanged': 1}
+    assert get_skill_matrix().level(members[0].id, SKILL) == 'Expert'